@@ -0,0 +1,146 @@
+"""Batched updates of Synapse entity access control lists.
+
+"""
+
+import copy
+import json
+import logging
+import threading
+
+from .rest import CONFLICT, PRECONDITION_FAILED, http_status
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+# HTTP statuses returned by Synapse when another client changed an ACL
+# first: a local ACL was already created, or the stored ACL's etag is stale.
+RACED_STATUSES = (CONFLICT, PRECONDITION_FAILED)
+
+
+def _id_of(entity):
+    """Get the Synapse ID of an entity object or ID string."""
+    return entity if isinstance(entity, str) else entity['id']
+
+
+def get_access(syn, entity):
+    """Get the access types each principal has on an entity.
+
+    Args:
+        syn: A logged in synapseclient.Synapse object.
+        entity: A Synapse entity or ID.
+    Returns:
+        A dictionary of principal ID to a set of access types, taken from
+        the ACL of the entity's benefactor.
+
+    """
+    benefactor = syn.restGET(f"/entity/{_id_of(entity)}/benefactor")
+    acl = syn.restGET(f"/entity/{benefactor['id']}/acl")
+    return {int(x['principalId']): set(x['accessType'])
+            for x in acl['resourceAccess']}
+
+
+class AclBatcher:
+    """Collect permission grants and apply them with one ACL update per entity.
+
+    Grants use the same semantics as synapseclient.Synapse.setPermissions:
+    with `overwrite=True` a principal's access types are replaced, otherwise
+    they are merged with the existing ones. Grants for the same entity are
+    applied in the order they were made.
+
+    Entities are updated in the order they were first granted on, because
+    an entity that gets its own ACL starts from a copy of its benefactor's
+    ACL. Grant on parent folders before their children.
+
+    If another client updates the same ACL first, for example a sprint
+    created at the same time granting on a shared rally folder, the ACL is
+    read again and the grants applied again.
+
+    """
+
+    def __init__(self, syn, max_attempts=5):
+        self._syn = syn
+        self.max_attempts = max_attempts
+        self._grants = {}
+        self._acls = {}
+        self._lock = threading.Lock()
+
+    def grant(self, entity, principal_id, access_type, overwrite=True):
+        """Queue a grant of access types to a principal on an entity.
+
+        Args:
+            entity: A Synapse entity or ID.
+            principal_id: A Synapse user or team ID.
+            access_type: A list of access types, e.g. ['READ', 'DOWNLOAD'].
+            overwrite: Replace the principal's existing access types instead
+                       of adding to them.
+
+        """
+        with self._lock:
+            self._grants.setdefault(_id_of(entity), []).append(
+                (int(principal_id), list(access_type), overwrite))
+
+    def flush(self):
+        """Apply all queued grants.
+
+        Returns:
+            A dictionary of entity ID to the stored ACL.
+        """
+        with self._lock:
+            grants, self._grants = self._grants, {}
+
+        return {entity_id: self._apply(entity_id, entity_grants)
+                for entity_id, entity_grants in grants.items()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def _apply(self, entity_id, grants):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return self._store(entity_id, grants, reuse=attempt == 1)
+            except Exception as exception: # pylint: disable=broad-except
+                if http_status(exception) not in RACED_STATUSES or attempt == self.max_attempts: # pylint: disable=line-too-long
+                    raise
+                LOGGER.info(f"ACL of {entity_id} changed while updating, applying again.") # pylint: disable=line-too-long
+
+        return None
+
+    def _store(self, entity_id, grants, reuse=True):
+        benefactor = self._syn.restGET(f"/entity/{entity_id}/benefactor")
+        benefactor_id = benefactor['id']
+
+        if reuse and benefactor_id in self._acls:
+            acl = copy.deepcopy(self._acls[benefactor_id])
+        else:
+            acl = self._syn.restGET(f"/entity/{benefactor_id}/acl")
+
+        resource_access = acl['resourceAccess']
+        for principal_id, access_type, overwrite in grants:
+            permissions = next((x for x in resource_access
+                                if int(x['principalId']) == principal_id),
+                               None)
+            if permissions is None:
+                permissions = {'principalId': principal_id, 'accessType': []}
+                resource_access.append(permissions)
+            if overwrite:
+                permissions['accessType'] = access_type
+            else:
+                permissions['accessType'] = list(
+                    set(permissions['accessType']) | set(access_type))
+
+        if benefactor_id == entity_id:
+            acl = self._syn.restPUT(f"/entity/{entity_id}/acl",
+                                    body=json.dumps(acl))
+        else:
+            LOGGER.debug(f"Creating a local ACL for {entity_id}.")
+            acl = self._syn.restPOST(f"/entity/{entity_id}/acl",
+                                     body=json.dumps(
+                                         {'id': entity_id,
+                                          'resourceAccess': resource_access}))
+
+        self._acls[entity_id] = acl
+        return acl
@@ -0,0 +1,124 @@
+"""Caches for slow-changing Synapse administration metadata.
+
+"""
+
+import logging
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+DEFAULT_ROOT_METADATA_TTL = 300
+
+
+class RootMetadataCache:
+    """Cache of the admin annotations stored on root projects.
+
+    Entries are keyed by root project ID. Within `ttl` seconds an entry is
+    served without any remote call. After that it is revalidated against the
+    etag of the root project and only fetched again if the project changed.
+
+    """
+
+    def __init__(self, ttl=DEFAULT_ROOT_METADATA_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, syn, root_project_id):
+        """Get the annotations of a root project.
+
+        Args:
+            syn: A logged in synapseclient.Synapse object.
+            root_project_id: Synapse Project ID with admin annotations.
+        Returns:
+            A dictionary of the root project annotations.
+
+        """
+        with self._lock:
+            entry = self._entries.get(root_project_id)
+
+        if entry is not None:
+            if time.monotonic() - entry['fetched'] < self.ttl:
+                self._record(hit=True)
+                return entry['annotations']
+
+            header = syn.restGET(f"/entity/{root_project_id}")
+            if header.get('etag') == entry['etag']:
+                LOGGER.debug(f"Root project {root_project_id} unchanged.")
+                with self._lock:
+                    entry['fetched'] = time.monotonic()
+                self._record(hit=True)
+                return entry['annotations']
+
+        root_project = syn.get(root_project_id)
+        entry = dict(etag=root_project.etag,
+                     annotations=dict(root_project.annotations),
+                     fetched=time.monotonic())
+
+        with self._lock:
+            self._entries[root_project_id] = entry
+        self._record(hit=False)
+
+        return entry['annotations']
+
+    def table_id(self, syn, root_project_id, key):
+        """Get a single table ID annotation (e.g., rallyTableId) of a root project."""
+        return self.get(syn, root_project_id)[key][0]
+
+    def invalidate(self, root_project_id=None):
+        """Drop one cached root project, or all of them if no ID is given."""
+        with self._lock:
+            if root_project_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(root_project_id, None)
+
+    def stats(self):
+        """Get the hit and miss counters."""
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses)
+
+    def _record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+class LookupCache:
+    """Thread-safe memo of read-only lookups shared by many create calls.
+
+    Each key is loaded at most once, even when several worker threads ask
+    for it at the same time.
+
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        """Get the value for a key, calling `loader()` the first time."""
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._values:
+                    return self._values[key]
+            value = loader()
+            with self._lock:
+                self._values[key] = value
+
+        return value
+
+
+ROOT_METADATA = RootMetadataCache()
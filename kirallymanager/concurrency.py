@@ -0,0 +1,44 @@
+"""Helpers for running independent Synapse calls concurrently.
+
+"""
+
+import concurrent.futures
+import contextvars
+
+DEFAULT_MAX_WORKERS = 4
+
+
+def run_concurrently(func, items, max_workers=DEFAULT_MAX_WORKERS,
+                     return_exceptions=False):
+    """Call a function on each item using a bounded pool of worker threads.
+
+    Each call runs in a copy of the caller's context, so context variables
+    such as the current profiling step are seen by the workers.
+
+    Args:
+        func: A function taking a single item.
+        items: An iterable of items.
+        max_workers: Maximum number of calls in flight at once.
+        return_exceptions: If True, exceptions raised by `func` are returned
+                           in place of the result instead of being raised.
+    Returns:
+        A list of results in the same order as `items`.
+
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(items)))) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, func, item)
+                   for item in items]
+
+    results = []
+    for future in futures:
+        exception = future.exception()
+        if exception is not None and not return_exceptions:
+            raise exception
+        results.append(exception if exception is not None else future.result())
+
+    return results
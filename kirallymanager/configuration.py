@@ -8,6 +8,8 @@ DEFAULT_CONFIG = dict(consortium="Bill and Melinda Gates Foundation",
                       wikiTaskTemplateId="syn12286728",
                       wikiRallyTemplateId="syn12286642",
                       allFilesSchemaId="syn12180518",
+                      # KiData_MNCH_Derived project, where each sprint gets analysis folders
+                      derivedDataProjectId="syn18482954",
                       defaultRallyTeamMembers=[],
                       rallyAdminTeamPermissions=['DOWNLOAD', 'CHANGE_PERMISSIONS',
                                                  'CHANGE_SETTINGS', 'MODERATE', 'READ',
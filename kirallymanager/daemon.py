@@ -0,0 +1,220 @@
+"""Long-running command server on a local Unix socket.
+
+The protocol is one JSON line per connection each way. A request is
+{"argv": [...], "cwd": "..."} and the response is {"exit_code": 0,
+"stdout": "...", "stderr": "..."}, with the output base64 encoded so
+binary output such as Parquet passes through unchanged.
+
+"""
+
+import base64
+import contextlib
+import errno
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+DEFAULT_SOCKET_PATH = os.path.join(os.path.expanduser("~"), ".cache",
+                                   "kirallymanager", "rallymanager.sock")
+
+
+def _encode(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def _decode(text):
+    return base64.b64decode(text.encode("ascii"))
+
+
+def _listening(path):
+    """Check whether a server accepts connections on a Unix socket."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+def forward(argv, path=DEFAULT_SOCKET_PATH, cwd=None):
+    """Run a command in the daemon, if one is listening.
+
+    The command's output is written to this process's standard output and
+    error.
+
+    Args:
+        argv: The command line arguments, without the program name.
+        path: The path of the daemon's socket.
+        cwd: The directory relative paths in the arguments are relative
+             to. Defaults to the current directory.
+    Returns:
+        The exit code of the command, or None if no daemon is listening.
+
+    """
+    if not os.path.exists(path):
+        return None
+
+    request = dict(argv=list(argv), cwd=cwd or os.getcwd())
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(path)
+            connection.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with connection.makefile("rb") as reader:
+                line = reader.readline()
+    except OSError as error:
+        LOGGER.debug(f"No daemon at {path}: {error}")
+        return None
+    if not line:
+        return None
+
+    response = json.loads(line)
+    for name, stream in [('stdout', sys.stdout), ('stderr', sys.stderr)]:
+        stream.flush()
+        stream.buffer.write(_decode(response[name]))
+        stream.buffer.flush()
+    return response['exit_code']
+
+
+@contextlib.contextmanager
+def _log_to(stream):
+    """Send the root logger's messages to a stream instead of its handlers.
+
+    Args:
+        stream: The file object to write the log messages to.
+
+    """
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(handlers[0].formatter if handlers else
+                         logging.Formatter(logging.BASIC_FORMAT))
+    for previous in handlers:
+        root.removeHandler(previous)
+    root.addHandler(handler)
+    try:
+        yield
+    finally:
+        root.removeHandler(handler)
+        for previous in handlers:
+            root.addHandler(previous)
+
+
+def run_captured(run_command, argv, cwd):
+    """Run a command with its output, log messages and working directory
+    redirected.
+
+    Args:
+        run_command: A function taking the argument list, which may raise
+                     SystemExit.
+        argv: The command line arguments, without the program name.
+        cwd: The working directory of the command.
+    Returns:
+        The response dictionary.
+
+    """
+    stdout = io.TextIOWrapper(io.BytesIO(), encoding="utf-8",
+                              write_through=True)
+    stderr = io.TextIOWrapper(io.BytesIO(), encoding="utf-8",
+                              write_through=True)
+    previous_cwd = os.getcwd()
+    exit_code = 0
+    try:
+        os.chdir(cwd)
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr), _log_to(stderr):
+            try:
+                run_command(argv)
+            except SystemExit as exit_request:
+                code = exit_request.code
+                if isinstance(code, str):
+                    print(code, file=sys.stderr)
+                if isinstance(code, int):
+                    exit_code = code
+                else:
+                    exit_code = 0 if code is None else 1
+            except Exception: # pylint: disable=broad-except
+                traceback.print_exc()
+                exit_code = 1
+    finally:
+        os.chdir(previous_cwd)
+
+    return dict(exit_code=exit_code,
+                stdout=_encode(stdout.buffer.getvalue()),
+                stderr=_encode(stderr.buffer.getvalue()))
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            argv, cwd = request['argv'], request['cwd']
+        except (ValueError, KeyError, TypeError) as error:
+            response = dict(exit_code=2, stdout="",
+                            stderr=_encode(f"Bad request: {error}\n".encode()))
+        else:
+            LOGGER.info(f"Running {' '.join(argv)}")
+            with self.server.lock:
+                response = run_captured(self.server.run_command, argv, cwd)
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class CommandServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Run the commands sent to a Unix socket in this process.
+
+    Commands run one at a time, so they can share the logged in client
+    and caches, and the redirection of standard output and the working
+    directory. The socket can only be used by the user running the
+    server. A socket another server is listening on is not taken over.
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, run_command, path=DEFAULT_SOCKET_PATH):
+        self.run_command = run_command
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700,
+                    exist_ok=True)
+        if os.path.exists(path):
+            if _listening(path):
+                raise OSError(errno.EADDRINUSE,
+                              f"A daemon is already listening on {path}")
+            # Left behind by a daemon that is gone.
+            os.remove(path)
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self):
+        super().server_close()
+        with contextlib.suppress(OSError):
+            os.remove(self.server_address)
+
+
+def serve(run_command, path=DEFAULT_SOCKET_PATH):
+    """Serve commands on a Unix socket until interrupted.
+
+    Args:
+        run_command: A function that runs a command line given as an
+                     argument list.
+        path: The path of the socket.
+
+    """
+    with CommandServer(run_command, path) as server:
+        LOGGER.info(f"Listening on {path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            LOGGER.info("Stopping.")
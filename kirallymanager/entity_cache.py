@@ -0,0 +1,181 @@
+"""On-disk cache of Synapse entities, validated by etag.
+
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from .proxy import ClientProxy
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+DEFAULT_ENTITY_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache",
+                                         "kirallymanager", "entities.sqlite")
+DEFAULT_ENTITY_CACHE_TTL = 60
+DEFAULT_ENTITY_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+_SYNAPSE_ID = re.compile(r"^syn\d+$")
+
+# Arguments of syn.get that do not change the entity returned.
+_CACHEABLE_ARGUMENTS = {'downloadFile'}
+
+
+class EntityCache(ClientProxy):
+    """Serve `get` of container entities from a SQLite cache.
+
+    Entities are stored with their properties, annotations and etag, keyed
+    by Synapse ID, and shared by every process using the same file. Within
+    `ttl` seconds of being fetched or validated an entity is returned
+    without any Synapse call. After that, its etag is checked with a
+    single call that does not fetch annotations, and the entity is only
+    fetched again if it changed.
+
+    Storing or deleting an entity through this client drops it from the
+    cache. When the cached entities use more than `max_bytes`, the least
+    recently used are evicted. Files and requests for specific versions
+    are not cached.
+
+    """
+
+    def __init__(self, client, path=DEFAULT_ENTITY_CACHE_PATH,
+                 ttl=DEFAULT_ENTITY_CACHE_TTL,
+                 max_bytes=DEFAULT_ENTITY_CACHE_MAX_BYTES):
+        super().__init__(client)
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False,
+                                           timeout=30)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entities ("
+                "id TEXT PRIMARY KEY, etag TEXT NOT NULL, entity TEXT NOT NULL, "
+                "size INTEGER NOT NULL, validated REAL NOT NULL, "
+                "used REAL NOT NULL)")
+
+    def get(self, entity, **kwargs):  # pylint: disable=arguments-differ
+        if not (isinstance(entity, str) and _SYNAPSE_ID.match(entity) and
+                set(kwargs) <= _CACHEABLE_ARGUMENTS):
+            return self._client.get(entity, **kwargs)
+
+        cached = self._load(entity)
+        if cached is not None:
+            etag, data, validated = cached
+            if time.time() - validated < self.ttl:
+                return self._hit(entity, data)
+            try:
+                header = self._client.restGET(f"/entity/{entity}")
+            except Exception: # pylint: disable=broad-except
+                header = {}
+            if header.get('etag') == etag:
+                self._touch(entity, validated=True)
+                return self._hit(entity, data)
+            LOGGER.debug(f"{entity} changed, fetching it again.")
+
+        self.misses += 1
+        result = self._client.get(entity, **kwargs)
+        self._save(result)
+        return result
+
+    def store(self, obj, *args, **kwargs):
+        try:
+            return self._client.store(obj, *args, **kwargs)
+        finally:
+            if obj.get('id') is not None:
+                self.invalidate(obj.get('id'))
+
+    def delete(self, obj, *args, **kwargs):
+        entity_id = obj if isinstance(obj, str) else obj.get('id')
+        try:
+            return self._client.delete(obj, *args, **kwargs)
+        finally:
+            if entity_id is not None:
+                self.invalidate(entity_id)
+
+    def invalidate(self, entity_id=None):
+        """Drop an entity, or all entities if no ID is given."""
+        with self._lock, self._connection:
+            if entity_id is None:
+                self._connection.execute("DELETE FROM entities")
+            else:
+                self._connection.execute("DELETE FROM entities WHERE id = ?",
+                                         (entity_id,))
+
+    def close(self):
+        """Close the cache database."""
+        with self._lock:
+            self._connection.close()
+
+    def _hit(self, entity_id, data):
+        # Imported here so the command line help does not load the client.
+        import synapseclient # pylint: disable=import-outside-toplevel
+
+        self.hits += 1
+        self._touch(entity_id)
+        return synapseclient.Entity.create(properties=data['properties'],
+                                           annotations=data['annotations'])
+
+    def _load(self, entity_id):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT etag, entity, validated FROM entities WHERE id = ?",
+                (entity_id,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def _touch(self, entity_id, validated=False):
+        now = time.time()
+        with self._lock, self._connection:
+            if validated:
+                self._connection.execute(
+                    "UPDATE entities SET used = ?, validated = ? WHERE id = ?",
+                    (now, now, entity_id))
+            else:
+                self._connection.execute(
+                    "UPDATE entities SET used = ? WHERE id = ?",
+                    (now, entity_id))
+
+    def _save(self, entity):
+        properties = dict(getattr(entity, 'properties', {}))
+        if (not properties.get('etag') or
+                properties.get('concreteType', "").endswith(".FileEntity")):
+            return
+        try:
+            data = json.dumps(dict(properties=properties,
+                                   annotations=dict(entity.annotations)))
+        except TypeError:
+            # Annotations such as dates do not survive a round trip.
+            return
+
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?, ?)",
+                (properties['id'], properties['etag'], data, len(data), now,
+                 now))
+            self._evict()
+
+    def _evict(self):
+        total = 0
+        evicted = []
+        for entity_id, size in self._connection.execute(
+                "SELECT id, size FROM entities ORDER BY used DESC"):
+            total += size
+            if total > self.max_bytes:
+                evicted.append((entity_id,))
+        if evicted:
+            LOGGER.debug(f"Evicting {len(evicted)} cached entities.")
+            self._connection.executemany("DELETE FROM entities WHERE id = ?",
+                                         evicted)
@@ -0,0 +1,150 @@
+"""Streaming export of Synapse table queries.
+
+"""
+
+import csv
+import json
+import logging
+
+from synapseclient.table import cast_values
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+DEFAULT_PAGE_SIZE = 1000
+
+
+def iter_pages(results, page_size=DEFAULT_PAGE_SIZE):
+    """Group the rows of a rowset query result into pages.
+
+    The rows are read lazily, so Synapse result pages are only fetched
+    as the previous ones are written.
+
+    Args:
+        results: The rowset result of `syn.tableQuery`.
+        page_size: The maximum number of rows per page.
+    Yields:
+        Lists of row values.
+
+    """
+    page = []
+    for row in results:
+        page.append(row['values'])
+        if len(page) >= page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def _cast(values, headers):
+    # Rowset values are strings; convert them to the types of their columns.
+    return [cast_values([value], [header])[0] if isinstance(value, str)
+            else value for value, header in zip(values, headers)]
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return str(value)
+
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def write_csv(headers, pages, output):
+    """Write pages of rows as CSV with a header line."""
+    writer = csv.writer(output)
+    writer.writerow([header['name'] for header in headers])
+    for page in pages:
+        writer.writerows([_text(value) for value in values]
+                         for values in page)
+        output.flush()
+
+
+def write_jsonl(headers, pages, output):
+    """Write pages of rows as one JSON object per line."""
+    names = [header['name'] for header in headers]
+    for page in pages:
+        output.writelines(
+            json.dumps(dict(zip(names, _cast(values, headers))),
+                       default=_json_default) + "\n"
+            for values in page)
+        output.flush()
+
+
+def _arrow_type(column_type):
+    import pyarrow # pylint: disable=import-outside-toplevel
+
+    scalar_types = {'INTEGER': pyarrow.int64(),
+                    'DOUBLE': pyarrow.float64(),
+                    'BOOLEAN': pyarrow.bool_(),
+                    'DATE': pyarrow.timestamp('ms')}
+    if column_type.endswith('_LIST'):
+        return pyarrow.list_(scalar_types.get(column_type[:-len('_LIST')],
+                                              pyarrow.string()))
+    return scalar_types.get(column_type, pyarrow.string())
+
+
+def write_parquet(headers, pages, output):
+    """Write pages of rows as Parquet, one row group per page.
+
+    Requires pyarrow.
+
+    """
+    import pyarrow # pylint: disable=import-outside-toplevel
+    import pyarrow.parquet # pylint: disable=import-outside-toplevel
+
+    schema = pyarrow.schema(
+        [(header['name'], _arrow_type(header.get('columnType', 'STRING')))
+         for header in headers])
+    with pyarrow.parquet.ParquetWriter(output, schema) as writer:
+        for page in pages:
+            rows = [_cast(values, headers) for values in page]
+            columns = [[row[index] for row in rows]
+                       for index in range(len(headers))]
+            writer.write_table(
+                pyarrow.Table.from_arrays(
+                    [pyarrow.array(column, type=field.type)
+                     for column, field in zip(columns, schema)],
+                    schema=schema))
+
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl, 'parquet': write_parquet}
+
+
+def export_query(syn, query, output, output_format='csv',
+                 page_size=DEFAULT_PAGE_SIZE):
+    """Write the results of a table query page by page.
+
+    Args:
+        syn: A Synapse client.
+        query: A Synapse table query.
+        output: A text stream for 'csv' and 'jsonl', or a binary stream or
+                file path for 'parquet'.
+        output_format: One of 'csv', 'jsonl' or 'parquet'.
+        page_size: The number of rows written at a time.
+    Returns:
+        The number of rows written.
+
+    """
+    if output_format not in WRITERS:
+        raise ValueError(f"Unknown export format {output_format!r}, use one of {', '.join(FORMATS)}.") # pylint: disable=line-too-long
+
+    LOGGER.debug(f"Exporting {query} as {output_format}.")
+    results = syn.tableQuery(query, resultsAs="rowset")
+    count = 0
+
+    def counted(pages):
+        nonlocal count
+        for page in pages:
+            count += len(page)
+            yield page
+
+    WRITERS[output_format](results.headers,
+                           counted(iter_pages(results, page_size)), output)
+    return count
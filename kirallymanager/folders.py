@@ -0,0 +1,215 @@
+"""Creation of Synapse folder hierarchies.
+
+"""
+
+import json
+import logging
+import os
+import threading
+
+import synapseclient
+from synapseclient.core.exceptions import SynapseHTTPError
+
+from .concurrency import DEFAULT_MAX_WORKERS, run_concurrently
+from .rest import NOT_FOUND, http_status
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+
+def _normalize(path):
+    """Normalize a folder path to the './a/b' form used as lookup keys."""
+    path = os.path.normpath(path)
+    return "." if path == "." else os.path.join(".", path)
+
+
+def plan_folder_tree(folder_list):
+    """Get every folder path in a folder list, grouped by depth.
+
+    Args:
+        folder_list: list of folders in the same format as os.walk.
+    Returns:
+        A list of lists of folder paths. The first list holds the
+        folders directly under the root, the next their children, and
+        so on. The root itself ('.') is not included.
+
+    """
+    paths = set()
+    for directory, subdirectories, _ in folder_list:
+        directory = _normalize(directory)
+        paths.add(directory)
+        paths.update(_normalize(os.path.join(directory, subdir))
+                     for subdir in subdirectories)
+
+    # Include any intermediate folders that were not listed themselves.
+    for path in list(paths):
+        while path != ".":
+            paths.add(path)
+            path = os.path.dirname(path)
+    paths.discard(".")
+
+    levels = {}
+    for path in paths:
+        levels.setdefault(path.count("/"), []).append(path)
+
+    return [sorted(levels[depth]) for depth in sorted(levels)]
+
+
+def create_folder_tree(syn, root, folder_list,
+                       max_workers=DEFAULT_MAX_WORKERS, create=True):
+    """Create a hierarchy of Synapse folders one depth level at a time.
+
+    The children of each pre-existing parent are listed once. The missing
+    folders of each depth level are then created concurrently.
+
+    Args:
+        syn: A logged in synapseclient.Synapse object.
+        root: Synapse entity or ID of a container.
+        folder_list: list of folders in the same format as os.walk.
+        max_workers: Maximum number of Synapse calls in flight at once.
+        create: If False, only look up the existing folders.
+    Returns:
+        A dictionary mapping the local folder paths to Synapse folder IDs,
+        including any pre-existing folders found along the way. If
+        `create` is False, missing folders are left out.
+
+    """
+    folder_ids = {'.': root if isinstance(root, str) else root['id']}
+    preexisting = {'.'}
+
+    def list_children(parent):
+        children = syn.getChildren(folder_ids[parent], includeTypes=["folder"])
+        return {child['name']: child['id'] for child in children}
+
+    def create_folder(path):
+        folder = synapseclient.Folder(os.path.basename(path),
+                                      parent=folder_ids[os.path.dirname(path)])
+        return syn.store(folder).id
+
+    for level in plan_folder_tree(folder_list):
+        parents = sorted({os.path.dirname(path) for path in level} & preexisting)
+        listings = run_concurrently(list_children, parents,
+                                    max_workers=max_workers)
+        for parent, children in zip(parents, listings):
+            for name, child_id in children.items():
+                path = os.path.join(parent, name)
+                folder_ids.setdefault(path, child_id)
+                preexisting.add(path)
+
+        missing = [path for path in level if path not in folder_ids]
+        if not create:
+            continue
+        created = run_concurrently(create_folder, missing,
+                                   max_workers=max_workers)
+        folder_ids.update(zip(missing, created))
+        LOGGER.debug(f"Created {len(missing)} of {len(level)} folders at depth {level[0].count('/')}.") # pylint: disable=line-too-long
+
+    return folder_ids
+
+
+def find_missing_folders(syn, root, folder_list):
+    """Get the folders of a folder list that do not exist yet.
+
+    Args:
+        syn: A logged in synapseclient.Synapse object.
+        root: Synapse entity or ID of a container.
+        folder_list: list of folders in the same format as os.walk.
+    Returns:
+        A sorted list of the missing folder paths.
+
+    """
+    folder_ids = create_folder_tree(syn, root, folder_list, create=False)
+    return sorted(path for level in plan_folder_tree(folder_list)
+                  for path in level if path not in folder_ids)
+
+
+class FolderPaths:
+    """Cache of folder paths under a container to their Synapse IDs.
+
+    Folders are only added once they were found or created, so the cache
+    never holds a missing folder. It is not kept across processes.
+
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def get(self, root_id, path):
+        """Get the ID of a folder path under a container, or None."""
+        with self._lock:
+            return self._ids.get((root_id, path))
+
+    def add(self, root_id, path, folder_id):
+        """Record the ID of a folder path under a container."""
+        with self._lock:
+            self._ids[(root_id, path)] = folder_id
+
+    def clear(self):
+        """Forget all folder paths."""
+        with self._lock:
+            self._ids.clear()
+
+
+FOLDER_PATHS = FolderPaths()
+
+
+def _child_id(syn, parent_id, name):
+    """Look up a child entity by name, without listing the parent."""
+    try:
+        return syn.restPOST("/entity/child", body=json.dumps(
+            {'parentId': parent_id, 'entityName': name}))['id']
+    except SynapseHTTPError as error:
+        if http_status(error) == NOT_FOUND:
+            return None
+        raise
+
+
+def resolve_folder_tree(syn, root, folder_list,
+                        max_workers=DEFAULT_MAX_WORKERS, create=True,
+                        paths=FOLDER_PATHS):
+    """Get or create a hierarchy of Synapse folders by path.
+
+    Each folder is looked up by name under its parent, so the cost does
+    not grow with the number of other children. Paths found before are
+    taken from `paths`, and the children of folders created here are
+    created without a lookup. Each depth level is resolved concurrently.
+
+    Args:
+        syn: A logged in synapseclient.Synapse object.
+        root: Synapse entity or ID of a container.
+        folder_list: list of folders in the same format as os.walk.
+        max_workers: Maximum number of Synapse calls in flight at once.
+        create: If False, only look up the existing folders.
+        paths: The FolderPaths cache to use.
+    Returns:
+        A dictionary mapping the local folder paths to Synapse folder IDs.
+        If `create` is False, missing folders are left out.
+
+    """
+    root_id = root if isinstance(root, str) else root['id']
+    folder_ids = {'.': root_id}
+    created = set()
+
+    def resolve(path):
+        parent_id = folder_ids[os.path.dirname(path)]
+        name = os.path.basename(path)
+        folder_id = paths.get(root_id, path)
+        if folder_id is None and os.path.dirname(path) not in created:
+            folder_id = _child_id(syn, parent_id, name)
+        if folder_id is None and create:
+            return syn.store(synapseclient.Folder(name, parent=parent_id)).id, True # pylint: disable=line-too-long
+        return folder_id, False
+
+    for level in plan_folder_tree(folder_list):
+        level = [path for path in level if os.path.dirname(path) in folder_ids]
+        results = run_concurrently(resolve, level, max_workers=max_workers)
+        for path, (folder_id, new) in zip(level, results):
+            if folder_id is None:
+                continue
+            folder_ids[path] = folder_id
+            paths.add(root_id, path, folder_id)
+            if new:
+                created.add(path)
+
+    return folder_ids
@@ -0,0 +1,120 @@
+"""In-memory index of rally and sprint projects.
+
+"""
+
+import logging
+import threading
+
+from .cache import ROOT_METADATA
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+
+class RallyIndex:
+    """Index of the rally and sprint project views of a root project.
+
+    Each view is queried once, for only the columns needed, the first time
+    it is looked up. Lookups afterwards are dictionary reads. Projects
+    created in this process are registered with `add_rally` and
+    `add_sprint` and take precedence over the views, which lag behind
+    new projects.
+
+    """
+
+    RALLY_COLUMNS = ('id', 'rally', 'rallyTeam')
+    SPRINT_COLUMNS = ('id', 'sprintNumber')
+
+    def __init__(self, syn, root_project_id):
+        self._syn = syn
+        self.root_project_id = root_project_id
+        self._rallies = None
+        self._sprints = None
+        self._created_rallies = {}
+        self._created_sprints = {}
+        self._lock = threading.RLock()
+
+    def rally(self, rally_number):
+        """Get a rally by number.
+
+        Args:
+            rally_number: Integer rally number.
+        Returns:
+            A dictionary with the rally project `id` and `rallyTeam`,
+            or None if there is no such rally.
+
+        """
+        with self._lock:
+            if int(rally_number) in self._created_rallies:
+                return self._created_rallies[int(rally_number)]
+            if self._rallies is None:
+                self._rallies = self._load('rallyTableId', self.RALLY_COLUMNS,
+                                           key=lambda row: int(row['rally']))
+            return self._unique(self._rallies, int(rally_number), "rally")
+
+    def sprint(self, rally_number, sprint_letter):
+        """Get a sprint by rally number and sprint letter.
+
+        Returns:
+            A dictionary with the sprint project `id`, or None if
+            there is no such sprint.
+
+        """
+        sprint_number = f"{rally_number}{sprint_letter}"
+        with self._lock:
+            if sprint_number in self._created_sprints:
+                return self._created_sprints[sprint_number]
+            if self._sprints is None:
+                self._sprints = self._load('sprintTableId', self.SPRINT_COLUMNS,
+                                           key=lambda row: row['sprintNumber'])
+            return self._unique(self._sprints, sprint_number, "sprint")
+
+    def add_rally(self, rally_number, project_id, rally_team_id):
+        """Register a rally project created in this process."""
+        with self._lock:
+            self._created_rallies[int(rally_number)] = dict(
+                id=project_id, rally=str(rally_number),
+                rallyTeam=str(rally_team_id))
+
+    def add_sprint(self, sprint_number, project_id):
+        """Register a sprint project created in this process."""
+        with self._lock:
+            self._created_sprints[sprint_number] = dict(
+                id=project_id, sprintNumber=sprint_number)
+
+    def refresh(self):
+        """Drop the loaded views so the next lookup queries them again.
+
+        Projects registered with `add_rally` and `add_sprint` are kept, as
+        they may not be in the views yet.
+        """
+        with self._lock:
+            self._rallies = None
+            self._sprints = None
+
+    def _load(self, table_key, columns, key):
+        table_id = ROOT_METADATA.table_id(self._syn, self.root_project_id,
+                                          table_key)
+        LOGGER.debug(f"Loading project index from {table_id}.")
+        results = self._syn.tableQuery(
+            f"select {', '.join(columns)} from {table_id}",
+            resultsAs="rowset")
+
+        lookup = {}
+        for row in results:
+            record = dict(zip(columns, row['values']))
+            if record[columns[1]] is None:
+                continue
+            lookup.setdefault(key(record), []).append(record)
+
+        return lookup
+
+    @staticmethod
+    def _unique(lookup, key, kind):
+        records = lookup.get(key, [])
+        if not records:
+            LOGGER.debug(f"No {kind} found.")
+            return None
+        if len(records) > 1:
+            raise ValueError(f"Found more than one matching {kind} project.")
+        return records[0]
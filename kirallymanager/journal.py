@@ -0,0 +1,107 @@
+"""Local journal of completed provisioning steps.
+
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.expanduser("~"), ".cache",
+                                    "kirallymanager", "journal.sqlite")
+
+
+class Journal:
+    """SQLite journal of the completed steps of long create calls.
+
+    Each step is recorded with the JSON result it produced, such as the IDs
+    of the teams, folders or forum it created, under a key like
+    'syn11645282 sprint 1a'. When a create call is re-run after a failure, recorded
+    steps return their result without making any Synapse calls.
+
+    One journal can be shared by concurrent create calls.
+
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS steps ("
+                "key TEXT NOT NULL, step TEXT NOT NULL, result TEXT, "
+                "completed_on REAL NOT NULL, PRIMARY KEY (key, step))")
+
+    def run(self, key, step, func):
+        """Run a step unless it is already recorded as completed.
+
+        Args:
+            key: The key of the journal, e.g. 'syn11645282 sprint 1a'.
+            step: The name of the step.
+            func: A function without arguments that does the step and
+                  returns a JSON serializable result.
+        Returns:
+            The result of func, or the recorded result of an earlier run.
+
+        """
+        completed, result = self.get(key, step)
+        if completed:
+            LOGGER.debug(f"Skipping completed step {step!r} of {key}.")
+            return result
+
+        result = func()
+        self.record(key, step, result)
+        return result
+
+    def get(self, key, step):
+        """Get the recorded result of a step.
+
+        Returns:
+            A tuple of whether the step was completed and its result.
+
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT result FROM steps WHERE key = ? AND step = ?",
+                (key, step)).fetchone()
+        if row is None:
+            return False, None
+        return True, json.loads(row[0])
+
+    def record(self, key, step, result=None):
+        """Record a step as completed with its result."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO steps VALUES (?, ?, ?, ?)",
+                (key, step, json.dumps(result), time.time()))
+
+    def steps(self, key):
+        """Get the completed steps of a key, in the order they completed.
+
+        Returns:
+            A dictionary of step name to result.
+
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT step, result FROM steps WHERE key = ? "
+                "ORDER BY completed_on", (key,)).fetchall()
+        return {step: json.loads(result) for step, result in rows}
+
+    def clear(self, key):
+        """Forget all steps of a key, so they are run again."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM steps WHERE key = ?", (key,))
+
+    def close(self):
+        """Close the journal database."""
+        with self._lock:
+            self._connection.close()
@@ -4,13 +4,24 @@
 
 import json
 import logging
-import os
 import sys
 
+import pandas
 import synapseclient
 
 from . import configuration
+from .acl import AclBatcher
+from .cache import ROOT_METADATA, LookupCache
+from .concurrency import DEFAULT_MAX_WORKERS, run_concurrently
+from .export import DEFAULT_PAGE_SIZE, export_query
+from .folders import create_folder_tree, resolve_folder_tree
+from .index import RallyIndex
+from .profiling import step
+from .rest import get_paginated
 from .synapse import Synapse
+from .teams import TEAMS
+from .views import ViewScopeAccumulator, add_to_view_scope # pylint: disable=unused-import
+from .wiki import TEMPLATES, render_template
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
@@ -23,13 +34,22 @@ DEFAULT_PERMISSIONS = ['DOWNLOAD', 'READ', 'UPDATE', 'CREATE']
 POWER_USER_PERMISSIONS = ['DOWNLOAD', 'READ', 'UPDATE', 'CREATE', 'DELETE']
 DATA_USER_PERMISSIONS = ['DOWNLOAD', 'READ', 'UPDATE', 'CREATE']
 
+USAGE_LEVELS = ('sprint', 'rally')
+USAGE_FILE_COLUMNS = ['id', 'projectId', 'dataFileSizeBytes', 'modifiedOn']
 
 
-def get_rally(root_project_id, rally_number):
-    """Get a rally by number."""
+def get_rally(root_project_id, rally_number, index=None):
+    """Get a rally by number.
+
+    If a RallyIndex is given, it is used instead of querying the rally table.
+    """
     syn = Synapse().client()
-    root_project = syn.get(root_project_id)
-    table_id = root_project.annotations.rallyTableId[0]
+
+    if index is not None:
+        rally = index.rally(rally_number)
+        return syn.get(rally['id'], downloadFile=False) if rally else None
+
+    table_id = ROOT_METADATA.table_id(syn, root_project_id, 'rallyTableId')
     tbl = syn.tableQuery(f"select id from {table_id} where rally={rally_number}") # pylint: disable=line-too-long
     data_frame = tbl.asDataFrame()
 
@@ -44,11 +64,18 @@ def get_rally(root_project_id, rally_number):
     return syn.get(ids[0], downloadFile=False)
 
 
-def get_sprint(root_project_id, rally_number, sprint_letter):
-    """Get a sprint by number and letter."""
+def get_sprint(root_project_id, rally_number, sprint_letter, index=None):
+    """Get a sprint by number and letter.
+
+    If a RallyIndex is given, it is used instead of querying the sprint table.
+    """
     syn = Synapse().client()
-    root_project = syn.get(root_project_id)
-    table_id = root_project.annotations.sprintTableId[0]
+
+    if index is not None:
+        sprint = index.sprint(rally_number, sprint_letter)
+        return syn.get(sprint['id'], downloadFile=False) if sprint else None
+
+    table_id = ROOT_METADATA.table_id(syn, root_project_id, 'sprintTableId')
     tbl = syn.tableQuery(f"select id from {table_id} where sprintNumber='{rally_number}{sprint_letter}'") # pylint: disable=line-too-long
 
     data_frame = tbl.asDataFrame()
@@ -64,20 +91,65 @@ def get_sprint(root_project_id, rally_number, sprint_letter):
     return syn.get(ids[0], downloadFile=False)
 
 
-def get_rallies(root_project_id):
-    """Get list of rally projects."""
+def build_query(table_id, columns=None, where=None):
+    """Build a Synapse table query.
+
+    Args:
+        table_id: Synapse ID of a table or view.
+        columns: Optional list of column names to select. All columns are
+                 selected by default.
+        where: Optional list of SQL predicates, combined with AND.
+    Returns:
+        The query string.
+
+    """
+    query = f"select {', '.join(columns) if columns else '*'} from {table_id}"
+    if where:
+        query += " where " + " and ".join(f"({predicate})" for predicate in where) # pylint: disable=line-too-long
+    return query
+
+
+def compact_dtypes(data_frame, max_unique_ratio=0.5):
+    """Store repeated string columns, such as consortium, as categoricals.
+
+    Args:
+        data_frame: A Pandas data frame. It is changed in place.
+        max_unique_ratio: Convert a text column if it has at most this many
+                          distinct values per row.
+    Returns:
+        The data frame.
+
+    """
+    for column in data_frame.select_dtypes(include=['object', 'string']).columns:
+        values = data_frame[column]
+        if len(values) and values.nunique() <= max_unique_ratio * len(values):
+            data_frame[column] = values.astype('category')
+    return data_frame
+
+
+def get_rallies(root_project_id, columns=None, where=None):
+    """Get list of rally projects.
+
+    Args:
+        root_project_id: Synapse Project ID with admin annotations,
+                                including the rally table ID.
+        columns: Optional list of columns to get. All columns by default.
+        where: Optional list of SQL predicates the rallies must match.
+    Returns:
+        A Pandas data frame of rally information from the
+        Rally Synapse table.
+
+    """
     syn = Synapse().client()
 
     LOGGER.info("Getting rallies from %s" % (root_project_id,))
 
-    root_project = syn.get(root_project_id)
-    table_id = root_project.annotations.rallyTableId[0]
-    tbl = syn.tableQuery("select * from %s" % (table_id, ))
+    tbl = syn.tableQuery(_rallies_query(syn, root_project_id, columns, where))
 
-    return tbl.asDataFrame()
+    return compact_dtypes(tbl.asDataFrame())
 
 
-def get_sprints(root_project_id, rally_number=None):
+def get_sprints(root_project_id, rally_number=None, columns=None, where=None):
     """Get list of sprint projects.
 
     Args:
@@ -85,6 +157,8 @@ def get_sprints(root_project_id, rally_number=None):
                                 including the sprint table ID.
         rally_number: An integer rally number. If None, return sprints
                       from all rallies.
+        columns: Optional list of columns to get. All columns by default.
+        where: Optional list of SQL predicates the sprints must match.
     Returns:
         A Pandas data frame of sprint information from the
         Sprint Synapse table.
@@ -92,45 +166,208 @@ def get_sprints(root_project_id, rally_number=None):
     """
     syn = Synapse().client()
 
-    root_project = syn.get(root_project_id)
-    table_id = root_project.annotations.sprintTableId[0]
-    tbl = syn.tableQuery("select * from %s" % (table_id, ))
-    data_frame = tbl.asDataFrame()
+    tbl = syn.tableQuery(_sprints_query(syn, root_project_id, rally_number,
+                                        columns, where))
+
+    return compact_dtypes(tbl.asDataFrame())
+
+
+def _rallies_query(syn, root_project_id, columns, where):
+    table_id = ROOT_METADATA.table_id(syn, root_project_id, 'rallyTableId')
+    return build_query(table_id, columns=columns, where=where)
 
+
+def _sprints_query(syn, root_project_id, rally_number, columns, where):
+    where = list(where or [])
     if rally_number:
-        data_frame = data_frame[data_frame.rally == rally_number]
+        where.append(f"rally = {int(rally_number)}")
+
+    table_id = ROOT_METADATA.table_id(syn, root_project_id, 'sprintTableId')
+    return build_query(table_id, columns=columns, where=where)
 
-    return data_frame
+
+def export_rallies(root_project_id, output, output_format='csv', columns=None,
+                   where=None, page_size=DEFAULT_PAGE_SIZE):
+    """Write the rally projects page by page, without loading them all.
+
+    Args:
+        root_project_id: Synapse Project ID with admin annotations,
+                                including the rally table ID.
+        output: The stream to write to, binary for 'parquet'.
+        output_format: One of 'csv', 'jsonl' or 'parquet'.
+        columns: Optional list of columns to get. All columns by default.
+        where: Optional list of SQL predicates the rallies must match.
+        page_size: The number of rows written at a time.
+    Returns:
+        The number of rallies written.
+
+    """
+    syn = Synapse().client()
+
+    return export_query(syn, _rallies_query(syn, root_project_id, columns,
+                                            where),
+                        output, output_format=output_format,
+                        page_size=page_size)
+
+
+def export_sprints(root_project_id, output, output_format='csv',
+                   rally_number=None, columns=None, where=None,
+                   page_size=DEFAULT_PAGE_SIZE):
+    """Write the sprint projects page by page, without loading them all.
+
+    Args:
+        root_project_id: Synapse Project ID with admin annotations,
+                                including the sprint table ID.
+        output: The stream to write to, binary for 'parquet'.
+        output_format: One of 'csv', 'jsonl' or 'parquet'.
+        rally_number: An integer rally number. If None, write sprints
+                      from all rallies.
+        columns: Optional list of columns to get. All columns by default.
+        where: Optional list of SQL predicates the sprints must match.
+        page_size: The number of rows written at a time.
+    Returns:
+        The number of sprints written.
+
+    """
+    syn = Synapse().client()
+
+    return export_query(syn, _sprints_query(syn, root_project_id,
+                                            rally_number, columns, where),
+                        output, output_format=output_format,
+                        page_size=page_size)
+
+
+def _to_datetime(values):
+    # Synapse returns dates as milliseconds since the epoch.
+    if pandas.api.types.is_numeric_dtype(values):
+        return pandas.to_datetime(values, unit='ms', utc=True)
+    return pandas.to_datetime(values, utc=True)
+
+
+def get_usage(root_project_id, all_files_view_id, rally_number=None,
+              by='sprint'):
+    """Count the files and bytes in each sprint, or in each rally.
+
+    The files of all sprints are read with a single query of the all
+    files view, selecting only the columns needed, and aggregated per
+    project before being joined to the sprint table.
+
+    Args:
+        root_project_id: Synapse Project ID with admin annotations,
+                                including the sprint table ID.
+        all_files_view_id: Synapse ID of the file view of all sprints.
+        rally_number: An integer rally number. If None, report on sprints
+                      from all rallies.
+        by: 'sprint' for a row per sprint, or 'rally' for a row per rally.
+    Returns:
+        A Pandas data frame with the `fileCount`, `totalBytes` and
+        `lastModifiedOn` of each sprint, with its `id`, `name`, `rally`
+        and `sprintNumber`, or of each rally, with its `sprintCount`.
+
+    """
+    if by not in USAGE_LEVELS:
+        raise ValueError(f"Unknown usage level {by!r}, use one of {', '.join(USAGE_LEVELS)}.") # pylint: disable=line-too-long
+
+    syn = Synapse().client()
+
+    sprints = get_sprints(root_project_id, rally_number=rally_number,
+                          columns=['id', 'name', 'rally', 'sprintNumber'])
+    sprints['id'] = sprints['id'].astype(str)
+
+    where = None
+    if rally_number:
+        # Files of other rallies are not needed, but an empty list of
+        # projects is not valid SQL.
+        project_ids = list(sprints['id']) or ['']
+        where = ["projectId in (%s)" % ", ".join(f"'{project_id}'" for project_id in project_ids)] # pylint: disable=line-too-long
+    LOGGER.info(f"Getting files from {all_files_view_id}")
+    files = syn.tableQuery(build_query(all_files_view_id,
+                                       columns=USAGE_FILE_COLUMNS,
+                                       where=where)).asDataFrame()
+
+    files['projectId'] = files['projectId'].astype(str)
+    files['dataFileSizeBytes'] = pandas.to_numeric(files['dataFileSizeBytes'],
+                                                   errors='coerce')
+    files['modifiedOn'] = _to_datetime(files['modifiedOn'])
+
+    per_project = files.groupby('projectId').agg(
+        fileCount=('id', 'count'), totalBytes=('dataFileSizeBytes', 'sum'),
+        lastModifiedOn=('modifiedOn', 'max'))
+    usage = sprints.merge(per_project, how='left', left_on='id',
+                          right_index=True)
+    usage[['fileCount', 'totalBytes']] = (
+        usage[['fileCount', 'totalBytes']].fillna(0).astype('int64'))
+
+    if by == 'rally':
+        usage = usage.groupby('rally', as_index=False).agg(
+            sprintCount=('id', 'count'), fileCount=('fileCount', 'sum'),
+            totalBytes=('totalBytes', 'sum'),
+            lastModifiedOn=('lastModifiedOn', 'max'))
+    else:
+        usage = usage.sort_values(['rally', 'sprintNumber'])
+    return usage.reset_index(drop=True)
+
+
+def find_team(name, refresh=False):
+    """Get a team of the logged in user by its exact name.
+
+    Args:
+        name: The team name.
+        refresh: List the user's teams again instead of using the index.
+    Returns:
+        A synapseclient.Team with only the `id` and `name`, or None.
+
+    """
+    syn = Synapse().client()
+
+    team_id = TEAMS.team_id(syn, name, refresh=refresh)
+    if team_id is None:
+        return None
+    return synapseclient.Team(id=team_id, name=name)
 
 
 def create_team(name, *args, **kwargs):
     """Create an empty team."""
     syn = Synapse().client()
 
+    team = find_team(name)
+    if team is not None:
+        return team
+
+    sys.stderr.write("Can't find team \"%s\", creating it.\n" % name)
     try:
-        return syn.getTeam(name)
-    except ValueError:
-        sys.stderr.write("Can't find team \"%s\", creating it.\n" % name)
-        return syn.store(synapseclient.Team(name=name,
-                                            *args, **kwargs))
+        team = syn.store(synapseclient.Team(name=name, *args, **kwargs))
+    except synapseclient.core.exceptions.SynapseHTTPError:
+        # The team may have been created since the index was listed.
+        team = find_team(name, refresh=True)
+        if team is None:
+            raise
+        return team
 
+    TEAMS.add(syn, team)
+    return team
 
-def add_to_view_scope(viewschema, scope_ids):
-    """Adds Synapse containers to the scope of a view.
 
-    View scopes should be a set, not an array.
-    This function removes duplicates.
+def watch_views(refresher, added_scopes, config):
+    """Poll updated views in the background until they show new projects.
 
     Args:
-        viewschema: A Synapse View Schema object.
-        scope_ids: A list of scope IDs.
-    Returns:
-        Nothing.
+        refresher: A ViewRefresher, or None to not poll at all.
+        added_scopes: A dictionary of view ID to the project IDs added to
+                      its scope, as returned by ViewScopeAccumulator.apply.
+        config: A dictionary with configuration options.
 
     """
-    existing_scope_ids = set(viewschema.properties.scopeIds)
-    existing_scope_ids.update([x.replace("syn", "") for x in scope_ids])
-    viewschema.properties.scopeIds = list(existing_scope_ids)
+    if refresher is None:
+        return
+
+    for view_id, project_ids in added_scopes.items():
+        if view_id == config.get('allFilesSchemaId'):
+            # Only files are rows in the all files view, and new projects
+            # have none, so there is nothing to wait for.
+            refresher.refresh(view_id)
+        else:
+            refresher.watch(view_id, project_ids)
 
 
 def get_or_create_view(*args, **kwargs):
@@ -216,6 +453,105 @@ def invite_to_team(team_id, individual_id, manager=False):
     return invite
 
 
+def plan_team_invites(team_id, individual_ids, manager=False):
+    """Work out which individuals still need a team invitation.
+
+    The team's members and open invitations are read once. For managers,
+    the team ACL is read as well and updated in memory.
+
+    Args:
+        team_id: A Synapse Team ID.
+        individual_ids: A list of Synapse User IDs.
+        manager: Flag to decide if the invited users should be team managers.
+    Returns:
+        A dictionary with the `team_id`, the user IDs to `invite`, the user
+        IDs to `promote` to manager and the updated team `acl` (or None).
+
+    """
+    syn = Synapse().client()
+
+    members = {int(member['member']['ownerId'])
+               for member in get_paginated(syn, f"/teamMembers/{team_id}")}
+    invited = {int(invitation['inviteeId'])
+               for invitation in get_paginated(syn, f"/team/{team_id}/openInvitation") # pylint: disable=line-too-long
+               if invitation.get('inviteeId')}
+
+    missing = [individual_id
+               for individual_id in dict.fromkeys(int(x) for x in individual_ids)
+               if individual_id not in members]
+
+    plan = dict(team_id=team_id,
+                invite=[x for x in missing if x not in invited],
+                promote=[], acl=None)
+
+    if manager and missing:
+        acl = syn.restGET(f"/team/{team_id}/acl")
+        resource_access = {int(x['principalId']): x
+                           for x in acl['resourceAccess']}
+        for individual_id in missing:
+            permissions = resource_access.get(individual_id)
+            if permissions is None:
+                acl['resourceAccess'].append(
+                    {'principalId': individual_id,
+                     'accessType': MANAGER_PERMISSIONS})
+            elif not set(MANAGER_PERMISSIONS) <= set(permissions['accessType']): # pylint: disable=line-too-long
+                permissions['accessType'] = list(
+                    set(permissions['accessType']) | set(MANAGER_PERMISSIONS))
+            else:
+                continue
+            plan['promote'].append(individual_id)
+        plan['acl'] = acl
+
+    return plan
+
+
+def apply_team_invites(plan, max_workers=DEFAULT_MAX_WORKERS):
+    """Send the invitations and promotions of a plan_team_invites plan.
+
+    Invitations are sent concurrently and all manager promotions are made
+    in one team ACL update.
+
+    Returns:
+        A list of the Synapse invitation objects that were created.
+
+    """
+    syn = Synapse().client()
+
+    def send_invite(individual_id):
+        invite = {'teamId': str(plan['team_id']), 'inviteeId': individual_id}
+        return syn.restPOST("/membershipInvitation", body=json.dumps(invite))
+
+    invites = run_concurrently(send_invite, plan['invite'],
+                               max_workers=max_workers)
+
+    # Update ACL so the new users are managers
+    if plan['promote']:
+        syn.restPUT("/team/acl", body=json.dumps(plan['acl']))
+
+    return invites
+
+
+def bulk_invite_to_team(team_id, individual_ids, manager=False,
+                        max_workers=DEFAULT_MAX_WORKERS):
+    """Invite many individuals to join a team.
+
+    The team's members and open invitations are read once, only the
+    individuals who are neither members nor already invited are sent an
+    invitation, and all manager promotions are made in one team ACL update.
+
+    Args:
+        team_id: A Synapse Team ID.
+        individual_ids: A list of Synapse User IDs.
+        manager: Flag to decide if the invited users should be team managers.
+        max_workers: Maximum number of invitations sent at once.
+    Returns:
+        A list of the Synapse invitation objects that were created.
+
+    """
+    plan = plan_team_invites(team_id, individual_ids, manager=manager)
+    return apply_team_invites(plan, max_workers=max_workers)
+
+
 def create_team_and_invite(team_name, default_members=None):
     """Create a rally team and invite default members.
 
@@ -223,41 +559,49 @@ def create_team_and_invite(team_name, default_members=None):
     Should remove this once fixed:
     https://sagebionetworks.jira.com/browse/SYNPY-723
     """
-    syn = Synapse().client()
-
     rally_team = create_team(name=team_name)
     LOGGER.debug(f"Creating the team {team_name}.")
 
     # Invite default users to the team if they are not already in it
     if default_members:
-        for individual_id in default_members:
-            _ = invite_to_team(team_id=rally_team.id,
-                               individual_id=individual_id,
-                               manager=True)
+        _ = bulk_invite_to_team(team_id=rally_team.id,
+                                individual_ids=default_members,
+                                manager=True)
     LOGGER.debug(f"Invited users ({default_members}) to the team.")
-    return syn.getTeam(rally_team.id)
+    return rally_team
 
 
 def create_rally(rally_number, rally_title=None,
-                 config=configuration.DEFAULT_CONFIG):
+                 config=configuration.DEFAULT_CONFIG, index=None,
+                 lookups=None, views=None, refresher=None):
     """Create a rally project.
 
     Args:
         rally_number: Integer rally number.
         rally_title: Optional rally title used as the project name.
         config: A dictionary with configuration options.
+        index: Optional RallyIndex shared with other create calls.
+        lookups: Optional LookupCache shared with other create calls.
+        views: Optional ViewScopeAccumulator shared with other create
+               calls. If given, the caller applies the view updates.
+        refresher: Optional ViewRefresher that polls the updated views
+                   in the background.
     Returns:
         A synapseclient.Project object.
 
     """
     syn = Synapse().client()
 
-    rally_project = get_rally(config['root_project_id'],
-                              rally_number=rally_number)
+    if index is None:
+        index = RallyIndex(syn, config['root_project_id'])
+    if lookups is None:
+        lookups = LookupCache()
+
+    existing_rally = index.rally(rally_number)
 
-    if rally_project:
+    if existing_rally:
         LOGGER.info(f"Rally {rally_number} already exists.")
-        return rally_project
+        return syn.get(existing_rally['id'], downloadFile=False)
 
     consortium = config.get('consortium', None)
 
@@ -271,9 +615,10 @@ def create_rally(rally_number, rally_title=None,
     team_permissions = {rally_admin_team_id: config['rallyAdminTeamPermissions']} # pylint: disable=line-too-long
 
     # Create a rally team.
-    rally_team = create_team_and_invite(
-        team_name=rally_team_name,
-        default_members=config['defaultRallyTeamMembers'])
+    with step("teams"):
+        rally_team = create_team_and_invite(
+            team_name=rally_team_name,
+            default_members=config['defaultRallyTeamMembers'])
 
     # Add the rally team with it's default permissions to
     # the list of permissions to add to the rally project ACL
@@ -289,46 +634,49 @@ def create_rally(rally_number, rally_title=None,
     rally_project = synapseclient.Project(name=rally_title,
                                           annotations=annotations)
 
-    try:
-        rally_project = syn.store(rally_project, createOrUpdate=False)
-        LOGGER.info("Rally project created.")
-    except synapseclient.core.exceptions.SynapseHTTPError:
-        body = json.dumps({"entityName": rally_title})
-        rally_proj_obj = syn.restPOST("/entity/child", body=body)
-        rally_project = syn.get(rally_proj_obj['id'])
+    with step("project"):
+        try:
+            rally_project = syn.store(rally_project, createOrUpdate=False)
+            LOGGER.info("Rally project created.")
+        except synapseclient.core.exceptions.SynapseHTTPError:
+            body = json.dumps({"entityName": rally_title})
+            rally_proj_obj = syn.restPOST("/entity/child", body=body)
+            rally_project = syn.get(rally_proj_obj['id'])
 
     # Set permissions to the rally project
-    for team_id, permissions in list(team_permissions.items()):
-        syn.setPermissions(rally_project, principalId=team_id,
-                           accessType=permissions)
+    with step("acl"), AclBatcher(syn) as acl:
+        for team_id, permissions in list(team_permissions.items()):
+            acl.grant(rally_project, principal_id=team_id,
+                      access_type=permissions)
 
     # Add the wiki, only if it doesn't already exist
-    try:
-        wiki = syn.getWiki(owner=rally_project)
-    except synapseclient.core.exceptions.SynapseHTTPError:
-        rally_wiki_master_template = syn.get(config['wikiRallyTemplateId'])
-        wiki = synapseclient.Wiki(owner=rally_project,
-                                  markdownFile=rally_wiki_master_template.path)
-        wiki = syn.store(wiki)
-        wiki.markdown = wiki.markdown.replace('RALLY_ID',
-                                              str(rally_number))
-        wiki.markdown = wiki.markdown.replace('id=0000000',
-                                              f'id={rally_team.id}')
-        wiki.markdown = wiki.markdown.replace('teamId=0000000',
-                                              f'teamId={rally_team.id}')
-        wiki = syn.store(wiki)
+    with step("wiki"):
+        try:
+            wiki = syn.getWiki(owner=rally_project)
+        except synapseclient.core.exceptions.SynapseHTTPError:
+            template = lookups.get(
+                ('template', config['wikiRallyTemplateId']),
+                lambda: TEMPLATES.markdown(syn, config['wikiRallyTemplateId'])) # pylint: disable=line-too-long
+            markdown = render_template(template,
+                                       {'RALLY_ID': str(rally_number),
+                                        'id=0000000': f'id={rally_team.id}',
+                                        'teamId=0000000': f'teamId={rally_team.id}'}) # pylint: disable=line-too-long
+            wiki = syn.store(synapseclient.Wiki(owner=rally_project,
+                                                markdown=markdown))
 
     LOGGER.info("Set the project wiki.")
 
+    index.add_rally(rally_number, rally_project.id, rally_team.id)
+
     # Add the Rally Project to the list of rallies
     # in the working group project view
-    rally_table_schema = syn.get(rally_table_id)
-    add_to_view_scope(rally_table_schema, [rally_project.id])
-    rally_table_schema = syn.store(rally_table_schema)
+    rally_views = ViewScopeAccumulator(syn) if views is None else views
+    rally_views.add(rally_table_id, [rally_project.id])
 
-    # Force refresh of the table
-    _ = syn.tableQuery(f'select id from {rally_table_schema.id} limit 1')
-    LOGGER.debug("Updated rally project view.")
+    if views is None:
+        with step("views"):
+            watch_views(refresher, rally_views.apply(), config)
+        LOGGER.debug("Updated rally project view.")
 
     return rally_project
 
@@ -345,35 +693,164 @@ def create_folders(root, folder_list):
     """
     syn = Synapse().client()
 
-    dirlookup = {'.': root}
-
-
-    for directory, subdirectories, _ in folder_list:
-        folder = dirlookup.get(directory, None)
-        if folder is None:
-            folder = synapseclient.Folder(directory,
-                                          parent=dirlookup[directory])
-            folder = syn.store(folder)
-        else:  # Add pre-existing subdirectories to dirlookup
-            preexisting_subdirectories = syn.getChildren(
-                    folder, includeTypes=["folder"])
-            for subdir in preexisting_subdirectories:
-                curr = os.path.join(directory, subdir["name"])
-                dirlookup[curr] = syn.get(subdir["id"])
-        dirlookup[directory] = folder
-        for subdir in subdirectories:
-            curr = os.path.join(directory, subdir)
-            # pylint: disable=line-too-long
-            subfolder = dirlookup.get(curr,
-                                      syn.store(synapseclient.Folder(subdir,
-                                                                     parent=folder)))
-            dirlookup[curr] = subfolder
-
-    return dirlookup
+    return create_folder_tree(syn, root, folder_list)
+
+
+def create_folder_paths(root, folder_list):
+    """Get or create Synapse folders by path, without listing siblings.
+
+    Use this instead of create_folders under containers with many
+    children, such as the derived data project.
+
+    Args:
+        root: Synapse ID of a container.
+        folder_list: list of folders in the same format as os.walk.
+    Returns:
+        A dictionary mapping the local folder to the Synapse folder ID.
+    """
+    syn = Synapse().client()
+
+    return resolve_folder_tree(syn, root, folder_list)
+
+
+def sprint_post(post, sprint_team_name, forum_id):
+    """Get a discussion post for a sprint forum that tags the sprint team.
+
+    Args:
+        post: A dictionary with the post 'title' and 'messageMarkdown'.
+              It is copied, not modified.
+        sprint_team_name: Name of the sprint team to tag.
+        forum_id: ID of the sprint project forum.
+    Returns:
+        A dictionary to POST to /thread.
+
+    """
+    discussion_post = dict(post)
+    discussion_post["messageMarkdown"] = (
+            f"{discussion_post['messageMarkdown']} "
+            "\n\n"
+            f"Don't forget to tag `@{sprint_team_name}` "
+            "in your posts!")
+    discussion_post['forumId'] = forum_id
+    return discussion_post
+
+
+def broadcast_post(root_project_id, rally_number, title, message_markdown,
+                   max_workers=DEFAULT_MAX_WORKERS):
+    """Post a message to the forum of every sprint in a rally.
+
+    Args:
+        root_project_id: Synapse Project ID with admin annotations,
+                         including the sprint table ID.
+        rally_number: Integer rally number.
+        title: Title of the discussion thread.
+        message_markdown: Message of the discussion thread.
+        max_workers: Maximum number of forums posted to at once.
+    Returns:
+        A list of dictionaries, one per sprint, with the sprint `id` and
+        `sprintNumber`, the `forumId`, the created `threadId`, a `status`
+        of 'ok' or 'failed' and any `error`.
+
+    """
+    syn = Synapse().client()
+
+    sprints = get_sprints(root_project_id, rally_number=rally_number)
+    sprints = sprints[['id', 'sprintNumber']].to_dict('records')
+
+    def post(sprint):
+        result = dict(sprint, forumId=None, threadId=None, status='ok',
+                      error=None)
+        try:
+            forum = syn.restGET(f"/project/{sprint['id']}/forum")
+            result['forumId'] = forum['id']
+            discussion_post = sprint_post(
+                dict(title=title, messageMarkdown=message_markdown),
+                f"ki Sprint {sprint['sprintNumber']}", forum['id'])
+            thread = syn.restPOST("/thread", body=json.dumps(discussion_post))
+            result['threadId'] = thread['id']
+        except Exception as exception: # pylint: disable=broad-except
+            LOGGER.error(f"Error posting to sprint {sprint['sprintNumber']}: {exception}") # pylint: disable=line-too-long
+            result['status'] = 'failed'
+            result['error'] = str(exception)
+        return result
+
+    return run_concurrently(post, sprints, max_workers=max_workers)
+
+
+def create_sprint_wiki(sprint_project, rally_team_id, sprint_team_id,
+                       config=configuration.DEFAULT_CONFIG, lookups=None):
+    """Create the wiki of a sprint project from the sprint wiki template.
+
+    Args:
+        sprint_project: A Synapse Project.
+        rally_team_id: ID of the rally team.
+        sprint_team_id: ID of the sprint team.
+        config: A dictionary with configuration options.
+        lookups: Optional LookupCache shared with other create calls.
+    Returns:
+        A synapseclient.Wiki object.
+
+    """
+    syn = Synapse().client()
+    wiki_master_template_id = config['wiki_master_template_id']
+
+    if lookups is None:
+        lookups = LookupCache()
+
+    template = lookups.get(
+        ('template', wiki_master_template_id),
+        lambda: TEMPLATES.markdown(syn, wiki_master_template_id))
+    markdown = render_template(template,
+                               {'id=123': f'id={rally_team_id}',
+                                'teamId=123': f'teamId={rally_team_id}',
+                                'id=456': f'id={sprint_team_id}',
+                                'teamId=456': f'teamId={sprint_team_id}'})
+    return syn.store(synapseclient.Wiki(owner=sprint_project,
+                                        markdown=markdown))
+
+
+def derived_data_project_id(config):
+    """Get the ID of the project where sprints get their analysis folders.
+
+    Configuration files written before the project was configurable do
+    not have it, and get the default project.
+
+    """
+    return config.get('derivedDataProjectId',
+                      configuration.DEFAULT_CONFIG['derivedDataProjectId'])
+
+
+def derived_data_folders(rally_number, sprint_letter):
+    """Get the derived data folders of a sprint and the data team's access.
+
+    Args:
+        rally_number: Integer rally number.
+        sprint_letter: A single character letter for the sprint.
+    Returns:
+        A folder list in the same format as os.walk, relative to the
+        derived data project, and a list of (folder path, access types)
+        to grant the sprint data users team.
+
+    """
+    rally_folder_name = f"Rally-0{rally_number}"
+    sprint_folder_name = f"Sprint-{sprint_letter}"
+    rally_folder_path = f"./{rally_folder_name}"
+    sprint_folder_path = f"{rally_folder_path}/{sprint_folder_name}"
+
+    folder_list = [[".", [rally_folder_name], []],
+                   [rally_folder_path, [sprint_folder_name], []],
+                   [sprint_folder_path, ["analysis", "adam"], []]]
+    grants = [(rally_folder_path, ["READ"]),
+              (sprint_folder_path, ["DOWNLOAD", "READ"]),
+              (f"{sprint_folder_path}/analysis", POWER_USER_PERMISSIONS),
+              (f"{sprint_folder_path}/adam", ["DOWNLOAD", "READ"])]
+
+    return folder_list, grants
 
 
 def create_sprint(rally_number, sprint_letter, sprint_title=None,
-                  config=configuration.DEFAULT_CONFIG):
+                  config=configuration.DEFAULT_CONFIG, index=None,
+                  lookups=None, views=None, refresher=None, journal=None):
     """Create a sprint project.
 
     Args:
@@ -381,6 +858,16 @@ def create_sprint(rally_number, sprint_letter, sprint_title=None,
         sprint_letter: A single character letter for the sprint.
         sprint_title: Optional sprint title used as the project name.
         config: A dictionary with configuration options.
+        index: Optional RallyIndex shared with other create calls.
+        lookups: Optional LookupCache shared with other create calls.
+        views: Optional ViewScopeAccumulator shared with other create
+               calls. If given, the caller applies the view updates.
+        refresher: Optional ViewRefresher that polls the updated views
+                   in the background.
+        journal: Optional Journal. Completed steps are recorded in it with
+                 the IDs they created, and skipped when a failed call is
+                 run again. The steps are forgotten once the sprint is
+                 complete.
     Returns:
         A synapseclient.Project object.
 
@@ -395,184 +882,172 @@ def create_sprint(rally_number, sprint_letter, sprint_title=None,
 
     consortium = config.get('consortium', None)
 
-    wiki_master_template_id = config['wiki_master_template_id']
     sprint_table_id = config['sprint_table_id']
 
-    # all files table in the Ki rally working group project
-    all_files_working_group_schema = syn.get(config['allFilesSchemaId'])
+    if index is None:
+        index = RallyIndex(syn, config['root_project_id'])
+    if lookups is None:
+        lookups = LookupCache()
 
-    rally_project = get_rally(config['root_project_id'],
-                              rally_number=rally_number)
+    rally_project = index.rally(rally_number)
 
     if rally_project is None:
         raise ValueError(f"No rally {rally_number}. Please create it first.")
 
     # Get the rally team.
-    rally_team = syn.getTeam(
-        rally_project.annotations.get('rallyTeam', None)[0])
+    rally_team = lookups.get(('team', rally_project['rallyTeam']),
+                             lambda: syn.getTeam(rally_project['rallyTeam']))
+
+    sprint_project = index.sprint(rally_number, sprint_letter)
+
+    if sprint_project:
+        return syn.get(sprint_project['id'], downloadFile=False)
+
+    # Journals are shared by every configuration, so the key includes
+    # the root project.
+    journal_key = f"{config['root_project_id']} sprint {sprint_number}"
 
-    sprint_project = get_sprint(config['root_project_id'],
-                                rally_number=rally_number,
-                                sprint_letter=sprint_letter)
+    def journaled(name, profile_step, func):
+        """Run a step, or skip it if the journal has it as completed."""
+        with step(profile_step):
+            if journal is None:
+                return func()
+            return journal.run(journal_key, name, func)
 
-    if not sprint_project:
+    sprint_project = None
+
+    def create_project():
+        nonlocal sprint_project
         LOGGER.info(f"Creating a new sprint {sprint_number}")
         # Create the sprint project
         annotations = dict(sprintTitle=sprint_title,
                            sprintNumber=sprint_number,
                            sprint_letter=sprint_letter,
                            rally=rally_number,
-                           rallyId=rally_project.id,
+                           rallyId=rally_project['id'],
                            sprintStart=None,
                            sprintEnd=None,
                            consortium=consortium,
                            rallyTeam=rally_team.id)
 
-        sprint_project = synapseclient.Project(name=sprint_title,
-                                               annotations=annotations)
-
+        project = synapseclient.Project(name=sprint_title,
+                                        annotations=annotations)
 
         try:
-            sprint_project = syn.store(sprint_project, createOrUpdate=False)
-            LOGGER.info(f"Created sprint project {sprint_project.id}")
+            project = syn.store(project, createOrUpdate=False)
+            LOGGER.info(f"Created sprint project {project.id}")
         except synapseclient.core.exceptions.SynapseHTTPError:
-            body = json.dumps({"entityName": sprint_project.name})
-            sprint_project_obj = syn.restPOST("/entity/child",
-                                              body=body)
-            sprint_project = syn.get(sprint_project_obj['id'])
-
-        sprint_prefix = f"ki Sprint {sprint_number}"
-        # Create sprint team, invite members, and set permissions
-        sprint_team = create_team_and_invite(
+            body = json.dumps({"entityName": project.name})
+            project = syn.restPOST("/entity/child", body=body)
+        sprint_project = project
+        return project['id']
+
+    sprint_project_id = journaled('project', 'project', create_project)
+
+    # Permissions are collected here and applied once per entity
+    acl = AclBatcher(syn)
+
+    sprint_prefix = f"ki Sprint {sprint_number}"
+    # Create sprint team, invite members, and set permissions
+    sprint_team_id = journaled(
+            'team', 'teams', lambda: create_team_and_invite(
                 team_name=sprint_prefix,
-                default_members=config["defaultRallyTeamMembers"])
-        syn.setPermissions(
-                sprint_project,
-                principalId=sprint_team.id,
-                accessType=DEFAULT_PERMISSIONS)
-        # Create sprint power users team, invite members, and set permissions
-        sprint_power_users_team = create_team_and_invite(
+                default_members=config["defaultRallyTeamMembers"]).id)
+    acl.grant(
+            sprint_project_id,
+            principal_id=sprint_team_id,
+            access_type=DEFAULT_PERMISSIONS)
+    # Create sprint power users team, invite members, and set permissions
+    sprint_power_users_team_id = journaled(
+            'power users team', 'teams', lambda: create_team_and_invite(
                 team_name=f"{sprint_prefix} Power Users",
-                default_members=config["defaultPowerUserTeamMembers"])
-        syn.setPermissions(
-                sprint_project,
-                principalId=sprint_power_users_team.id,
-                accessType=POWER_USER_PERMISSIONS)
-        # Create sprint data users team, invite members, and set permissions
-        sprint_data_users_team = create_team_and_invite(
+                default_members=config["defaultPowerUserTeamMembers"]).id)
+    acl.grant(
+            sprint_project_id,
+            principal_id=sprint_power_users_team_id,
+            access_type=POWER_USER_PERMISSIONS)
+    # Create sprint data users team, invite members, and set permissions
+    sprint_data_users_team_id = journaled(
+            'data users team', 'teams', lambda: create_team_and_invite(
                 team_name=f"{sprint_prefix} Data Users",
-                default_members=config["defaultDataTeamMembers"])
-        syn.setPermissions(
-                sprint_project,
-                principalId=sprint_data_users_team.id,
-                accessType=DATA_USER_PERMISSIONS)
-
-        # Grant admin team permissions for the sprint project
-        syn.setPermissions(
-                sprint_project,
-                principalId=config["rally_admin_team_id"],
-                accessType=config["rallyAdminTeamPermissions"])
-
+                default_members=config["defaultDataTeamMembers"]).id)
+    acl.grant(
+            sprint_project_id,
+            principal_id=sprint_data_users_team_id,
+            access_type=DATA_USER_PERMISSIONS)
+
+    # Grant admin team permissions for the sprint project
+    acl.grant(
+            sprint_project_id,
+            principal_id=config["rally_admin_team_id"],
+            access_type=config["rallyAdminTeamPermissions"])
+
+    def create_wiki():
         try:
-            wiki = syn.getWiki(owner=sprint_project)
+            wiki = syn.getWiki(owner=sprint_project_id)
         except synapseclient.core.exceptions.SynapseHTTPError:
-            wiki_template = syn.get(wiki_master_template_id)
-            wiki = synapseclient.Wiki(owner=sprint_project,
-                                      markdownFile=wiki_template.path) # pylint: disable=line-too-long
-            wiki = syn.store(wiki)
-            wiki.markdown = wiki.markdown.replace(
-                    'id=123',
-                    f'id={rally_team.id}')
-            wiki.markdown = wiki.markdown.replace(
-                    'teamId=123',
-                    f'teamId={rally_team.id}')
-            wiki.markdown = wiki.markdown.replace(
-                    'id=456',
-                    f'id={sprint_team.id}')
-            wiki.markdown = wiki.markdown.replace(
-                    'teamId=456',
-                    f'teamId={sprint_team.id}')
-            wiki = syn.store(wiki)
-
-        LOGGER.info("Set sprint project wiki.")
-
-        # Create folders
-        _ = create_folders(root=sprint_project,
-                           folder_list=config['sprintFolders'])
-
-        LOGGER.info("Created sprint project folder structure.")
-
-        # Create a daily checkin discussion post
-        forum = syn.restGET(f"/project/{sprint_project.id}/forum")
-
-        for discussion_post in config['posts']:
-            discussion_post["messageMarkdown"] = (
-                    f"{discussion_post['messageMarkdown']} "
-                    "\n\n"
-                    f"Don't forget to tag `@{sprint_team.name}` "
-                    "in your posts!")
-            discussion_post['forumId'] = forum.get('id', None)
-            try:
-                post = syn.restPOST("/thread",
-                                    body=json.dumps(discussion_post))
-            except Exception as exception:
-                LOGGER.error(f"Error with discussion post: {post} ({exception})") # pylint: disable=line-too-long
-        LOGGER.info("Created sprint project forum posts.")
-
-        # Create rally/sprint/analysis folders in KiData_MNCH_Derived project
-        rally_folder_name = f"Rally-0{rally_number}"
-        sprint_folder_name = f"Sprint-{sprint_letter}"
-        project_root = create_folders(  # create rally folder
-                root="syn18482954",
-                folder_list=[[".", [rally_folder_name], []]])
-        rally_folder = create_folders(  # create sprint folder
-                root=project_root[f"./{rally_folder_name}"]["id"],
-                folder_list=[[".", [sprint_folder_name], []]])
-        sprint_folder = create_folders(  # create analysis folder
-                root=rally_folder[f"./{sprint_folder_name}"]["id"],
-                folder_list=[[".", ["analysis"], []]])
-        sprint_folder = create_folders(  # create adam folder
-                root=rally_folder[f"./{sprint_folder_name}"]["id"],
-                folder_list=[[".", ["adam"], []]])
-        syn.setPermissions(
-                rally_folder["."],
-                principalId=sprint_data_users_team.id,
-                accessType=["READ"],
-                overwrite=False)
-        syn.setPermissions(
-                sprint_folder["."],  # a.k.a. the sprint folder
-                principalId=sprint_data_users_team.id,
-                accessType=["DOWNLOAD", "READ"],
-                overwrite=False)
-        syn.setPermissions(
-                sprint_folder["./analysis"],
-                principalId=sprint_data_users_team.id,
-                accessType=POWER_USER_PERMISSIONS,
-                overwrite=False)
-        syn.setPermissions(
-                sprint_folder["./adam"],
-                principalId=sprint_data_users_team.id,
-                accessType=["DOWNLOAD", "READ"],
-                overwrite=False)
-
-        # Add the sprint to the all sprints table in the
-        # ki working group project
-        rally_admin_sprint_table = syn.get(sprint_table_id)
-        add_to_view_scope(rally_admin_sprint_table, [sprint_project.id])
-        rally_admin_sprint_table = syn.store(rally_admin_sprint_table)
-
-        # Add the files in the rally project to the
-        # working group all files view
-        all_files_working_group_schema = syn.get(config['allFilesSchemaId'])
-        add_to_view_scope(all_files_working_group_schema, [rally_project.id])
-        all_files_working_group_schema = syn.store(all_files_working_group_schema) # pylint: disable=line-too-long
-
-        add_to_view_scope(all_files_working_group_schema, [sprint_project.id])
-        all_files_working_group_schema = syn.store(all_files_working_group_schema) # pylint: disable=line-too-long
-
-        # make sure all tables are triggered to be refreshed
-        _ = syn.tableQuery(f'select id from {rally_admin_sprint_table.id} limit 1') # pylint: disable=line-too-long
-        _ = syn.tableQuery(f'select id from {all_files_working_group_schema.id} limit 1') # pylint: disable=line-too-long
-
-        LOGGER.info("Registered sprint project in project and file views.")
+            wiki = create_sprint_wiki(sprint_project_id, rally_team.id,
+                                      sprint_team_id, config=config,
+                                      lookups=lookups)
+        return wiki.id
+
+    journaled('wiki', 'wiki', create_wiki)
+    LOGGER.info("Set sprint project wiki.")
+
+    # Create folders
+    journaled('folders', 'folders', lambda: create_folders(
+            root=sprint_project_id, folder_list=config['sprintFolders']))
+
+    LOGGER.info("Created sprint project folder structure.")
+
+    # Create a daily checkin discussion post
+    forum_id = journaled('forum', 'posts', lambda: syn.restGET(
+            f"/project/{sprint_project_id}/forum").get('id', None))
+
+    for config_post in config['posts']:
+        discussion_post = sprint_post(config_post, sprint_prefix, forum_id)
+        try:
+            journaled(f"post {discussion_post['title']}", 'posts',
+                      lambda post=discussion_post: syn.restPOST(
+                          "/thread", body=json.dumps(post))['id'])
+        except Exception as exception:
+            LOGGER.error(f"Error with discussion post: {discussion_post['title']} ({exception})") # pylint: disable=line-too-long
+    LOGGER.info("Created sprint project forum posts.")
+
+    # Create rally/sprint/analysis folders in KiData_MNCH_Derived project
+    folder_list, grants = derived_data_folders(rally_number, sprint_letter)
+    derived_folders = journaled(
+            'derived data folders', 'folders', lambda: create_folder_paths(
+                root=derived_data_project_id(config), folder_list=folder_list))
+    for path, access_type in grants:
+        acl.grant(derived_folders[path],
+                  principal_id=sprint_data_users_team_id,
+                  access_type=access_type,
+                  overwrite=False)
+    journaled('permissions', 'acl', lambda: sorted(acl.flush()))
+    LOGGER.info("Set sprint project and derived data permissions.")
+
+    index.add_sprint(sprint_number, sprint_project_id)
+
+    sprint_views = ViewScopeAccumulator(syn) if views is None else views
+
+    # Add the sprint to the all sprints table in the
+    # ki working group project
+    sprint_views.add(sprint_table_id, [sprint_project_id])
+
+    # Add the files in the rally and sprint projects to the
+    # working group all files view
+    sprint_views.add(config['allFilesSchemaId'],
+                     [rally_project['id'], sprint_project_id])
+
+    if views is None:
+        added_scopes = journaled('views', 'views', sprint_views.apply)
+        with step("views"):
+            watch_views(refresher, added_scopes, config)
+
+    LOGGER.info("Registered sprint project in project and file views.")
+    if journal is not None:
+        journal.clear(journal_key)
+    if not isinstance(sprint_project, synapseclient.Project):
+        sprint_project = syn.get(sprint_project_id, downloadFile=False)
     return sprint_project
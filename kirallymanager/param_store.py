@@ -13,13 +13,22 @@
 # limitations under the License.
 
 import os
-import boto3
 import logging
 import json
+import threading
+import time
 
 
 class ParamStore:
 
+    # Seconds values (and misses) from SSM are cached for.
+    CACHE_TTL = 300
+
+    _ssm_client = None
+    _lock = threading.Lock()
+    _cache = {}
+    _prefetched = {}
+
     @classmethod
     def get(cls, key, default=None):
         """
@@ -48,9 +57,22 @@ class ParamStore:
     def _get_from_ssm(cls, key):
         """
         Gets a value from SSM.
+
+        Values and misses are cached for CACHE_TTL seconds. Keys under a
+        path loaded by prefetch() are never fetched one at a time.
         """
-        client = boto3.client('ssm')
         ssm_key = cls._build_ssm_key(key)
+        now = time.monotonic()
+
+        with cls._lock:
+            cached = cls._cache.get(ssm_key)
+            if cached is not None and cached[1] > now:
+                return cached[0]
+            path = ssm_key.rsplit('/', 1)[0] + '/'
+            if cls._prefetched.get(path, 0) > now:
+                return None
+
+        client = cls._client()
         result = None
 
         try:
@@ -59,16 +81,66 @@ class ParamStore:
         except client.exceptions.ParameterNotFound:
             logging.exception('SSM Parameter Not Found: {}'.format(ssm_key))
 
+        with cls._lock:
+            cls._cache[ssm_key] = (result, now + cls.CACHE_TTL)
+
         return result
 
+    @classmethod
+    def prefetch(cls):
+        """
+        Loads every parameter under /SERVICE_NAME/SERVICE_STAGE/ from SSM
+        into the cache, with one paginated request.
+        """
+        path = cls._build_ssm_key('')
+        client = cls._client()
+        now = time.monotonic()
+        values = {}
+
+        paginator = client.get_paginator('get_parameters_by_path')
+        for page in paginator.paginate(Path=path, Recursive=True, WithDecryption=True):
+            for parameter in page.get('Parameters', []):
+                values[parameter['Name']] = parameter['Value']
+
+        with cls._lock:
+            for ssm_key, value in values.items():
+                cls._cache[ssm_key] = (value, now + cls.CACHE_TTL)
+            cls._prefetched[path] = now + cls.CACHE_TTL
+
+        return len(values)
+
+    @classmethod
+    def clear_cache(cls):
+        """
+        Forgets all cached values and misses.
+        """
+        with cls._lock:
+            cls._cache.clear()
+            cls._prefetched.clear()
+
+    @classmethod
+    def _client(cls):
+        """
+        Gets the shared SSM client, creating it on first use.
+        """
+        with cls._lock:
+            if cls._ssm_client is None:
+                # boto3 is slow to import and only needed for SSM lookups.
+                import boto3
+                cls._ssm_client = boto3.client('ssm')
+            return cls._ssm_client
+
     @classmethod
     def _set_ssm_parameter(cls, key, value, type='SecureString'):
         """
         Sets an SSM key/value.
         """
-        client = boto3.client('ssm')
+        client = cls._client()
         ssm_key = cls._build_ssm_key(key)
-        return client.put_parameter(Name=ssm_key, Value=value, Type=type, Overwrite=True)
+        response = client.put_parameter(Name=ssm_key, Value=value, Type=type, Overwrite=True)
+        with cls._lock:
+            cls._cache[ssm_key] = (value, time.monotonic() + cls.CACHE_TTL)
+        return response
 
     @classmethod
     def _build_ssm_key(cls, key):
@@ -0,0 +1,159 @@
+"""Counting and timing of Synapse client calls per manager step.
+
+"""
+
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import math
+import re
+import threading
+import time
+
+from .proxy import ClientProxy
+
+_STEP = contextvars.ContextVar('kirallymanager_step', default=None)
+
+NO_STEP = "other"
+
+PROFILED_METHODS = ('get', 'store', 'restGET', 'restPOST', 'restPUT',
+                    'restDELETE', 'tableQuery', 'setPermissions', 'getTeam')
+
+SUMMARY_FIELDS = ['step', 'endpoint', 'count', 'p50', 'p95', 'total']
+
+_ID_PATTERN = re.compile(r"(?<=/)(syn)?\d+(?=/|$)")
+
+
+@contextlib.contextmanager
+def step(name):
+    """Tag the Synapse calls made in a block with a manager step.
+
+    The step is kept in a context variable, so it follows the calls into
+    worker threads started with run_concurrently.
+
+    Args:
+        name: The step name, e.g. 'teams', 'acl', 'wiki', 'folders' or
+              'views'.
+
+    """
+    token = _STEP.set(name)
+    try:
+        yield
+    finally:
+        _STEP.reset(token)
+
+
+def current_step():
+    """Get the name of the current manager step, or None."""
+    return _STEP.get()
+
+
+def endpoint(method, *args):
+    """Get the endpoint a client call is counted under.
+
+    REST calls are grouped by their URI with IDs and query strings
+    removed, e.g. 'restGET /entity/{id}/acl'.
+
+    """
+    if method.startswith("rest") and args and isinstance(args[0], str):
+        uri = _ID_PATTERN.sub("{id}", args[0].split("?")[0])
+        return f"{method} {uri}"
+    return method
+
+
+def _percentile(sorted_values, percent):
+    """Nearest-rank percentile of a sorted list."""
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Profiler(ClientProxy):
+    """Count and time the calls made through a Synapse client.
+
+    Each call of a method in PROFILED_METHODS is recorded with its wall
+    time, endpoint and the step that was current when it was made. Calls
+    the client makes internally are not counted again.
+
+    """
+
+    def __init__(self, client):
+        super().__init__(client)
+        self._lock = threading.Lock()
+        self._calls = []
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name not in PROFILED_METHODS:
+            return attribute
+
+        @functools.wraps(attribute)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                self.record(endpoint(name, *args), time.perf_counter() - start)
+
+        return timed
+
+    def record(self, endpoint_name, seconds, step_name=None):
+        """Record one call."""
+        with self._lock:
+            self._calls.append((step_name or current_step() or NO_STEP,
+                                endpoint_name, seconds))
+
+    def summary(self, by=('step', 'endpoint')):
+        """Summarize the recorded calls.
+
+        Args:
+            by: The fields to group the calls by, 'step' and/or 'endpoint'.
+        Returns:
+            A list of dictionaries with the keys in SUMMARY_FIELDS. Times
+            are in seconds, and groups are sorted by total time.
+
+        """
+        with self._lock:
+            calls = list(self._calls)
+
+        groups = collections.defaultdict(list)
+        for step_name, endpoint_name, seconds in calls:
+            key = dict(step=step_name, endpoint=endpoint_name)
+            groups[tuple(key[field] if field in by else "*"
+                         for field in ('step', 'endpoint'))].append(seconds)
+
+        rows = []
+        for (step_name, endpoint_name), times in groups.items():
+            times.sort()
+            rows.append(dict(step=step_name, endpoint=endpoint_name,
+                             count=len(times),
+                             p50=round(_percentile(times, 50), 4),
+                             p95=round(_percentile(times, 95), 4),
+                             total=round(sum(times), 4)))
+
+        return sorted(rows, key=lambda row: row['total'], reverse=True)
+
+    def report(self):
+        """Get a text table of the calls per step and per endpoint."""
+        lines = []
+        for by in [('step',), ('endpoint',), ('step', 'endpoint')]:
+            rows = self.summary(by=by)
+            width = max([len(f"{row['step']}  {row['endpoint']}")
+                         for row in rows] + [20])
+            lines.append(f"{' / '.join(by):<{width}} {'count':>7} "
+                         f"{'p50 (s)':>9} {'p95 (s)':>9} {'total (s)':>10}")
+            for row in rows:
+                name = "  ".join(row[field] for field in by)
+                lines.append(f"{name:<{width}} {row['count']:>7} "
+                             f"{row['p50']:>9.3f} {row['p95']:>9.3f} "
+                             f"{row['total']:>10.3f}")
+            lines.append("")
+        return "\n".join(lines)
+
+    def to_json(self):
+        """Get the summaries per step, per endpoint and per both as JSON."""
+        return json.dumps({
+            'steps': self.summary(by=('step',)),
+            'endpoints': self.summary(by=('endpoint',)),
+            'calls': self.summary(by=('step', 'endpoint'))}, indent=2)
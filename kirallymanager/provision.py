@@ -0,0 +1,135 @@
+"""Batch provisioning of rallies and sprints from a manifest.
+
+"""
+
+import csv
+import json
+import logging
+import time
+
+from . import configuration
+from . import manager
+from .cache import LookupCache
+from .concurrency import DEFAULT_MAX_WORKERS, run_concurrently
+from .index import RallyIndex
+from .profiling import step
+from .synapse import Synapse
+from .views import ViewScopeAccumulator
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+RESULT_FIELDS = ['kind', 'rally_number', 'sprint_letter', 'title',
+                 'status', 'project_id', 'seconds', 'error']
+
+
+def load_manifest(path):
+    """Load a provisioning manifest from a CSV or JSON file.
+
+    A CSV manifest has the columns `kind` (rally or sprint), `rally_number`,
+    `sprint_letter` and `title`. A JSON manifest is an object with `rallies`
+    and `sprints` lists of objects with the same keys.
+
+    Args:
+        path: Path to a .csv or .json manifest.
+    Returns:
+        A dictionary with lists of `rallies` and `sprints` items.
+
+    """
+    with open(path) as manifest_file:
+        if path.lower().endswith(".json"):
+            manifest = json.load(manifest_file)
+            items = ([dict(item, kind='rally') for item in manifest.get('rallies', [])] + # pylint: disable=line-too-long
+                     [dict(item, kind='sprint') for item in manifest.get('sprints', [])]) # pylint: disable=line-too-long
+        else:
+            items = list(csv.DictReader(manifest_file))
+
+    rallies, sprints = [], []
+    for item in items:
+        kind = item.get('kind', '').strip().lower()
+        item = dict(rally_number=int(item['rally_number']),
+                    sprint_letter=(item.get('sprint_letter') or None),
+                    title=(item.get('title') or None))
+        if kind == 'rally':
+            rallies.append(item)
+        elif kind == 'sprint':
+            if not item['sprint_letter']:
+                raise ValueError(f"Sprint in rally {item['rally_number']} has no sprint letter.") # pylint: disable=line-too-long
+            sprints.append(item)
+        else:
+            raise ValueError(f"Unknown manifest item kind: {kind!r}")
+
+    return dict(rallies=rallies, sprints=sprints)
+
+
+def provision(manifest, config=configuration.DEFAULT_CONFIG,
+              max_workers=DEFAULT_MAX_WORKERS, refresher=None, journal=None):
+    """Create all rallies and then all sprints in a manifest.
+
+    Rallies are created before any sprint, so sprints may refer to a rally
+    created in the same run. Both are run through a bounded worker pool and
+    share one RallyIndex and LookupCache, so the rally projects, rally teams
+    and templates are only fetched once for the whole run. View scope
+    additions are collected over the run and each view is stored once at
+    the end.
+
+    Args:
+        manifest: A dictionary as returned by load_manifest.
+        config: A dictionary with configuration options.
+        max_workers: Maximum number of projects being created at once.
+        refresher: Optional ViewRefresher that polls the updated views
+                   in the background.
+        journal: Optional Journal, so a re-run skips the completed steps
+                 of sprints that failed part way.
+    Returns:
+        A list of dictionaries, one per manifest item, with the keys in
+        RESULT_FIELDS.
+
+    """
+    syn = Synapse().client()
+    index = RallyIndex(syn, config['root_project_id'])
+    lookups = LookupCache()
+    views = ViewScopeAccumulator(syn)
+
+    def create_rally(item):
+        return manager.create_rally(rally_number=item['rally_number'],
+                                    rally_title=item['title'],
+                                    config=config, index=index,
+                                    lookups=lookups, views=views)
+
+    def create_sprint(item):
+        return manager.create_sprint(rally_number=item['rally_number'],
+                                     sprint_letter=item['sprint_letter'],
+                                     sprint_title=item['title'],
+                                     config=config, index=index,
+                                     lookups=lookups, views=views,
+                                     journal=journal)
+
+    results = run_concurrently(_timed('rally', create_rally),
+                               manifest['rallies'], max_workers=max_workers)
+    results += run_concurrently(_timed('sprint', create_sprint),
+                                manifest['sprints'], max_workers=max_workers)
+
+    with step("views"):
+        manager.watch_views(refresher, views.apply(), config)
+
+    return results
+
+
+def _timed(kind, create):
+    """Wrap a create function to record its status and wall time."""
+
+    def run(item):
+        result = dict(item, kind=kind, status='ok', project_id=None,
+                      error=None)
+        start = time.monotonic()
+        try:
+            result['project_id'] = create(item).id
+        except Exception as exception: # pylint: disable=broad-except
+            LOGGER.error(f"Failed to create {kind} {item}: {exception}")
+            result['status'] = 'failed'
+            result['error'] = str(exception)
+        result['seconds'] = round(time.monotonic() - start, 3)
+        return result
+
+    return run
@@ -0,0 +1,24 @@
+"""Base class for layers wrapped around the Synapse client.
+
+"""
+
+
+class ClientProxy:
+    """Wrap a synapseclient.Synapse object.
+
+    Subclasses override the client methods they add behavior to. Every
+    other attribute is looked up on the wrapped client, so layers can be
+    stacked and used anywhere the client is.
+
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    @property
+    def client(self):
+        """The wrapped client or layer."""
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
@@ -0,0 +1,286 @@
+"""Plan and reconcile the state of sprint projects.
+
+"""
+
+import collections
+import json
+import logging
+
+import synapseclient
+
+from . import configuration
+from . import manager
+from .acl import AclBatcher, get_access
+from .cache import LookupCache
+from .folders import find_missing_folders, resolve_folder_tree
+from .index import RallyIndex
+from .rest import get_paginated
+from .synapse import Synapse
+from .views import ViewScopeAccumulator
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+Operation = collections.namedtuple('Operation', ['step', 'description', 'apply']) # pylint: disable=invalid-name
+
+# Sprint teams as (team name suffix, configuration key of the default
+# members, permissions on the sprint project).
+SPRINT_TEAMS = [("", "defaultRallyTeamMembers", manager.DEFAULT_PERMISSIONS),
+                (" Power Users", "defaultPowerUserTeamMembers",
+                 manager.POWER_USER_PERMISSIONS),
+                (" Data Users", "defaultDataTeamMembers",
+                 manager.DATA_USER_PERMISSIONS)]
+
+
+def plan_sprint(rally_number, sprint_letter, sprint_title=None,
+                config=configuration.DEFAULT_CONFIG, index=None,
+                lookups=None):
+    """Compare a sprint with the state create_sprint would leave it in.
+
+    Only reads are made. The project, its teams and their members, the
+    project and derived data ACLs, the wiki, folders, forum threads and
+    view scopes are compared to what the configuration asks for.
+
+    Args:
+        rally_number: Integer rally number.
+        sprint_letter: A single character letter for the sprint.
+        sprint_title: Optional sprint title used as the project name.
+        config: A dictionary with configuration options.
+        index: Optional RallyIndex shared with other calls.
+        lookups: Optional LookupCache shared with other calls.
+    Returns:
+        A list of Operation tuples with the `step`, a `description` and an
+        `apply` function, in the order they should be applied.
+
+    """
+    syn = Synapse().client()
+
+    if index is None:
+        index = RallyIndex(syn, config['root_project_id'])
+    if lookups is None:
+        lookups = LookupCache()
+
+    sprint_number = f"{rally_number}{sprint_letter}"
+
+    rally = index.rally(rally_number)
+    if rally is None:
+        raise ValueError(f"No rally {rally_number}. Please create it first.")
+
+    sprint = index.sprint(rally_number, sprint_letter)
+    if sprint is None:
+        return [Operation(
+            'project',
+            f"Create sprint {sprint_number} with its teams, permissions, wiki, folders, posts and view scopes", # pylint: disable=line-too-long
+            lambda: manager.create_sprint(rally_number, sprint_letter,
+                                          sprint_title=sprint_title,
+                                          config=config, index=index,
+                                          lookups=lookups))]
+
+    project = syn.get(sprint['id'], downloadFile=False)
+    team_prefix = f"ki Sprint {sprint_number}"
+    # Team objects by name, filled in by the team operations if missing.
+    teams = {}
+
+    operations = []
+    operations += _plan_teams(syn, team_prefix, config, teams)
+    operations += _plan_project_access(syn, project, team_prefix, config, teams)
+    operations += _plan_wiki(syn, project, rally, team_prefix, config, teams,
+                             lookups)
+    operations += _plan_folders(syn, project, config)
+    operations += _plan_posts(syn, project, team_prefix, config)
+    operations += _plan_derived_data(syn, rally_number, sprint_letter,
+                                     team_prefix, config, teams)
+    operations += _plan_views(syn, project, rally, config)
+
+    return operations
+
+
+def reconcile_sprint(rally_number, sprint_letter, sprint_title=None,
+                     config=configuration.DEFAULT_CONFIG, index=None,
+                     lookups=None, dry_run=False):
+    """Apply only the operations needed to bring a sprint up to date.
+
+    Args:
+        Same as plan_sprint, and
+        dry_run: If True, only plan the operations.
+    Returns:
+        The list of planned Operation tuples.
+
+    """
+    operations = plan_sprint(rally_number, sprint_letter,
+                             sprint_title=sprint_title, config=config,
+                             index=index, lookups=lookups)
+
+    if not operations:
+        LOGGER.info(f"Sprint {rally_number}{sprint_letter} is up to date.")
+
+    if not dry_run:
+        for operation in operations:
+            LOGGER.info(f"[{operation.step}] {operation.description}")
+            operation.apply()
+
+    return operations
+
+
+def _plan_teams(syn, team_prefix, config, teams):
+    operations = []
+
+    for suffix, members_key, _ in SPRINT_TEAMS:
+        name = f"{team_prefix}{suffix}"
+        members = config.get(members_key) or []
+
+        teams[name] = manager.find_team(name)
+        if teams[name] is None:
+            def create(name=name, members=members):
+                teams[name] = manager.create_team_and_invite(
+                    team_name=name, default_members=members)
+
+            operations.append(Operation(
+                'teams', f"Create team '{name}' and invite {members}", create))
+            continue
+
+        if members:
+            plan = manager.plan_team_invites(teams[name].id, members,
+                                             manager=True)
+            if plan['invite'] or plan['promote']:
+                operations.append(Operation(
+                    'teams',
+                    f"Invite {plan['invite']} to '{name}' and make {plan['promote']} managers", # pylint: disable=line-too-long
+                    lambda plan=plan: manager.apply_team_invites(plan)))
+
+    return operations
+
+
+def _plan_project_access(syn, project, team_prefix, config, teams):
+    access = get_access(syn, project)
+    needed = []
+
+    for suffix, _, permissions in SPRINT_TEAMS:
+        name = f"{team_prefix}{suffix}"
+        team = teams[name]
+        if team is None or access.get(int(team.id)) != set(permissions):
+            needed.append((name, permissions))
+
+    admin_team_id = int(config['rally_admin_team_id'])
+    if access.get(admin_team_id) != set(config['rallyAdminTeamPermissions']):
+        needed.append((admin_team_id, config['rallyAdminTeamPermissions']))
+
+    if not needed:
+        return []
+
+    def grant():
+        with AclBatcher(syn) as acl:
+            for principal, permissions in needed:
+                principal_id = teams[principal].id if principal in teams else principal # pylint: disable=line-too-long
+                acl.grant(project, principal_id=principal_id,
+                          access_type=permissions)
+
+    return [Operation(
+        'acl',
+        f"Grant {', '.join(str(principal) for principal, _ in needed)} access to {project.id}", # pylint: disable=line-too-long
+        grant)]
+
+
+def _plan_wiki(syn, project, rally, team_prefix, config, teams, lookups): # pylint: disable=too-many-arguments
+    try:
+        syn.getWiki(owner=project)
+        return []
+    except synapseclient.core.exceptions.SynapseHTTPError:
+        pass
+
+    return [Operation(
+        'wiki', f"Create the wiki of {project.id}",
+        lambda: manager.create_sprint_wiki(project, rally['rallyTeam'],
+                                           teams[team_prefix].id,
+                                           config=config, lookups=lookups))]
+
+
+def _plan_folders(syn, project, config):
+    missing = find_missing_folders(syn, project, config['sprintFolders'])
+
+    if not missing:
+        return []
+
+    return [Operation(
+        'folders', f"Create folders {missing} in {project.id}",
+        lambda: manager.create_folders(root=project,
+                                       folder_list=config['sprintFolders']))]
+
+
+def _plan_posts(syn, project, team_prefix, config):
+    forum = syn.restGET(f"/project/{project.id}/forum")
+    titles = {thread['title'] for thread in get_paginated(
+        syn, f"/forum/{forum['id']}/threads?filter=EXCLUDE_DELETED")}
+    missing = [post for post in config['posts'] if post['title'] not in titles]
+
+    if not missing:
+        return []
+
+    def post():
+        for config_post in missing:
+            discussion_post = manager.sprint_post(config_post, team_prefix,
+                                                  forum['id'])
+            syn.restPOST("/thread", body=json.dumps(discussion_post))
+
+    return [Operation(
+        'posts',
+        f"Post {[post['title'] for post in missing]} to forum {forum['id']}",
+        post)]
+
+
+def _plan_derived_data(syn, rally_number, sprint_letter, team_prefix, config, teams): # pylint: disable=too-many-arguments,line-too-long
+    folder_list, grants = manager.derived_data_folders(rally_number,
+                                                       sprint_letter)
+    derived_data_project_id = manager.derived_data_project_id(config)
+    folder_ids = resolve_folder_tree(syn, derived_data_project_id,
+                                     folder_list, create=False)
+    data_team = teams[f"{team_prefix} Data Users"]
+    missing = [path for path, _ in grants if path not in folder_ids]
+
+    if missing or data_team is None:
+        needed = grants
+    else:
+        needed = [(path, access_type) for path, access_type in grants
+                  if not set(access_type) <= get_access(
+                      syn, folder_ids[path]).get(int(data_team.id), set())]
+
+    if not missing and not needed:
+        return []
+
+    def create_and_grant():
+        ids = folder_ids
+        if missing:
+            ids = manager.create_folder_paths(
+                root=derived_data_project_id, folder_list=folder_list)
+        with AclBatcher(syn) as acl:
+            for path, access_type in needed:
+                acl.grant(ids[path],
+                          principal_id=teams[f"{team_prefix} Data Users"].id,
+                          access_type=access_type, overwrite=False)
+
+    description = f"Grant the data users team access to {[path for path, _ in needed]}" # pylint: disable=line-too-long
+    if missing:
+        description = f"Create derived data folders {missing}. {description}"
+
+    return [Operation('derived data', description, create_and_grant)]
+
+
+def _plan_views(syn, project, rally, config):
+    wanted = {config['sprint_table_id']: [project.id],
+              config['allFilesSchemaId']: [rally['id'], project.id]}
+    views = ViewScopeAccumulator(syn)
+    missing = {}
+
+    for view_id, scope_ids in wanted.items():
+        existing_scope_ids = set(syn.get(view_id).properties.scopeIds)
+        missing_scope_ids = [scope_id for scope_id in scope_ids
+                             if scope_id.replace("syn", "") not in existing_scope_ids] # pylint: disable=line-too-long
+        if missing_scope_ids:
+            views.add(view_id, missing_scope_ids)
+            missing[view_id] = missing_scope_ids
+
+    if not missing:
+        return []
+
+    return [Operation('views', f"Add scopes to views: {missing}",
+                      views.apply)]
@@ -0,0 +1,45 @@
+"""Helpers for calling the Synapse REST API directly.
+
+"""
+
+# HTTP statuses the rally manager handles in Synapse responses.
+UNAUTHORIZED = 401
+NOT_FOUND = 404
+CONFLICT = 409
+PRECONDITION_FAILED = 412
+TOO_MANY_REQUESTS = 429
+SERVICE_UNAVAILABLE = 503
+
+
+def http_status(error):
+    """Get the HTTP status of a failed Synapse request.
+
+    Args:
+        error: An exception raised by a Synapse request.
+    Returns:
+        The status code of the error's response, or None if it has none.
+
+    """
+    return getattr(getattr(error, 'response', None), 'status_code', None)
+
+
+def get_paginated(syn, uri, limit=50):
+    """Get every result of a paginated Synapse GET request.
+
+    Args:
+        syn: A logged in synapseclient.Synapse object.
+        uri: A REST URI that returns a PaginatedResults object.
+        limit: Number of results per request.
+    Returns:
+        A generator of the results.
+
+    """
+    separator = "&" if "?" in uri else "?"
+    offset = 0
+    while True:
+        page = syn.restGET(f"{uri}{separator}limit={limit}&offset={offset}")
+        results = page.get('results', [])
+        yield from results
+        offset += len(results)
+        if not results or offset >= page.get('totalNumberOfResults', 0):
+            return
@@ -0,0 +1,259 @@
+"""Pacing and retrying of Synapse requests.
+
+"""
+
+import logging
+import random
+import threading
+import time
+
+from .rest import SERVICE_UNAVAILABLE, TOO_MANY_REQUESTS, http_status
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+# HTTP statuses Synapse returns when it throttles requests.
+THROTTLED_STATUSES = (TOO_MANY_REQUESTS, SERVICE_UNAVAILABLE)
+
+DEFAULT_REQUESTS_PER_SECOND = 20
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_RETRY_BUDGET = 20
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return max(0.0, float(headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Limit the rate of requests, allowing short bursts.
+
+    Args:
+        rate: Tokens added per second. None or 0 for no limit.
+        burst: Maximum number of tokens, i.e. of requests sent at once
+               after an idle period. Defaults to `rate`.
+
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst or max(1, rate or 1)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, waiting until one is available.
+
+        Returns:
+            The number of seconds waited.
+
+        """
+        waited = 0.0
+        while self.rate:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.burst, self._tokens +
+                                   (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                delay = (1 - self._tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+        return waited
+
+
+class Scheduler:
+    """Pace, limit and retry the requests of all Synapse calls.
+
+    Every request takes a token from a shared token bucket and a slot
+    under an adaptive concurrency limit. When Synapse throttles a request
+    (HTTP 429 or 503) the limit is halved, at most once per `cooldown`
+    seconds, and the request is retried after the server's Retry-After
+    delay or a jittered exponential backoff. Each success raises the limit
+    by 1/limit, so it grows by about one per round of requests until it is
+    back at `max_concurrency`.
+
+    Retries are paid from a budget shared by all requests, which successes
+    refill by `budget_refill`. When Synapse keeps throttling, the budget
+    runs out and requests fail instead of piling up more retries.
+
+    """
+
+    def __init__(self, rate=DEFAULT_REQUESTS_PER_SECOND, burst=None,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, max_retries=5,
+                 retry_budget=DEFAULT_RETRY_BUDGET, budget_refill=0.1,
+                 base_delay=0.5, max_delay=30.0, cooldown=1.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.bucket = TokenBucket(rate, burst=burst, clock=clock, sleep=sleep)
+        self._max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget
+        self.budget_refill = budget_refill
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.cooldown = cooldown
+        self._clock = clock
+        self._sleep = sleep
+        self._condition = threading.Condition()
+        self._limit = float(max_concurrency)
+        self._in_flight = 0
+        self._budget = float(retry_budget)
+        self._last_decrease = None
+        self._counters = dict(requests=0, throttled=0, retries=0,
+                              exhausted=0, waited=0.0)
+
+    @property
+    def rate(self):
+        """Requests per second allowed by the token bucket."""
+        return self.bucket.rate
+
+    @rate.setter
+    def rate(self, rate):
+        self.bucket.rate = rate
+        self.bucket.burst = max(1, rate or 1)
+
+    @property
+    def max_concurrency(self):
+        """The most requests allowed in flight."""
+        return self._max_concurrency
+
+    @max_concurrency.setter
+    def max_concurrency(self, max_concurrency):
+        with self._condition:
+            if max_concurrency == self._max_concurrency:
+                return
+            self._max_concurrency = max_concurrency
+            self._limit = float(max_concurrency)
+            self._condition.notify_all()
+
+    @property
+    def limit(self):
+        """The current number of requests allowed in flight."""
+        with self._condition:
+            return max(1, int(self._limit))
+
+    def run(self, func):
+        """Send a request under the rate and concurrency limits.
+
+        Args:
+            func: A function without arguments that sends the request and
+                  raises an exception with a `response` on HTTP errors.
+        Returns:
+            The result of func.
+
+        """
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                result = func()
+            except Exception as error:
+                self._release()
+                if http_status(error) not in THROTTLED_STATUSES:
+                    raise
+                self._throttled()
+                if attempt >= self.max_retries or not self._spend_retry():
+                    self._count('exhausted')
+                    LOGGER.warning(f"Giving up on a throttled request after {attempt + 1} attempts.") # pylint: disable=line-too-long
+                    raise
+                attempt += 1
+                delay = _retry_after(error)
+                if delay is None:
+                    delay = random.uniform(0, min(self.max_delay,
+                                                  self.base_delay * 2 ** attempt)) # pylint: disable=line-too-long
+                LOGGER.debug(f"Throttled, retrying in {delay:.2f}s.")
+                self._count('waited', delay)
+                self._sleep(delay)
+            else:
+                self._release(succeeded=True)
+                return result
+
+    def retry_policy(self, retry_policy=None):
+        """Get a synapseclient retry policy that leaves throttling to us.
+
+        Without this, synapseclient retries throttled requests on its own
+        before they reach the scheduler, and the retries of concurrent
+        calls collide.
+
+        """
+        # pylint: disable=import-outside-toplevel
+        from synapseclient.core.retry import DEFAULT_RETRY_STATUS_CODES
+
+        policy = dict(retry_policy or {})
+        policy['retry_status_codes'] = [
+            status for status in policy.get('retry_status_codes',
+                                            DEFAULT_RETRY_STATUS_CODES)
+            if status not in THROTTLED_STATUSES]
+        return policy
+
+    def counters(self):
+        """Get the counts of requests, throttled responses and retries.
+
+        Returns:
+            A dictionary with the number of `requests` sent, of `throttled`
+            responses, of `retries`, of requests that failed because
+            retries were `exhausted`, the seconds `waited` for tokens,
+            slots and backoff, the current concurrency `limit` and the
+            remaining retry `budget`.
+
+        """
+        with self._condition:
+            return dict(self._counters,
+                        waited=round(self._counters['waited'], 3),
+                        limit=max(1, int(self._limit)),
+                        budget=round(self._budget, 1))
+
+    def _count(self, name, value=1):
+        with self._condition:
+            self._counters[name] += value
+
+    def _acquire(self):
+        start = self._clock()
+        with self._condition:
+            while self._in_flight >= max(1, int(self._limit)):
+                self._condition.wait()
+            self._in_flight += 1
+        self.bucket.acquire()
+        with self._condition:
+            self._counters['requests'] += 1
+            self._counters['waited'] += self._clock() - start
+
+    def _release(self, succeeded=False):
+        with self._condition:
+            self._in_flight -= 1
+            if succeeded:
+                self._limit = min(self._max_concurrency,
+                                  self._limit + 1 / self._limit)
+                self._budget = min(self.retry_budget,
+                                   self._budget + self.budget_refill)
+            self._condition.notify_all()
+
+    def _throttled(self):
+        with self._condition:
+            self._counters['throttled'] += 1
+            now = self._clock()
+            if (self._last_decrease is None or
+                    now - self._last_decrease >= self.cooldown):
+                self._limit = max(1.0, self._limit / 2)
+                self._last_decrease = now
+                LOGGER.debug(f"Throttled, lowering concurrency to {int(self._limit)}.") # pylint: disable=line-too-long
+
+    def _spend_retry(self):
+        with self._condition:
+            if self._budget < 1:
+                return False
+            self._budget -= 1
+            self._counters['retries'] += 1
+            return True
+
+
+SCHEDULER = Scheduler()
@@ -0,0 +1,94 @@
+"""On-disk cache of Synapse login sessions.
+
+"""
+
+import json
+import logging
+import os
+import stat
+import tempfile
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+DEFAULT_SESSION_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache",
+                                          "kirallymanager", "session.json")
+DEFAULT_SESSION_TTL = 12 * 60 * 60
+
+
+class SessionCache:
+    """Credentials of the last login, kept in a file only the user can read.
+
+    Sessions are stored per key (the Synapse configuration file they were
+    made with) along with the user name, the kind of credential ('apiKey'
+    or 'authToken') and an expiry time. Expired sessions and files other
+    users can read are ignored.
+
+    """
+
+    def __init__(self, path=DEFAULT_SESSION_CACHE_PATH,
+                 ttl=DEFAULT_SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        """Get the cached session of a key.
+
+        Returns:
+            A dictionary with the `username`, `kind` and `secret` of the
+            session, or None if there is no usable session.
+
+        """
+        if not self.ttl:
+            return None
+
+        with self._lock:
+            session = self._read().get(key)
+
+        if session is None or session.get('expires', 0) < time.time():
+            return None
+        return session
+
+    def save(self, key, username, kind, secret):
+        """Cache the credentials of a login for `ttl` seconds."""
+        if not self.ttl:
+            return
+
+        with self._lock:
+            sessions = self._read()
+            sessions[key] = dict(username=username, kind=kind, secret=secret,
+                                 expires=time.time() + self.ttl)
+            self._write(sessions)
+
+    def clear(self, key=None):
+        """Forget the session of a key, or all sessions if no key is given."""
+        with self._lock:
+            sessions = self._read() if key is not None else {}
+            sessions.pop(key, None)
+            self._write(sessions)
+
+    def _read(self):
+        try:
+            mode = os.stat(self.path).st_mode
+            if mode & (stat.S_IRWXG | stat.S_IRWXO):
+                LOGGER.warning(f"Ignoring {self.path}, it can be read by other users.") # pylint: disable=line-too-long
+                return {}
+            with open(self.path) as session_file:
+                return json.load(session_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, sessions):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # mkstemp creates the file readable and writable by the user only.
+        handle, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(handle, "w") as tmp_file:
+            json.dump(sessions, tmp_file)
+        os.replace(tmp_path, self.path)
+
+
+SESSIONS = SessionCache()
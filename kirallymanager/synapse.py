@@ -12,11 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
 import logging
+import os
 
 import synapseclient
+from synapseclient.core.credentials.cred_data import (
+    SynapseApiKeyCredentials, SynapseAuthTokenCredentials)
+from synapseclient.core.exceptions import SynapseHTTPError
 
 from .param_store import ParamStore
+from .rest import UNAUTHORIZED, http_status
+from .scheduler import SCHEDULER
+from .session import SESSIONS
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
@@ -64,16 +72,127 @@ class Synapse:
     def client(cls, *args, **kwargs):
         """
         Gets a logged in instance of the synapseclient.
+
+        A session cached by an earlier process is reused without logging
+        in, until it expires or the server rejects it.
         """
         if cls._synapse_client is None:
             LOGGER.debug("Getting a new Synapse client.")
-            cls._synapse_client = synapseclient.Synapse(*args, **kwargs)
-            try:
-                cls._synapse_client.login(silent=True)
-            except Exception as e:
-                syn_user = ParamStore.SYNAPSE_USERNAME()
-                syn_pass = ParamStore.SYNAPSE_PASSWORD()
-                cls._synapse_client.login(syn_user, syn_pass, silent=True)
+            client = _SessionClient(*args, **kwargs)
+            client.session_key = os.path.abspath(os.path.expanduser(
+                kwargs.get('configPath', synapseclient.client.CONFIG_FILE)))
+            if not cls._resume_session(client):
+                cls._login(client)
+            cls._synapse_client = client
 
         LOGGER.debug("Already have a Synapse client, returning it.")
         return cls._synapse_client
+
+    @classmethod
+    def _login(cls, client):
+        """
+        Logs in and caches the session.
+        """
+        try:
+            client.login(silent=True)
+        except Exception as e:
+            if not (os.environ.get('SYNAPSE_USERNAME') and os.environ.get('SYNAPSE_PASSWORD')):
+                try:
+                    # Load both credentials from SSM in one request.
+                    ParamStore.prefetch()
+                except Exception as prefetch_error:
+                    LOGGER.debug(f"Could not prefetch SSM parameters: {prefetch_error}")
+            syn_user = ParamStore.SYNAPSE_USERNAME()
+            syn_pass = ParamStore.SYNAPSE_PASSWORD()
+            client.login(syn_user, syn_pass, silent=True)
+
+        credentials = client.credentials
+        kind = 'authToken' if isinstance(credentials, SynapseAuthTokenCredentials) else 'apiKey'
+        SESSIONS.save(client.session_key, credentials.username, kind,
+                      credentials.secret)
+        client.resumed_session = False
+
+    @classmethod
+    def _resume_session(cls, client):
+        """
+        Uses the cached session, if any, without contacting Synapse.
+        """
+        session = SESSIONS.load(client.session_key)
+        if session is None:
+            return False
+
+        LOGGER.debug(f"Reusing the cached session of {session['username']}.")
+        if session['kind'] == 'authToken':
+            client.credentials = SynapseAuthTokenCredentials(
+                session['secret'], session['username'])
+        else:
+            client.credentials = SynapseApiKeyCredentials(
+                session['secret'], session['username'])
+        client.resumed_session = True
+        return True
+
+    @classmethod
+    def wrap(cls, layer):
+        """
+        Wraps the client in a layer, e.g. a Profiler, so every later call
+        to client() returns the wrapped client.
+        """
+        cls._synapse_client = layer(cls.client())
+        return cls._synapse_client
+
+
+    @classmethod
+    @contextlib.contextmanager
+    def layers(cls):
+        """
+        Removes the layers wrapped around the client in a block when the
+        block ends, so a long-running process can wrap the client per
+        command.
+        """
+        client = cls.client()
+        try:
+            yield client
+        finally:
+            cls._synapse_client = client
+
+
+class _SessionClient(synapseclient.Synapse):
+    """
+    A Synapse client that sends every request through the shared scheduler,
+    and logs in again if the server rejects a resumed session, and then
+    retries the request.
+    """
+
+    session_key = None
+    resumed_session = False
+    scheduler = SCHEDULER
+
+    def _rest_call(self, method, uri, data, endpoint, headers, retryPolicy,
+                   requests_session, **kwargs):
+        try:
+            return self._scheduled_rest_call(method, uri, data, endpoint,
+                                             headers, retryPolicy,
+                                             requests_session, **kwargs)
+        except SynapseHTTPError as error:
+            if not self.resumed_session or http_status(error) != UNAUTHORIZED:
+                raise
+            LOGGER.info("The cached Synapse session was rejected, logging in again.")
+            SESSIONS.clear(self.session_key)
+            # Logging in makes REST calls of its own, which must fail
+            # instead of logging in again.
+            self.resumed_session = False
+            Synapse._login(self)
+            return self._scheduled_rest_call(method, uri, data, endpoint,
+                                             headers, retryPolicy,
+                                             requests_session, **kwargs)
+
+    def _scheduled_rest_call(self, method, uri, data, endpoint, headers,
+                             retryPolicy, requests_session, **kwargs):
+        if self.scheduler is None:
+            return super()._rest_call(method, uri, data, endpoint, headers,
+                                      retryPolicy, requests_session, **kwargs)
+        retryPolicy = self.scheduler.retry_policy(retryPolicy)
+        return self.scheduler.run(
+            lambda: super(_SessionClient, self)._rest_call(
+                method, uri, data, endpoint, headers, retryPolicy,
+                requests_session, **kwargs))
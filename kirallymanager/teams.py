@@ -0,0 +1,110 @@
+"""Index of team names to team IDs.
+
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from .rest import get_paginated
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+DEFAULT_TEAM_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".cache",
+                                       "kirallymanager", "teams.json")
+DEFAULT_TEAM_INDEX_TTL = 24 * 60 * 60
+
+
+class TeamIndex:
+    """Exact team names to IDs for the teams of the logged in user.
+
+    The index is filled from one paginated listing of the user's teams,
+    which include every team the user created, and kept in a file by user
+    name so later runs do not list them again for `ttl` seconds. Teams
+    created in this process are added with `add`.
+
+    Only teams of the user are in the index, so a name that is not found
+    may still be taken by a team of someone else; `team_id` can be called
+    with `refresh=True` when creating a team fails.
+
+    """
+
+    def __init__(self, path=DEFAULT_TEAM_INDEX_PATH,
+                 ttl=DEFAULT_TEAM_INDEX_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.RLock()
+
+    def team_id(self, syn, name, refresh=False):
+        """Get the ID of a team by its exact name.
+
+        Args:
+            syn: A logged in synapseclient.Synapse object.
+            name: The team name.
+            refresh: List the teams again, even if the index is fresh.
+        Returns:
+            The team ID as a string, or None if the user has no such team.
+
+        """
+        with self._lock:
+            return self._load(syn, refresh=refresh).get(name)
+
+    def add(self, syn, team):
+        """Record a team created by the user."""
+        with self._lock:
+            self._load(syn)[team['name']] = str(team['id'])
+            self._save(syn.username)
+
+    def clear(self):
+        """Forget all indexed teams, here and on disk."""
+        with self._lock:
+            self._entries = {}
+            self._write({})
+
+    def _load(self, syn, refresh=False):
+        username = syn.username
+        if not refresh and username in self._entries:
+            return self._entries[username]['teams']
+
+        entry = self._read().get(username)
+        if (refresh or entry is None or
+                time.time() - entry.get('listed', 0) >= self.ttl):
+            owner_id = (entry or {}).get('owner_id') or str(
+                syn.restGET("/userProfile")['ownerId'])
+            LOGGER.debug(f"Listing the teams of {username}.")
+            teams = {team['name']: str(team['id']) for team in
+                     get_paginated(syn, f"/user/{owner_id}/team")}
+            self._entries[username] = dict(owner_id=owner_id,
+                                           listed=time.time(), teams=teams)
+            self._save(username)
+        else:
+            self._entries[username] = entry
+        return self._entries[username]['teams']
+
+    def _save(self, username):
+        indexes = self._read()
+        indexes[username] = self._entries[username]
+        self._write(indexes)
+
+    def _read(self):
+        try:
+            with open(self.path) as index_file:
+                return json.load(index_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, indexes):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        handle, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(handle, "w") as tmp_file:
+            json.dump(indexes, tmp_file)
+        os.replace(tmp_path, self.path)
+
+
+TEAMS = TeamIndex()
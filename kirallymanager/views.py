@@ -0,0 +1,214 @@
+"""Updates of Synapse entity view scopes.
+
+"""
+
+import contextvars
+import logging
+import threading
+import time
+
+from .rest import PRECONDITION_FAILED, http_status
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+DEFAULT_REFRESH_TIMEOUT = 600
+
+
+def add_to_view_scope(viewschema, scope_ids):
+    """Adds Synapse containers to the scope of a view.
+
+    View scopes should be a set, not an array.
+    This function removes duplicates.
+
+    Args:
+        viewschema: A Synapse View Schema object.
+        scope_ids: A list of scope IDs.
+    Returns:
+        Nothing.
+
+    """
+    existing_scope_ids = set(viewschema.properties.scopeIds)
+    existing_scope_ids.update([x.replace("syn", "") for x in scope_ids])
+    viewschema.properties.scopeIds = list(existing_scope_ids)
+
+
+class ViewScopeAccumulator:
+    """Collect view scope additions and store each view once.
+
+    Scope additions are collected with `add` over a whole provisioning run.
+    `apply` then fetches each view, adds all of its new scopes and stores it
+    once. The store is checked against the view's etag; if the view changed
+    in the meantime it is fetched again and the additions merged again.
+
+    """
+
+    def __init__(self, syn, max_attempts=5):
+        self._syn = syn
+        self.max_attempts = max_attempts
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, view_id, scope_ids):
+        """Queue containers to be added to the scope of a view.
+
+        Args:
+            view_id: Synapse ID of an entity view.
+            scope_ids: A list of container Synapse IDs.
+
+        """
+        with self._lock:
+            self._pending.setdefault(view_id, set()).update(scope_ids)
+
+    def apply(self):
+        """Store every view with queued scope additions.
+
+        Returns:
+            A dictionary of view ID to the list of container IDs that
+            were added to it.
+
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        for view_id, scope_ids in pending.items():
+            self._apply(view_id, sorted(scope_ids))
+
+        return {view_id: sorted(scope_ids)
+                for view_id, scope_ids in pending.items()}
+
+    def _apply(self, view_id, scope_ids):
+        for attempt in range(1, self.max_attempts + 1):
+            view = self._syn.get(view_id)
+            existing_scope_ids = set(view.properties.scopeIds)
+            add_to_view_scope(view, scope_ids)
+            if set(view.properties.scopeIds) == existing_scope_ids:
+                LOGGER.debug(f"View {view_id} already includes {scope_ids}.")
+                return view
+
+            try:
+                view = self._syn.store(view)
+                LOGGER.debug(f"Added {scope_ids} to the scope of {view_id}.")
+                return view
+            except Exception as exception: # pylint: disable=broad-except
+                # Synapse rejects a view whose etag is stale.
+                if http_status(exception) != PRECONDITION_FAILED or attempt == self.max_attempts: # pylint: disable=line-too-long
+                    raise
+                LOGGER.info(f"View {view_id} changed while updating, merging again.") # pylint: disable=line-too-long
+
+        return None
+
+
+class ViewRefresher:
+    """Poll views in the background until new entities show up in them.
+
+    Each watched view is polled from its own daemon thread with exponential
+    backoff, so callers are not blocked. The first poll also prompts
+    Synapse to bring the view up to date. Use `wait` to block until the
+    views are consistent or a timeout passes.
+
+    """
+
+    def __init__(self, syn, timeout=DEFAULT_REFRESH_TIMEOUT,
+                 initial_delay=1.0, max_delay=60.0):
+        self._syn = syn
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.consistency_seconds = {}
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def watch(self, view_id, entity_ids, column='id'):
+        """Start polling a view until it has rows for all entity IDs.
+
+        Args:
+            view_id: Synapse ID of an entity view.
+            entity_ids: A list of Synapse IDs expected in the view.
+            column: The view column holding the IDs.
+
+        """
+        self._start(view_id, self._poll, view_id, set(entity_ids), column,
+                    time.monotonic())
+
+    def refresh(self, view_id):
+        """Prompt Synapse to update a view in the background.
+
+        For views where new entities may never have rows, such as a file
+        view scoped to new, empty projects. The view is queried once and
+        not polled.
+
+        Args:
+            view_id: Synapse ID of an entity view.
+
+        """
+        self._start(view_id, self._prompt, view_id)
+
+    def _start(self, view_id, func, *args):
+        thread = threading.Thread(target=contextvars.copy_context().run,
+                                  args=(func,) + args,
+                                  name=f"refresh-{view_id}", daemon=True)
+        with self._lock:
+            self._threads.append(thread)
+        thread.start()
+
+    def wait(self, timeout=None):
+        """Wait for the watched views.
+
+        Args:
+            timeout: Seconds to wait at most. If None, wait until every view
+                     is consistent or has reached the refresher's timeout.
+        Returns:
+            True if every watched view was consistent in time.
+
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            threads = list(self._threads)
+
+        for thread in threads:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic()) # pylint: disable=line-too-long
+            thread.join(remaining)
+
+        with self._lock:
+            return (not any(thread.is_alive() for thread in threads)
+                    and None not in self.consistency_seconds.values())
+
+    def _query(self, view_id, missing, column):
+        id_list = ", ".join(f"'{entity_id}'" for entity_id in sorted(missing)) # pylint: disable=line-too-long
+        try:
+            results = self._syn.tableQuery(
+                f"select {column} from {view_id} where {column} in ({id_list})", # pylint: disable=line-too-long
+                resultsAs="rowset")
+            return missing - {row['values'][0] for row in results}
+        except Exception as exception: # pylint: disable=broad-except
+            LOGGER.warning(f"Could not query view {view_id}: {exception}")
+            return missing
+
+    def _prompt(self, view_id):
+        try:
+            self._syn.tableQuery(f"select id from {view_id} limit 1",
+                                 resultsAs="rowset")
+        except Exception as exception: # pylint: disable=broad-except
+            LOGGER.warning(f"Could not query view {view_id}: {exception}")
+
+    def _poll(self, view_id, missing, column, start):
+        delay = self.initial_delay
+        missing = self._query(view_id, missing, column)
+
+        while True:
+            elapsed = time.monotonic() - start
+            if not missing:
+                LOGGER.info(f"View {view_id} is consistent after {elapsed:.1f}s.") # pylint: disable=line-too-long
+                break
+            if elapsed + delay > self.timeout:
+                LOGGER.warning(f"View {view_id} still missing {sorted(missing)} after {elapsed:.1f}s.") # pylint: disable=line-too-long
+                elapsed = None
+                break
+
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_delay)
+            missing = self._query(view_id, missing, column)
+
+        with self._lock:
+            self.consistency_seconds[view_id] = elapsed
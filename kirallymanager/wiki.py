@@ -0,0 +1,97 @@
+"""Wiki templates for rally and sprint projects.
+
+"""
+
+import functools
+import json
+import logging
+import os
+import re
+import tempfile
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+DEFAULT_TEMPLATE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache",
+                                          "kirallymanager", "templates")
+
+
+@functools.lru_cache(maxsize=32)
+def _placeholder_pattern(placeholders):
+    # Longest first, so a placeholder is never shadowed by its own prefix.
+    return re.compile("|".join(re.escape(placeholder) for placeholder
+                               in sorted(placeholders, key=len, reverse=True)))
+
+
+def render_template(markdown, replacements):
+    """Substitute all placeholders of a wiki template in a single pass.
+
+    Args:
+        markdown: The template markdown.
+        replacements: A dictionary of placeholder text to its replacement,
+                      e.g. {'RALLY_ID': '1', 'id=0000000': 'id=3345678'}.
+    Returns:
+        The rendered markdown.
+
+    """
+    if not replacements:
+        return markdown
+    pattern = _placeholder_pattern(tuple(sorted(replacements)))
+    return pattern.sub(lambda match: replacements[match.group(0)], markdown)
+
+
+class TemplateCache:
+    """Local on-disk cache of wiki template files.
+
+    Templates are stored by entity ID and version. Each lookup makes one
+    lightweight entity request to compare the etag, and only downloads the
+    file again if the template changed.
+
+    """
+
+    def __init__(self, cache_dir=DEFAULT_TEMPLATE_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def markdown(self, syn, entity_id):
+        """Get the markdown of a template file entity.
+
+        Args:
+            syn: A logged in synapseclient.Synapse object.
+            entity_id: Synapse ID of the template file.
+        Returns:
+            The template markdown as a string.
+
+        """
+        header = syn.restGET(f"/entity/{entity_id}")
+        base = os.path.join(self.cache_dir,
+                            f"{entity_id}.{header.get('versionNumber', 1)}")
+
+        try:
+            with open(f"{base}.json") as metadata_file:
+                cached_etag = json.load(metadata_file).get('etag')
+            if cached_etag == header['etag']:
+                with open(f"{base}.md") as template_file:
+                    LOGGER.debug(f"Using cached template {entity_id}.")
+                    return template_file.read()
+        except (OSError, ValueError):
+            pass
+
+        template = syn.get(entity_id)
+        with open(template.path) as template_file:
+            markdown = template_file.read()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._write(f"{base}.md", markdown)
+        self._write(f"{base}.json", json.dumps({'etag': template.etag}))
+
+        return markdown
+
+    def _write(self, path, content):
+        """Write a file atomically, so concurrent readers never see part of it."""
+        handle, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(handle, "w") as tmp_file:
+            tmp_file.write(content)
+        os.replace(tmp_path, path)
+
+
+TEMPLATES = TemplateCache()
@@ -0,0 +1,87 @@
+"""Fixtures shared by the tests that run against the fake Synapse.
+
+"""
+
+import os
+import runpy
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEMBERS = [3372480, 3341174, 3482999, 3377467]
+
+
+@pytest.fixture(name="world")
+def fixture_world(monkeypatch, tmp_path):
+    """A fake Synapse with a root project, its views, templates and teams.
+
+    Yields the fake and a configuration pointing at its entities. Set
+    KIRALLYMANAGER_BENCHMARK_LATENCY to a per-call latency in seconds.
+
+    """
+    synapseclient = pytest.importorskip("synapseclient")
+    pytest.importorskip("pandas")
+    # pylint: disable=import-outside-toplevel
+    from fake_synapse import FakeSynapse
+
+    from kirallymanager import configuration, manager
+    from kirallymanager.cache import ROOT_METADATA
+    from kirallymanager.folders import FOLDER_PATHS
+    from kirallymanager.synapse import Synapse
+    from kirallymanager.teams import TeamIndex
+    from kirallymanager.wiki import TemplateCache
+
+    syn = FakeSynapse(
+        latency=float(os.environ.get("KIRALLYMANAGER_BENCHMARK_LATENCY", "0")))
+
+    root = syn.create(synapseclient.Project("ki Rallies"))
+    views = {}
+    for name, view_type in [('Rallies', 'project'), ('Sprints', 'project'),
+                            ('All Files', 'file')]:
+        views[name] = syn.create(synapseclient.EntityViewSchema(
+            name=name, parent=root, scopes=[], addDefaultViewColumns=False,
+            includeEntityTypes=[getattr(synapseclient.EntityViewType,
+                                        view_type.upper())]))
+    syn.entities[root.id]['annotations'].update(
+        rallyTableId=[views['Rallies'].id], sprintTableId=[views['Sprints'].id])
+
+    rally_template = syn.create(
+        synapseclient.File(name="rally.md", parent=root),
+        content="# ki Rally RALLY_ID\n\n[team](#!Team:id=0000000)\n")
+    sprint_template = syn.create(
+        synapseclient.File(name="sprint.md", parent=root),
+        content="[rally](#!Team:id=123) [sprint](#!Team:id=456)\n")
+    derived = syn.create(synapseclient.Project("KiData_MNCH_Derived"))
+    admin_team = syn.store(synapseclient.Team(name="ki Rally Admins"))
+
+    config = dict(configuration.DEFAULT_CONFIG,
+                  root_project_id=root.id,
+                  rally_table_id=views['Rallies'].id,
+                  sprint_table_id=views['Sprints'].id,
+                  allFilesSchemaId=views['All Files'].id,
+                  derivedDataProjectId=derived.id,
+                  wikiRallyTemplateId=rally_template.id,
+                  wiki_master_template_id=sprint_template.id,
+                  rally_admin_team_id=admin_team.id,
+                  defaultRallyTeamMembers=MEMBERS,
+                  defaultPowerUserTeamMembers=MEMBERS[:2],
+                  defaultDataTeamMembers=MEMBERS[2:])
+
+    monkeypatch.setattr(Synapse, "_synapse_client", syn)
+    monkeypatch.setattr(manager, "TEMPLATES", TemplateCache(str(tmp_path)))
+    monkeypatch.setattr(manager, "TEAMS",
+                        TeamIndex(str(tmp_path / "teams.json")))
+    ROOT_METADATA.invalidate()
+    FOLDER_PATHS.clear()
+    syn.reset_calls()
+    yield syn, config
+    ROOT_METADATA.invalidate()
+    FOLDER_PATHS.clear()
+
+
+@pytest.fixture(name="cli")
+def fixture_cli():
+    """The functions of the rallymanager script, without running it."""
+    return runpy.run_path(os.path.join(ROOT, "bin", "rallymanager"),
+                          run_name="rallymanager")
@@ -0,0 +1,481 @@
+"""In-process fake of the Synapse client for offline tests and benchmarks.
+
+"""
+
+import collections
+import copy
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+import synapseclient
+from synapseclient.core.exceptions import SynapseHTTPError
+
+from kirallymanager.profiling import endpoint
+
+USER_ID = 1000
+
+ADMIN_PERMISSIONS = ['READ', 'CREATE', 'UPDATE', 'DELETE', 'DOWNLOAD',
+                     'CHANGE_PERMISSIONS', 'CHANGE_SETTINGS', 'MODERATE']
+TEAM_MANAGER_PERMISSIONS = ['SEND_MESSAGE', 'READ', 'UPDATE',
+                            'TEAM_MEMBERSHIP_UPDATE', 'DELETE']
+
+_QUERY = re.compile(r"select\s+(?P<columns>.+?)\s+from\s+(?P<view>syn\d+)"
+                    r"(?:\s+where\s+(?P<where>.+?))?"
+                    r"(?:\s+limit\s+(?P<limit>\d+))?$", re.IGNORECASE)
+_CONDITION = re.compile(r"^\s*(?P<column>\w+)\s*(?:=\s*(?P<value>'[^']*'|[^\s]+)"
+                        r"|in\s*\((?P<values>[^)]*)\))\s*$", re.IGNORECASE)
+
+
+def http_error(status, message=""):
+    """Get a SynapseHTTPError with a response of the given status."""
+    response = requests.Response()
+    response.status_code = status
+    return SynapseHTTPError(f"{status} Client Error: {message}",
+                            response=response)
+
+
+def _unwrap(condition):
+    """Remove the parentheses around a whole condition."""
+    condition = condition.strip()
+    if condition.startswith("(") and condition.endswith(")"):
+        return condition[1:-1]
+    return condition
+
+
+def _column_type(value):
+    if isinstance(value, list):
+        return 'STRING_LIST'
+    if isinstance(value, bool):
+        return 'BOOLEAN'
+    if isinstance(value, int):
+        return 'INTEGER'
+    if isinstance(value, float):
+        return 'DOUBLE'
+    return 'STRING'
+
+
+def _literal(value):
+    value = value.strip()
+    if value.startswith("'"):
+        return value[1:-1]
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+class QueryResult:
+    """Rowset results of a fake table query."""
+
+    def __init__(self, headers, rows):
+        self.headers = headers
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def asDataFrame(self):  # pylint: disable=invalid-name
+        """Get the results as a pandas data frame."""
+        import pandas  # pylint: disable=import-outside-toplevel
+        return pandas.DataFrame([row['values'] for row in self.rows],
+                                columns=[header.name
+                                         for header in self.headers])
+
+
+class FakeSynapse:
+    """Stand-in for synapseclient.Synapse that keeps Synapse state in memory.
+
+    Implements the client methods and REST endpoints used by the manager:
+    entities, /entity/child, teams, team membership and invitations,
+    entity and team ACLs, wikis, forums and threads, and table queries on
+    entity views. Each client call sleeps for `latency` seconds and is
+    counted in `calls` under the same endpoint names the profiler uses.
+
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.username = "fake-user"
+        self._lock = threading.RLock()
+        self._ids = itertools.count(10000)
+        self.entities = {}
+        self.acls = {}
+        self.teams = {}
+        self.team_members = collections.defaultdict(list)
+        self.team_acls = {}
+        self.invitations = collections.defaultdict(list)
+        self.wikis = {}
+        self.forums = {}
+        self.threads = collections.defaultdict(list)
+        self._files = tempfile.mkdtemp(prefix="fake-synapse-")
+
+    # Setup helpers, not counted as calls.
+
+    def create(self, entity, entity_id=None, content=None):
+        """Add an entity, optionally with a fixed ID or file content."""
+        with self._lock:
+            return self._create(entity, entity_id=entity_id, content=content)
+
+    def reset_calls(self):
+        """Forget the counted calls."""
+        self.calls.clear()
+
+    def total_calls(self):
+        """Get the number of calls made."""
+        return sum(self.calls.values())
+
+    # Client methods.
+
+    def get(self, entity, downloadFile=True, **kwargs):  # pylint: disable=invalid-name,unused-argument
+        self._call('get')
+        with self._lock:
+            return self._entity(self._entity_id(entity))
+
+    def store(self, obj, createOrUpdate=True, **kwargs):  # pylint: disable=invalid-name,unused-argument
+        self._call('store')
+        with self._lock:
+            if isinstance(obj, synapseclient.Team):
+                return self._store_team(obj)
+            if isinstance(obj, synapseclient.Wiki):
+                return self._store_wiki(obj)
+            if obj.get('id') is None:
+                return self._create(obj, create_or_update=createOrUpdate)
+            return self._update(obj)
+
+    def getChildren(self, parent, includeTypes=None, **kwargs):  # pylint: disable=invalid-name,unused-argument
+        self._call('getChildren')
+        parent_id = self._entity_id(parent)
+        with self._lock:
+            children = [dict(name=record['properties']['name'], id=entity_id,
+                             type=record['properties']['concreteType'])
+                        for entity_id, record in sorted(self.entities.items())
+                        if record['properties'].get('parentId') == parent_id]
+        return iter(children)
+
+    def getTeam(self, id):  # pylint: disable=invalid-name,redefined-builtin
+        self._call('getTeam')
+        with self._lock:
+            team_id = str(id.id if isinstance(id, synapseclient.Team) else id)
+            if team_id not in self.teams:
+                team_id = next((tid for tid, team in self.teams.items()
+                                if team['name'] == team_id), None)
+            if team_id is None:
+                raise ValueError(f"Can't find team \"{id}\"")
+            return synapseclient.Team(**self.teams[team_id])
+
+    def getWiki(self, owner, subpageId=None, version=None):  # pylint: disable=invalid-name,unused-argument
+        self._call('getWiki')
+        with self._lock:
+            wiki = self.wikis.get(self._entity_id(owner))
+            if wiki is None:
+                raise http_error(404, "Wiki not found")
+            return synapseclient.Wiki(**wiki)
+
+    def tableQuery(self, query, resultsAs="csv", **kwargs):  # pylint: disable=invalid-name,unused-argument
+        self._call('tableQuery')
+        match = _QUERY.match(query.strip())
+        if match is None:
+            raise http_error(400, f"Unsupported query: {query}")
+
+        with self._lock:
+            rows = self._view_rows(match.group('view'))
+
+        conditions = [_CONDITION.match(_unwrap(condition)) for condition in
+                      re.split(r"\s+and\s+", match.group('where') or "",
+                               flags=re.IGNORECASE) if condition.strip()]
+        for condition in conditions:
+            if condition is None:
+                raise http_error(400, f"Unsupported query: {query}")
+            if condition.group('values') is not None:
+                values = {_literal(value) for value in
+                          condition.group('values').split(",")}
+            else:
+                values = {_literal(condition.group('value'))}
+            values = {str(value) for value in values}
+            rows = [row for row in rows
+                    if str(row.get(condition.group('column'))) in values]
+
+        if match.group('limit') is not None:
+            rows = rows[:int(match.group('limit'))]
+
+        columns = [column.strip() for column in
+                   match.group('columns').split(",")]
+        if columns == ["*"]:
+            columns = sorted({column for row in rows for column in row})
+        headers = [synapseclient.table.SelectColumn(
+            name=column, columnType=_column_type(
+                next((row[column] for row in rows
+                      if row.get(column) is not None), None)))
+                   for column in columns]
+        return QueryResult(headers, [
+            {'rowId': index, 'values': [row.get(column) for column in columns]}
+            for index, row in enumerate(rows)])
+
+    def restGET(self, uri, **kwargs):  # pylint: disable=invalid-name,unused-argument
+        self._call('restGET', uri)
+        with self._lock:
+            return copy.deepcopy(self._route('GET', uri, None))
+
+    def restPOST(self, uri, body=None, **kwargs):  # pylint: disable=invalid-name,unused-argument
+        self._call('restPOST', uri)
+        with self._lock:
+            return copy.deepcopy(self._route('POST', uri, json.loads(body)))
+
+    def restPUT(self, uri, body=None, **kwargs):  # pylint: disable=invalid-name,unused-argument
+        self._call('restPUT', uri)
+        with self._lock:
+            return copy.deepcopy(self._route('PUT', uri, json.loads(body)))
+
+    # Internals.
+
+    def _call(self, method, *args):
+        self.calls[endpoint(method, *args)] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _next_id(self):
+        return str(next(self._ids))
+
+    @staticmethod
+    def _entity_id(entity):
+        if isinstance(entity, str):
+            return entity
+        return entity['id']
+
+    def _record(self, entity_id):
+        record = self.entities.get(entity_id)
+        if record is None:
+            raise http_error(404, f"Entity {entity_id} does not exist")
+        return record
+
+    def _entity(self, entity_id):
+        record = self._record(entity_id)
+        return synapseclient.Entity.create(
+            properties=copy.deepcopy(record['properties']),
+            annotations=copy.deepcopy(record['annotations']),
+            local_state=dict(record['local_state']))
+
+    def _create(self, entity, entity_id=None, content=None,
+                create_or_update=True):
+        properties = dict(entity.properties)
+        parent_id = properties.get('parentId')
+        existing = next((eid for eid, record in self.entities.items()
+                         if record['properties']['name'] == properties['name']
+                         and record['properties'].get('parentId') == parent_id),
+                        None)
+        if existing is not None:
+            if not create_or_update:
+                raise http_error(409, f"An entity named {properties['name']} already exists") # pylint: disable=line-too-long
+            entity['id'] = existing
+            entity['etag'] = self.entities[existing]['properties']['etag']
+            return self._update(entity)
+
+        entity_id = entity_id or f"syn{self._next_id()}"
+        properties.update(id=entity_id, etag=str(uuid.uuid4()),
+                          versionNumber=1)
+        if 'scopeIds' in properties:
+            properties['scopeIds'] = sorted({str(scope_id).replace("syn", "")
+                                             for scope_id in properties['scopeIds']}) # pylint: disable=line-too-long
+        local_state = {}
+        if content is not None:
+            path = os.path.join(self._files, f"{entity_id}.md")
+            with open(path, "w") as content_file:
+                content_file.write(content)
+            local_state['path'] = path
+
+        self.entities[entity_id] = dict(
+            properties=properties,
+            annotations={key: value if isinstance(value, list) else [value]
+                         for key, value in dict(entity.annotations).items()
+                         if value is not None},
+            local_state=local_state)
+
+        if parent_id is None:
+            self.acls[entity_id] = dict(
+                id=entity_id, etag=str(uuid.uuid4()),
+                resourceAccess=[dict(principalId=USER_ID,
+                                     accessType=ADMIN_PERMISSIONS)])
+        return self._entity(entity_id)
+
+    def _update(self, entity):
+        record = self._record(entity['id'])
+        if entity.get('etag') != record['properties']['etag']:
+            raise http_error(412, "Object has been updated since last retrieved") # pylint: disable=line-too-long
+        properties = dict(entity.properties)
+        properties['etag'] = str(uuid.uuid4())
+        if 'scopeIds' in properties:
+            properties['scopeIds'] = sorted({str(scope_id).replace("syn", "")
+                                             for scope_id in properties['scopeIds']}) # pylint: disable=line-too-long
+        record['properties'] = properties
+        record['annotations'] = {
+            key: value if isinstance(value, list) else [value]
+            for key, value in dict(entity.annotations).items()
+            if value is not None}
+        return self._entity(entity['id'])
+
+    def _store_team(self, team):
+        if any(existing['name'] == team.name
+               for existing in self.teams.values()):
+            raise http_error(409, f"Team {team.name} already exists")
+        team_id = self._next_id()
+        self.teams[team_id] = dict(team, id=team_id, etag=str(uuid.uuid4()))
+        self.team_members[team_id].append(USER_ID)
+        self.team_acls[team_id] = dict(
+            id=team_id, etag=str(uuid.uuid4()),
+            resourceAccess=[dict(principalId=USER_ID,
+                                 accessType=TEAM_MANAGER_PERMISSIONS)])
+        return synapseclient.Team(**self.teams[team_id])
+
+    def _store_wiki(self, wiki):
+        owner_id = wiki['ownerId']
+        stored = dict(wiki, id=self.wikis.get(owner_id, {}).get('id') or
+                      self._next_id(), etag=str(uuid.uuid4()))
+        stored['owner'] = owner_id
+        self.wikis[owner_id] = stored
+        return synapseclient.Wiki(**stored)
+
+    def _benefactor(self, entity_id):
+        while entity_id not in self.acls:
+            entity_id = self._record(entity_id)['properties']['parentId']
+        return entity_id
+
+    def _forum(self, project_id):
+        self._record(project_id)
+        if project_id not in self.forums:
+            self.forums[project_id] = dict(id=self._next_id(),
+                                           projectId=project_id)
+        return self.forums[project_id]
+
+    def _view_rows(self, view_id):
+        view = self._record(view_id)['properties']
+        scope = {f"syn{scope_id}" for scope_id in view.get('scopeIds', [])}
+        rows = []
+        for entity_id, record in sorted(self.entities.items()):
+            properties = record['properties']
+            project_id = entity_id
+            while self.entities[project_id]['properties'].get('parentId'):
+                project_id = self.entities[project_id]['properties']['parentId']
+            if view.get('viewTypeMask') == 1:
+                # File views list the files in their scope.
+                include = (project_id in scope and
+                           properties['concreteType'].endswith(".FileEntity"))
+            else:
+                include = entity_id in scope
+            if include:
+                row = {key: value[0] if value else None
+                       for key, value in record['annotations'].items()}
+                row.update(id=entity_id, name=properties['name'],
+                           projectId=project_id,
+                           parentId=properties.get('parentId'))
+                if view.get('viewTypeMask') == 1:
+                    row.update(modifiedOn=properties.get('modifiedOn'))
+                rows.append(row)
+        return rows
+
+    def _paginated(self, results, query):
+        limit = int(query.get('limit', 50))
+        offset = int(query.get('offset', 0))
+        return dict(results=results[offset:offset + limit],
+                    totalNumberOfResults=len(results))
+
+    def _route(self, method, uri, body):  # pylint: disable=too-many-return-statements,too-many-branches
+        path, _, query_string = uri.partition("?")
+        query = dict(part.split("=", 1) for part in query_string.split("&")
+                     if "=" in part)
+        parts = path.strip("/").split("/")
+
+        if parts[0] == 'entity' and parts[1:] == ['child']:
+            entity_id = next(
+                (eid for eid, record in self.entities.items()
+                 if record['properties']['name'] == body['entityName'] and
+                 record['properties'].get('parentId') == body.get('parentId')),
+                None)
+            if entity_id is None:
+                raise http_error(404, "Entity not found")
+            return dict(id=entity_id)
+
+        if parts[0] == 'entity' and len(parts) == 2 and method == 'GET':
+            properties = self._record(parts[1])['properties']
+            return {key: properties.get(key) for key in
+                    ('id', 'name', 'etag', 'versionNumber', 'concreteType',
+                     'parentId')}
+
+        if parts[0] == 'entity' and parts[2:] == ['benefactor']:
+            return dict(id=self._benefactor(parts[1]))
+
+        if parts[0] == 'entity' and parts[2:] == ['acl']:
+            entity_id = parts[1]
+            self._record(entity_id)
+            if method == 'GET':
+                if entity_id not in self.acls:
+                    raise http_error(404, f"No ACL for {entity_id}")
+                return self.acls[entity_id]
+            if method == 'POST' and entity_id in self.acls:
+                raise http_error(409, f"{entity_id} already has an ACL")
+            if method == 'PUT' and (entity_id not in self.acls or
+                                    body.get('etag') != self.acls[entity_id]['etag']): # pylint: disable=line-too-long
+                raise http_error(412, "ACL has been updated")
+            self.acls[entity_id] = dict(id=entity_id, etag=str(uuid.uuid4()),
+                                        resourceAccess=body['resourceAccess'])
+            return self.acls[entity_id]
+
+        if parts == ['userProfile'] and method == 'GET':
+            return dict(ownerId=str(USER_ID), userName=self.username)
+
+        if parts[0] == 'user' and parts[2:] == ['team'] and method == 'GET':
+            teams = [team for team_id, team in sorted(self.teams.items())
+                     if int(parts[1]) in self.team_members[team_id]]
+            return self._paginated(teams, query)
+
+        if parts[0] == 'teamMembers' and method == 'GET':
+            members = [dict(teamId=parts[1],
+                            member=dict(ownerId=str(member_id)),
+                            isAdmin=False)
+                       for member_id in self.team_members[parts[1]]]
+            return self._paginated(members, query)
+
+        if parts[0] == 'team' and parts[2:] == ['openInvitation']:
+            return self._paginated(self.invitations[parts[1]], query)
+
+        if parts[0] == 'team' and len(parts) == 5 and parts[4] == 'membershipStatus': # pylint: disable=line-too-long
+            return dict(teamId=parts[1], userId=parts[3],
+                        isMember=int(parts[3]) in self.team_members[parts[1]])
+
+        if parts[0] == 'team' and parts[2:] == ['acl']:
+            return self.team_acls[parts[1]]
+
+        if parts == ['team', 'acl'] and method == 'PUT':
+            team_id = str(body['id'])
+            if body.get('etag') != self.team_acls[team_id]['etag']:
+                raise http_error(412, "Team ACL has been updated")
+            self.team_acls[team_id] = dict(body, etag=str(uuid.uuid4()))
+            return self.team_acls[team_id]
+
+        if parts[0] == 'team' and len(parts) == 2 and method == 'GET':
+            return self.teams[parts[1]]
+
+        if parts == ['membershipInvitation'] and method == 'POST':
+            invitation = dict(body, id=self._next_id())
+            self.invitations[str(body['teamId'])].append(invitation)
+            return invitation
+
+        if parts[0] == 'project' and parts[2:] == ['forum']:
+            return self._forum(parts[1])
+
+        if parts == ['thread'] and method == 'POST':
+            thread = dict(body, id=self._next_id(), isDeleted=False)
+            self.threads[str(body['forumId'])].append(thread)
+            return thread
+
+        if parts[0] == 'forum' and parts[2:] == ['threads']:
+            return self._paginated(self.threads[parts[1]], query)
+
+        raise http_error(404, f"No fake for {method} {uri}")
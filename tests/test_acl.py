@@ -0,0 +1,105 @@
+"""Tests for batched ACL updates.
+
+"""
+
+import json
+
+from kirallymanager.acl import AclBatcher, get_access
+
+
+class FakeSynapse:
+    def __init__(self):
+        self.calls = []
+        self.acls = {'syn1': {'id': 'syn1', 'etag': 'a',
+                              'resourceAccess': [{'principalId': 10,
+                                                  'accessType': ['READ']}]}}
+        self.benefactors = {'syn1': 'syn1', 'syn2': 'syn1', 'syn3': 'syn2'}
+
+    def restGET(self, uri):
+        self.calls.append(('GET', uri))
+        entity_id, kind = uri.split("/")[2:4]
+        if kind == "benefactor":
+            return {'id': self.benefactors[entity_id]}
+        return json.loads(json.dumps(self.acls[entity_id]))
+
+    def restPUT(self, uri, body):
+        self.calls.append(('PUT', uri))
+        entity_id = uri.split("/")[2]
+        self.acls[entity_id] = json.loads(body)
+        return self.acls[entity_id]
+
+    def restPOST(self, uri, body):
+        self.calls.append(('POST', uri))
+        entity_id = uri.split("/")[2]
+        self.acls[entity_id] = json.loads(body)
+        self.benefactors[entity_id] = entity_id
+        return self.acls[entity_id]
+
+
+def access(syn, entity_id):
+    return {x['principalId']: sorted(x['accessType'])
+            for x in syn.acls[entity_id]['resourceAccess']}
+
+
+def test_one_update_per_entity():
+    syn = FakeSynapse()
+
+    with AclBatcher(syn) as acl:
+        acl.grant('syn1', 10, ['DOWNLOAD'], overwrite=False)
+        acl.grant({'id': 'syn1'}, "20", ['READ', 'UPDATE'])
+        acl.grant('syn2', 30, ['READ'])
+        acl.grant('syn3', 40, ['READ'])
+
+    assert [call for call in syn.calls if call[0] != 'GET'] == [
+        ('PUT', '/entity/syn1/acl'),
+        ('POST', '/entity/syn2/acl'),
+        ('POST', '/entity/syn3/acl')]
+    assert access(syn, 'syn1') == {10: ['DOWNLOAD', 'READ'],
+                                   20: ['READ', 'UPDATE']}
+    # New local ACLs start from their benefactor's ACL.
+    assert access(syn, 'syn3') == {10: ['DOWNLOAD', 'READ'],
+                                   20: ['READ', 'UPDATE'],
+                                   30: ['READ'], 40: ['READ']}
+    # The ACL just written for syn2 is reused instead of read again.
+    assert ('GET', '/entity/syn2/acl') not in syn.calls
+
+
+def test_overwrite_replaces_access():
+    syn = FakeSynapse()
+
+    with AclBatcher(syn) as acl:
+        acl.grant('syn1', 10, ['DOWNLOAD'])
+
+    assert access(syn, 'syn1') == {10: ['DOWNLOAD']}
+
+
+def test_get_access_reads_the_benefactor_acl():
+    syn = FakeSynapse()
+
+    assert get_access(syn, 'syn2') == {10: {'READ'}}
+    assert syn.calls == [('GET', '/entity/syn2/benefactor'),
+                         ('GET', '/entity/syn1/acl')]
+
+
+class PreconditionFailed(Exception):
+    class response:  # pylint: disable=invalid-name
+        status_code = 412
+
+
+def test_concurrent_update_is_applied_again():
+    syn = FakeSynapse()
+    put = syn.restPUT
+
+    def racing_put(uri, body):
+        # Another client adds a principal first, the first PUT is stale.
+        syn.restPUT = put
+        syn.acls['syn1']['resourceAccess'].append({'principalId': 50,
+                                                   'accessType': ['READ']})
+        raise PreconditionFailed()
+
+    syn.restPUT = racing_put
+
+    with AclBatcher(syn) as acl:
+        acl.grant('syn1', 20, ['READ'])
+
+    assert access(syn, 'syn1') == {10: ['READ'], 20: ['READ'], 50: ['READ']}
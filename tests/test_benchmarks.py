@@ -0,0 +1,181 @@
+"""Offline benchmarks of the rally manager against a fake Synapse.
+
+Each scenario reports its wall time and the number of Synapse calls it
+made, and fails if the calls go over the scenario's budget. Set
+KIRALLYMANAGER_BENCHMARK_LATENCY to a per-call latency in seconds (e.g.
+0.05) to get wall times closer to the real service, and
+KIRALLYMANAGER_BENCHMARK_JSON to a file path to save the results. Run
+with `pytest -s tests/test_benchmarks.py` to see the report.
+
+"""
+
+import io
+import json
+import os
+import time
+
+import pytest
+
+synapseclient = pytest.importorskip("synapseclient")
+pytest.importorskip("pandas")
+
+# pylint: disable=wrong-import-position
+from kirallymanager import manager, provision, reconcile
+from kirallymanager.cache import ROOT_METADATA
+from kirallymanager.entity_cache import EntityCache
+from kirallymanager.synapse import Synapse
+
+LATENCY = float(os.environ.get("KIRALLYMANAGER_BENCHMARK_LATENCY", "0"))
+
+# Maximum number of Synapse calls per scenario. Lower these when a change
+# saves calls, so the savings are kept. Concurrent sprints share the rally
+# folder of the derived data project, so the provisioning budgets allow
+# three calls per sprint for ACL updates that race and are applied again
+# (246 + 12 and 881 + 48).
+BUDGETS = {'create_rally': 23,
+           'create_sprint': 64,
+           'create_sprint cached': 61,
+           'get_sprints 10': 2,
+           'export_sprints 3': 2,
+           'report 3': 3,
+           'provision 1': 85,
+           'provision 4': 258,
+           'provision 16': 929}
+
+RESULTS = []
+
+
+@pytest.fixture(scope="module", autouse=True)
+def report():
+    yield
+    if not RESULTS:
+        return
+    print(f"\n{'scenario':<20} {'calls':>7} {'seconds':>9}  (latency {LATENCY}s)") # pylint: disable=line-too-long
+    for result in RESULTS:
+        print(f"{result['scenario']:<20} {result['calls']:>7} {result['seconds']:>9.3f}") # pylint: disable=line-too-long
+    path = os.environ.get("KIRALLYMANAGER_BENCHMARK_JSON")
+    if path:
+        with open(path, "w") as results_file:
+            json.dump(dict(latency=LATENCY, results=RESULTS), results_file,
+                      indent=2)
+
+
+def measure(syn, scenario, func):
+    """Run a scenario, record its calls and time and check its budget."""
+    ROOT_METADATA.invalidate()
+    syn.reset_calls()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    RESULTS.append(dict(scenario=scenario, calls=syn.total_calls(),
+                        seconds=round(seconds, 4),
+                        endpoints=dict(syn.calls.most_common())))
+    assert syn.total_calls() <= BUDGETS[scenario], syn.calls.most_common()
+    return result
+
+
+def test_create_rally(world):
+    syn, config = world
+
+    rally = measure(syn, 'create_rally',
+                    lambda: manager.create_rally(1, config=config))
+
+    assert rally.annotations['rally'] == [1]
+    assert syn.getWiki(rally).markdown.startswith("# ki Rally 1")
+    assert manager.get_rally(config['root_project_id'], 1).id == rally.id
+
+
+def test_create_sprint(world):
+    syn, config = world
+    manager.create_rally(1, config=config)
+
+    sprint = measure(syn, 'create_sprint',
+                     lambda: manager.create_sprint(1, "a", config=config))
+
+    assert sprint.annotations['sprintNumber'] == ["1a"]
+    assert manager.get_sprint(config['root_project_id'], 1, "a").id == sprint.id
+    # A freshly created sprint needs no reconciling.
+    assert reconcile.plan_sprint(1, "a", config=config) == []
+
+
+def test_create_sprint_with_entity_cache(world, tmp_path):
+    syn, config = world
+    manager.create_rally(1, config=config)
+    cache = Synapse.wrap(lambda client: EntityCache(
+        client, path=str(tmp_path / "entities.sqlite")))
+    # An earlier run fills the entity cache, as measure() starts like a new
+    # process with an empty root metadata cache.
+    ROOT_METADATA.invalidate()
+    manager.create_sprint(1, "a", config=config)
+
+    sprint = measure(syn, 'create_sprint cached',
+                     lambda: manager.create_sprint(1, "b", config=config))
+
+    assert sprint.annotations['sprintNumber'] == ["1b"]
+    assert cache.hits > 0
+
+
+def test_get_sprints(world):
+    syn, config = world
+    manager.create_rally(1, config=config)
+    for letter in "abcdefghij":
+        manager.create_sprint(1, letter, config=config)
+
+    sprints = measure(syn, 'get_sprints 10', lambda: manager.get_sprints(
+        config['root_project_id'], rally_number=1))
+
+    assert sorted(sprints.sprintNumber) == [f"1{letter}"
+                                            for letter in "abcdefghij"]
+
+
+def test_export_sprints(world):
+    syn, config = world
+    manager.create_rally(1, config=config)
+    for letter in "abc":
+        manager.create_sprint(1, letter, config=config)
+    output = io.StringIO()
+
+    count = measure(syn, 'export_sprints 3', lambda: manager.export_sprints(
+        config['root_project_id'], output, output_format='jsonl',
+        rally_number=1, columns=["id", "sprintNumber", "rally"]))
+
+    assert count == 3
+    assert [json.loads(line)['sprintNumber'] for line in
+            output.getvalue().splitlines()] == ["1a", "1b", "1c"]
+
+
+def test_report(world):
+    syn, config = world
+    sprints = {}
+    for rally_number, letter in [(1, "a"), (1, "b"), (1, "c"), (2, "a")]:
+        manager.create_rally(rally_number, config=config)
+        sprints[f"{rally_number}{letter}"] = manager.create_sprint(
+            rally_number, letter, config=config)
+    for sprint_number, sizes in [("1a", [10, 20]), ("1c", [5]), ("2a", [7])]:
+        for index, size in enumerate(sizes):
+            syn.create(synapseclient.File(
+                name=f"data{index}.csv", parent=sprints[sprint_number],
+                dataFileSizeBytes=size,
+                modifiedOn=1546300800000 + index * 60000))
+
+    usage = measure(syn, 'report 3', lambda: manager.get_usage(
+        config['root_project_id'], config['allFilesSchemaId'],
+        rally_number=1))
+
+    assert len(usage) == 3
+
+
+@pytest.mark.parametrize("size", [1, 4, 16])
+def test_provision(world, size):
+    syn, config = world
+    letters = "abcdefghijklmnopqrstuvwxyz"[:size]
+    manifest = dict(rallies=[dict(rally_number=1, sprint_letter=None,
+                                  title=None)],
+                    sprints=[dict(rally_number=1, sprint_letter=letter,
+                                  title=None) for letter in letters])
+
+    results = measure(syn, f'provision {size}',
+                      lambda: provision.provision(manifest, config=config))
+
+    assert [result['status'] for result in results] == ['ok'] * (size + 1)
+    assert len(manager.get_sprints(config['root_project_id'])) == size
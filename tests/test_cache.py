@@ -0,0 +1,65 @@
+"""Tests for the root project metadata cache.
+
+"""
+
+from kirallymanager.cache import LookupCache, RootMetadataCache
+
+
+class FakeEntity:
+    def __init__(self, etag, annotations):
+        self.etag = etag
+        self.annotations = annotations
+
+
+class FakeSynapse:
+    def __init__(self):
+        self.etag = "1"
+        self.calls = []
+
+    def get(self, entity_id):
+        self.calls.append(('get', entity_id))
+        return FakeEntity(self.etag, {'rallyTableId': ['syn1'],
+                                      'sprintTableId': ['syn2']})
+
+    def restGET(self, uri):
+        self.calls.append(('restGET', uri))
+        return {'etag': self.etag}
+
+
+def test_hit_within_ttl():
+    syn = FakeSynapse()
+    cache = RootMetadataCache(ttl=60)
+
+    assert cache.table_id(syn, "syn123", 'rallyTableId') == "syn1"
+    assert cache.table_id(syn, "syn123", 'sprintTableId') == "syn2"
+
+    assert syn.calls == [('get', "syn123")]
+    assert cache.stats() == dict(hits=1, misses=1)
+
+
+def test_revalidates_by_etag_after_ttl():
+    syn = FakeSynapse()
+    cache = RootMetadataCache(ttl=0)
+
+    cache.get(syn, "syn123")
+    cache.get(syn, "syn123")
+    assert syn.calls == [('get', "syn123"), ('restGET', "/entity/syn123")]
+    assert cache.stats() == dict(hits=1, misses=1)
+
+    syn.etag = "2"
+    cache.get(syn, "syn123")
+    assert syn.calls[-2:] == [('restGET', "/entity/syn123"), ('get', "syn123")]
+    assert cache.stats() == dict(hits=1, misses=2)
+
+
+def test_lookup_cache_loads_once():
+    cache = LookupCache()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return "value"
+
+    assert cache.get(('team', 1), loader) == "value"
+    assert cache.get(('team', 1), loader) == "value"
+    assert len(loads) == 1
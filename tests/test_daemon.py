@@ -0,0 +1,136 @@
+"""Tests for the command server on a Unix socket.
+
+"""
+
+import base64
+import logging
+import os
+import sys
+import threading
+
+import pytest
+
+from kirallymanager import daemon
+
+
+@pytest.fixture(name="server")
+def fixture_server(tmp_path):
+    commands = []
+
+    def run_command(argv):
+        commands.append((argv, os.getcwd()))
+        if argv[0] == "fail":
+            raise ValueError("no such sprint")
+        if argv[0] == "exit":
+            sys.exit(int(argv[1]))
+        print(" ".join(argv))
+        sys.stdout.buffer.write(b"\x00PAR1")
+        print("done", file=sys.stderr)
+
+    path = str(tmp_path / "rallymanager.sock")
+    server = daemon.CommandServer(run_command, path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield path, commands
+    server.shutdown()
+    server.server_close()
+
+
+def test_commands_are_forwarded(server, capfdbinary, tmp_path):
+    path, commands = server
+
+    assert daemon.forward(["get-sprints", "--rally_number", "1"], path=path,
+                          cwd=str(tmp_path)) == 0
+
+    assert commands == [(["get-sprints", "--rally_number", "1"],
+                         str(tmp_path))]
+    captured = capfdbinary.readouterr()
+    assert captured.out == b"get-sprints --rally_number 1\n\x00PAR1"
+    assert captured.err == b"done\n"
+    assert os.stat(path).st_mode & 0o077 == 0
+
+
+def test_exit_codes_and_errors_are_returned(server, capfdbinary):
+    path, _ = server
+
+    assert daemon.forward(["exit", "3"], path=path) == 3
+    assert daemon.forward(["fail"], path=path) == 1
+    assert b"ValueError: no such sprint" in capfdbinary.readouterr().err
+
+
+def test_log_messages_are_returned(tmp_path, capfd):
+    # The handler of logging.basicConfig() in the daemon's process.
+    root = logging.getLogger()
+    daemon_handler = logging.StreamHandler(sys.stderr)
+    root.addHandler(daemon_handler)
+    handlers = list(root.handlers)
+
+    def run_command(argv):
+        logging.getLogger("kirallymanager.manager").warning(
+            "Can't find team %r, creating it.", argv[0])
+
+    response = daemon.run_captured(run_command, ["ki Rally 1"], str(tmp_path))
+
+    assert "Can't find team 'ki Rally 1', creating it." in base64.b64decode(
+        response['stderr']).decode("utf-8")
+    assert "Can't find team" not in capfd.readouterr().err
+    assert root.handlers == handlers
+    root.removeHandler(daemon_handler)
+
+
+def test_no_daemon(tmp_path):
+    path = str(tmp_path / "rallymanager.sock")
+    assert daemon.forward(["get-rallies"], path=path) is None
+
+    # A socket left behind by a daemon that is gone.
+    server = daemon.CommandServer(lambda argv: None, path)
+    server.socket.close()
+    assert daemon.forward(["get-rallies"], path=path) is None
+
+    # It is replaced by a new daemon.
+    daemon.CommandServer(lambda argv: None, path).server_close()
+
+
+def test_running_daemon_is_not_replaced(server):
+    path, commands = server
+
+    with pytest.raises(OSError, match="already listening"):
+        daemon.CommandServer(lambda argv: None, path)
+
+    assert daemon.forward(["get-rallies"], path=path) == 0
+    assert len(commands) == 1
+
+
+def test_daemon_options_of_commands_are_rejected(cli, capsys):
+    run_command = cli['command_runner'](
+        cli['build_parser']().parse_args(["--session_ttl", "60", "serve"]))
+
+    for argv in (["--no_entity_cache", "get-rallies"],
+                 ["--entity_cache_path", "/tmp/entities.sqlite", "get-rallies"]): # pylint: disable=line-too-long
+        with pytest.raises(SystemExit) as exit_info:
+            run_command(argv)
+        assert exit_info.value.code == 2
+    assert "--entity_cache_path can only be set when the daemon starts" in capsys.readouterr().err # pylint: disable=line-too-long
+
+
+def test_command_pacing_is_restored(cli, world, monkeypatch):
+    from kirallymanager import manager # pylint: disable=import-outside-toplevel
+    from kirallymanager.scheduler import SCHEDULER # pylint: disable=import-outside-toplevel
+
+    _, config = world
+    rates = []
+    monkeypatch.setattr(manager, "export_rallies",
+                        lambda **kwargs: rates.append(SCHEDULER.rate))
+    monkeypatch.setattr(SCHEDULER, "rate", 5)
+    run_command = cli['command_runner'](
+        cli['build_parser']().parse_args(["--session_ttl", "60", "serve"]))
+
+    # The daemon's own value is not an error.
+    run_command(["--session_ttl", "60", "--max_requests_per_second", "2",
+                 "--root_project_id", config['root_project_id'],
+                 "get-rallies"])
+    run_command(["--root_project_id", config['root_project_id'],
+                 "get-rallies"])
+
+    assert rates == [2, 5]
+    assert SCHEDULER.rate == 5
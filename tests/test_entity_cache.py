@@ -0,0 +1,87 @@
+"""Tests for the on-disk entity cache.
+
+"""
+
+import pytest
+
+synapseclient = pytest.importorskip("synapseclient")
+
+# pylint: disable=wrong-import-position
+from fake_synapse import FakeSynapse
+
+from kirallymanager.entity_cache import EntityCache
+
+
+@pytest.fixture(name="syn")
+def fixture_syn():
+    syn = FakeSynapse()
+    syn.create(synapseclient.Project("ki Rallies", annotations=dict(
+        rallyTableId=["syn2"])), entity_id="syn1")
+    syn.reset_calls()
+    return syn
+
+
+def test_entities_are_shared_across_processes(syn, tmp_path):
+    path = str(tmp_path / "entities.sqlite")
+    EntityCache(syn, path=path).get("syn1")
+
+    project = EntityCache(syn, path=path).get("syn1", downloadFile=False)
+
+    assert syn.calls['get'] == 1
+    assert project.name == "ki Rallies"
+    assert project.annotations['rallyTableId'] == ["syn2"]
+    assert isinstance(project, synapseclient.Project)
+
+
+def test_stale_entities_are_revalidated_by_etag(syn, tmp_path):
+    cache = EntityCache(syn, path=str(tmp_path / "entities.sqlite"), ttl=0)
+    cache.get("syn1")
+
+    cache.get("syn1")
+    assert syn.calls['get'] == 1
+    assert syn.calls['restGET /entity/{id}'] == 1
+
+    project = syn.get("syn1")
+    project.annotations['rallyTableId'] = ["syn3"]
+    syn.store(project)
+    assert cache.get("syn1").annotations['rallyTableId'] == ["syn3"]
+
+
+def test_store_invalidates(syn, tmp_path):
+    cache = EntityCache(syn, path=str(tmp_path / "entities.sqlite"))
+    project = cache.get("syn1")
+    project.annotations['rallyTableId'] = ["syn3"]
+
+    cache.store(project)
+
+    assert cache.get("syn1").annotations['rallyTableId'] == ["syn3"]
+    assert syn.calls['get'] == 2
+
+
+def test_files_are_not_cached(syn, tmp_path):
+    syn.create(synapseclient.File(name="rally.md", parent="syn1"),
+               entity_id="syn5", content="# Rally")
+    cache = EntityCache(syn, path=str(tmp_path / "entities.sqlite"))
+
+    cache.get("syn5")
+    cache.get("syn5")
+
+    assert syn.calls['get'] == 2
+
+
+def test_least_recently_used_are_evicted(syn, tmp_path):
+    for entity_id in ("syn6", "syn7"):
+        syn.create(synapseclient.Project(f"project {entity_id}"),
+                   entity_id=entity_id)
+    cache = EntityCache(syn, path=str(tmp_path / "entities.sqlite"))
+    cache.get("syn1")
+    cache.get("syn6")
+    cache.max_bytes = 500
+    cache.get("syn1")
+
+    cache.get("syn7")
+    syn.reset_calls()
+    cache.get("syn1")
+    cache.get("syn6")
+
+    assert syn.calls['get'] == 1
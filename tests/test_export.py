@@ -0,0 +1,91 @@
+"""Tests for the streaming export of table queries.
+
+"""
+
+import io
+import json
+
+import pytest
+
+synapseclient = pytest.importorskip("synapseclient")
+
+# pylint: disable=wrong-import-position
+from kirallymanager.export import export_query, iter_pages
+
+
+class FakeResults:
+    """Rowset results that count how many rows were read."""
+
+    def __init__(self, rows):
+        self.headers = [
+            synapseclient.table.SelectColumn(name="id", columnType="ENTITYID"),
+            synapseclient.table.SelectColumn(name="rally", columnType="INTEGER"),
+            synapseclient.table.SelectColumn(name="tags",
+                                             columnType="STRING_LIST")]
+        self.rows = rows
+        self.read = 0
+
+    def __iter__(self):
+        for values in self.rows:
+            self.read += 1
+            yield {'values': values}
+
+
+class FakeSynapse:
+    def __init__(self, rows):
+        self.results = FakeResults(rows)
+
+    def tableQuery(self, query, resultsAs):
+        assert resultsAs == "rowset"
+        return self.results
+
+
+ROWS = [["syn1", "1", '["a", "b"]'], ["syn2", "2", None], ["syn3", "2", "[]"]]
+
+
+def test_pages_are_read_lazily():
+    results = FakeResults(ROWS)
+    pages = iter_pages(results, page_size=2)
+
+    assert next(pages) == ROWS[:2]
+    assert results.read == 2
+    assert list(pages) == [ROWS[2:]]
+
+
+def test_export_csv():
+    output = io.StringIO()
+
+    assert export_query(FakeSynapse(ROWS), "select * from syn9", output) == 3
+    assert output.getvalue().splitlines() == [
+        'id,rally,tags', 'syn1,1,"[""a"", ""b""]"', 'syn2,2,', 'syn3,2,[]']
+
+
+def test_export_jsonl():
+    output = io.StringIO()
+
+    export_query(FakeSynapse(ROWS), "select * from syn9", output,
+                 output_format='jsonl', page_size=2)
+
+    assert [json.loads(line) for line in output.getvalue().splitlines()] == [
+        dict(id="syn1", rally=1, tags=["a", "b"]),
+        dict(id="syn2", rally=2, tags=None),
+        dict(id="syn3", rally=2, tags=[])]
+
+
+def test_export_parquet():
+    parquet = pytest.importorskip("pyarrow.parquet")
+    output = io.BytesIO()
+
+    export_query(FakeSynapse(ROWS), "select * from syn9", output,
+                 output_format='parquet', page_size=2)
+
+    parquet_file = parquet.ParquetFile(io.BytesIO(output.getvalue()))
+    assert parquet_file.num_row_groups == 2
+    assert parquet_file.read().to_pylist()[0] == dict(id="syn1", rally=1,
+                                                      tags=["a", "b"])
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        export_query(FakeSynapse(ROWS), "select * from syn9", io.StringIO(),
+                     output_format='xlsx')
@@ -0,0 +1,107 @@
+"""Tests for folder hierarchy creation.
+
+"""
+
+import json
+
+import pytest
+
+pytest.importorskip("synapseclient")
+
+# pylint: disable=wrong-import-position
+from fake_synapse import http_error
+
+from kirallymanager import folders
+
+
+class FakeSynapse:
+    def __init__(self, children):
+        self.children = children
+        self.listed = []
+        self.stored = []
+
+    def getChildren(self, parent, includeTypes):
+        self.listed.append(parent)
+        return [dict(name=name, id=child_id)
+                for name, child_id in self.children.get(parent, {}).items()]
+
+    def store(self, folder):
+        self.stored.append((folder.parentId, folder.name))
+        folder.id = f"syn-{folder.name}"
+        return folder
+
+    def restPOST(self, uri, body):
+        assert uri == "/entity/child"
+        body = json.loads(body)
+        self.listed.append((body['parentId'], body['entityName']))
+        child_id = self.children.get(body['parentId'], {}).get(body['entityName']) # pylint: disable=line-too-long
+        if child_id is None:
+            raise http_error(404, "Entity not found")
+        return dict(id=child_id)
+
+
+def test_plan_folder_tree():
+    folder_list = [[".", ["Timeline", "Data"], []],
+                   ["./Data", ["Auxiliary"], []],
+                   ["./Results/2019", ["Q1"], []]]
+
+    assert folders.plan_folder_tree(folder_list) == [
+        ["./Data", "./Results", "./Timeline"],
+        ["./Data/Auxiliary", "./Results/2019"],
+        ["./Results/2019/Q1"]]
+
+
+def test_only_missing_folders_are_created():
+    syn = FakeSynapse({'syn1': {'Data': 'syn2'}, 'syn2': {'Auxiliary': 'syn3'}})
+
+    folder_ids = folders.create_folder_tree(
+        syn, "syn1", [[".", ["Timeline", "Data"], []],
+                      ["./Data", ["Auxiliary", "Documentation"], []]])
+
+    assert folder_ids == {'.': 'syn1', './Data': 'syn2',
+                          './Data/Auxiliary': 'syn3',
+                          './Data/Documentation': 'syn-Documentation',
+                          './Timeline': 'syn-Timeline'}
+    assert syn.listed == ['syn1', 'syn2']
+    assert sorted(syn.stored) == [('syn1', 'Timeline'),
+                                  ('syn2', 'Documentation')]
+
+
+DERIVED_FOLDERS = [[".", ["Rally-01"], []],
+                   ["./Rally-01", ["Sprint-a"], []],
+                   ["./Rally-01/Sprint-a", ["analysis", "adam"], []]]
+
+
+def test_folders_are_resolved_by_path():
+    syn = FakeSynapse({'syn1': {f'Rally-{n:02}': f'syn{n}00' for n in range(1, 99)}}) # pylint: disable=line-too-long
+    paths = folders.FolderPaths()
+
+    folder_ids = folders.resolve_folder_tree(syn, "syn1", DERIVED_FOLDERS,
+                                             paths=paths)
+
+    assert folder_ids == {'.': 'syn1', './Rally-01': 'syn100',
+                          './Rally-01/Sprint-a': 'syn-Sprint-a',
+                          './Rally-01/Sprint-a/adam': 'syn-adam',
+                          './Rally-01/Sprint-a/analysis': 'syn-analysis'}
+    # Children of a new folder are created without looking them up.
+    assert syn.listed == [('syn1', 'Rally-01'), ('syn100', 'Sprint-a')]
+    assert sorted(syn.stored) == [('syn-Sprint-a', 'adam'),
+                                  ('syn-Sprint-a', 'analysis'),
+                                  ('syn100', 'Sprint-a')]
+
+    syn.listed = []
+    folder_ids = folders.resolve_folder_tree(
+        syn, "syn1", [[".", ["Rally-01"], []],
+                      ["./Rally-01", ["Sprint-b"], []]], paths=paths)
+    assert syn.listed == [('syn100', 'Sprint-b')]
+
+
+def test_missing_folders_are_left_out_without_create():
+    syn = FakeSynapse({'syn1': {'Rally-01': 'syn100'}})
+
+    folder_ids = folders.resolve_folder_tree(syn, "syn1", DERIVED_FOLDERS,
+                                             create=False,
+                                             paths=folders.FolderPaths())
+
+    assert folder_ids == {'.': 'syn1', './Rally-01': 'syn100'}
+    assert syn.stored == []
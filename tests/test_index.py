@@ -0,0 +1,59 @@
+"""Tests for the rally and sprint project index.
+
+"""
+
+import pytest
+
+from kirallymanager.index import RallyIndex
+
+
+class FakeEntity:
+    etag = "1"
+    annotations = {'rallyTableId': ['syn1'], 'sprintTableId': ['syn2']}
+
+
+class FakeSynapse:
+    def __init__(self):
+        self.queries = []
+        self.rows = {'syn1': [["syn10", "1", "100"], ["syn11", "2", "200"]],
+                     'syn2': [["syn20", "1A"], ["syn21", "1B"], ["syn22", "1B"]]}
+
+    def get(self, entity_id):
+        return FakeEntity()
+
+    def tableQuery(self, query, resultsAs):
+        self.queries.append(query)
+        table_id = query.split()[-1]
+        return [{'values': values} for values in self.rows[table_id]]
+
+
+def test_views_are_queried_once():
+    syn = FakeSynapse()
+    index = RallyIndex(syn, "syn-index-root")
+
+    assert index.rally(1) == dict(id="syn10", rally="1", rallyTeam="100")
+    assert index.rally(3) is None
+    assert index.sprint(1, "A")['id'] == "syn20"
+    assert index.sprint(1, "C") is None
+
+    assert syn.queries == ["select id, rally, rallyTeam from syn1",
+                           "select id, sprintNumber from syn2"]
+
+    with pytest.raises(ValueError):
+        index.sprint(1, "B")
+
+
+def test_created_projects_are_visible():
+    syn = FakeSynapse()
+    index = RallyIndex(syn, "syn-index-root")
+
+    assert index.rally(3) is None
+
+    index.add_rally(3, "syn12", 300)
+    index.add_sprint("3A", "syn23")
+    index.refresh()
+
+    assert index.rally(3)['id'] == "syn12"
+    assert index.sprint(3, "A")['id'] == "syn23"
+    assert index.sprint(1, "A")['id'] == "syn20"
+    assert len(syn.queries) == 2
@@ -0,0 +1,111 @@
+"""Tests for the journal of completed steps.
+
+"""
+
+import threading
+
+from kirallymanager.journal import Journal
+
+
+def test_completed_steps_are_skipped(tmp_path):
+    path = str(tmp_path / "journal.sqlite")
+    calls = []
+
+    def create_team():
+        calls.append('team')
+        return '3400001'
+
+    def fail():
+        raise RuntimeError("timeout")
+
+    journal = Journal(path)
+    assert journal.run('sprint 1a', 'team', create_team) == '3400001'
+    try:
+        journal.run('sprint 1a', 'folders', fail)
+    except RuntimeError:
+        pass
+    journal.close()
+
+    journal = Journal(path)
+    assert journal.run('sprint 1a', 'team', create_team) == '3400001'
+    assert journal.run('sprint 1a', 'folders',
+                       lambda: {'./a': 'syn2'}) == {'./a': 'syn2'}
+    assert calls == ['team']
+    assert journal.steps('sprint 1a') == {'team': '3400001',
+                                          'folders': {'./a': 'syn2'}}
+    assert journal.get('sprint 1b', 'team') == (False, None)
+
+
+def test_clear_and_concurrent_records():
+    journal = Journal(":memory:")
+
+    threads = [threading.Thread(target=journal.record,
+                                args=('sprint 1a', f"post {i}", i))
+               for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(journal.steps('sprint 1a')) == 20
+    journal.clear('sprint 1a')
+    assert journal.steps('sprint 1a') == {}
+
+
+def test_interrupted_sprint_is_resumed(world, monkeypatch, tmp_path):
+    import synapseclient # pylint: disable=import-outside-toplevel
+    from fake_synapse import http_error # pylint: disable=import-outside-toplevel
+
+    from kirallymanager import manager # pylint: disable=import-outside-toplevel
+
+    syn, config = world
+    manager.create_rally(1, config=config)
+    journal = Journal(str(tmp_path / "journal.sqlite"))
+    key = f"{config['root_project_id']} sprint 1a"
+    rest_get, store = syn.restGET, syn.store
+    stored = []
+
+    def restGET(uri, **kwargs): # pylint: disable=invalid-name
+        if uri.endswith("/forum"):
+            raise http_error(500, "Internal server error")
+        return rest_get(uri, **kwargs)
+
+    def record_store(obj, *args, **kwargs):
+        stored.append(type(obj))
+        return store(obj, *args, **kwargs)
+
+    monkeypatch.setattr(syn, "restGET", restGET)
+    try:
+        manager.create_sprint(1, "a", config=config, journal=journal)
+    except synapseclient.core.exceptions.SynapseHTTPError:
+        pass
+    assert {'project', 'team', 'wiki', 'folders'} <= set(journal.steps(key))
+
+    monkeypatch.setattr(syn, "restGET", rest_get)
+    monkeypatch.setattr(syn, "store", record_store)
+    sprint = manager.create_sprint(1, "a", config=config, journal=journal)
+
+    assert synapseclient.Project not in stored
+    assert synapseclient.Team not in stored
+    assert [record['properties']['id'] for record in syn.entities.values()
+            if record['properties']['name'] == "ki Sprint 1a"] == [sprint.id]
+    assert len([team for team in syn.teams.values()
+                if team['name'].startswith("ki Sprint 1a")]) == 3
+    # A complete sprint leaves nothing in the journal.
+    assert journal.steps(key) == {}
+
+
+def test_journal_keys_include_the_root_project(world, tmp_path):
+    from kirallymanager import manager # pylint: disable=import-outside-toplevel
+
+    _, config = world
+    manager.create_rally(1, config=config)
+    journal = Journal(str(tmp_path / "journal.sqlite"))
+    # Steps of a sprint of the same number under another root project.
+    journal.record("syn1 sprint 1a", 'project', "syn2")
+    journal.record("syn1 sprint 1a", 'team', "3400001")
+
+    sprint = manager.create_sprint(1, "a", config=config, journal=journal)
+
+    assert sprint.id != "syn2"
+    assert manager.find_team("ki Sprint 1a").id != "3400001"
@@ -0,0 +1,90 @@
+"""Tests for the cached SSM parameter store.
+
+"""
+
+import pytest
+
+from kirallymanager.param_store import ParamStore
+
+
+class ParameterNotFound(Exception):
+    pass
+
+
+class StubPaginator:
+    def __init__(self, ssm):
+        self.ssm = ssm
+
+    def paginate(self, Path, **kwargs):  # pylint: disable=invalid-name,unused-argument
+        self.ssm.calls.append(('get_parameters_by_path', Path))
+        names = sorted(name for name in self.ssm.parameters
+                       if name.startswith(Path))
+        # Two parameters per page.
+        for start in range(0, len(names), 2):
+            yield {'Parameters': [{'Name': name,
+                                   'Value': self.ssm.parameters[name]}
+                                  for name in names[start:start + 2]]}
+
+
+class StubSSM:
+    class exceptions:  # pylint: disable=invalid-name
+        ParameterNotFound = ParameterNotFound
+
+    def __init__(self, parameters):
+        self.parameters = parameters
+        self.calls = []
+
+    def get_parameter(self, Name, WithDecryption):  # pylint: disable=invalid-name,unused-argument
+        self.calls.append(('get_parameter', Name))
+        if Name not in self.parameters:
+            raise ParameterNotFound(Name)
+        return {'Parameter': {'Name': Name, 'Value': self.parameters[Name]}}
+
+    def get_paginator(self, operation):
+        assert operation == 'get_parameters_by_path'
+        return StubPaginator(self)
+
+
+@pytest.fixture(name="ssm")
+def fixture_ssm(monkeypatch):
+    ssm = StubSSM({'/ki/prod/SYNAPSE_USERNAME': 'user',
+                   '/ki/prod/SYNAPSE_PASSWORD': 'secret',
+                   '/ki/prod/LOG_LEVEL': 'INFO',
+                   '/ki/test/SYNAPSE_USERNAME': 'test-user'})
+    monkeypatch.setenv('SERVICE_NAME', 'ki')
+    monkeypatch.setenv('SERVICE_STAGE', 'prod')
+    monkeypatch.delenv('SYNAPSE_USERNAME', raising=False)
+    monkeypatch.delenv('SYNAPSE_PASSWORD', raising=False)
+    monkeypatch.delenv('JWT_SECRET', raising=False)
+    monkeypatch.setattr(ParamStore, '_ssm_client', ssm)
+    ParamStore.clear_cache()
+    yield ssm
+    ParamStore.clear_cache()
+
+
+def test_values_and_misses_are_cached(ssm):
+    assert ParamStore.SYNAPSE_USERNAME() == 'user'
+    assert ParamStore.SYNAPSE_USERNAME() == 'user'
+    assert ParamStore.JWT_SECRET('default') == 'default'
+    assert ParamStore.JWT_SECRET('default') == 'default'
+
+    assert ssm.calls == [('get_parameter', '/ki/prod/SYNAPSE_USERNAME'),
+                         ('get_parameter', '/ki/prod/JWT_SECRET')]
+
+
+def test_prefetch_loads_the_service_path_at_once(ssm):
+    assert ParamStore.prefetch() == 3
+
+    assert ParamStore.SYNAPSE_USERNAME() == 'user'
+    assert ParamStore.SYNAPSE_PASSWORD() == 'secret'
+    assert ParamStore.JWT_SECRET() is None
+    assert ssm.calls == [('get_parameters_by_path', '/ki/prod/')]
+
+
+def test_expired_values_are_fetched_again(ssm, monkeypatch):
+    monkeypatch.setattr(ParamStore, 'CACHE_TTL', 0)
+
+    ParamStore.SYNAPSE_USERNAME()
+    ParamStore.SYNAPSE_USERNAME()
+
+    assert len(ssm.calls) == 2
@@ -0,0 +1,47 @@
+"""Tests for profiling of Synapse client calls.
+
+"""
+
+import json
+
+from kirallymanager.concurrency import run_concurrently
+from kirallymanager.profiling import Profiler, endpoint, step
+
+
+class FakeSynapse:
+    username = "user"
+
+    def restGET(self, uri):
+        return {'uri': uri}
+
+    def getTeam(self, name):
+        return {'name': name}
+
+
+def test_calls_are_tagged_with_their_step():
+    syn = Profiler(FakeSynapse())
+
+    assert syn.username == "user"
+    with step("teams"):
+        run_concurrently(syn.getTeam, ["a", "b", "c"], max_workers=3)
+    with step("acl"):
+        syn.restGET("/entity/syn123/benefactor")
+        syn.restGET("/entity/syn456/acl?x=1")
+    syn.restGET("/entity/syn123/acl")
+
+    rows = {(row['step'], row['endpoint']): row['count']
+            for row in syn.summary()}
+    assert rows == {('teams', 'getTeam'): 3,
+                    ('acl', 'restGET /entity/{id}/benefactor'): 1,
+                    ('acl', 'restGET /entity/{id}/acl'): 1,
+                    ('other', 'restGET /entity/{id}/acl'): 1}
+
+    steps = {row['step']: row['count'] for row in syn.summary(by=('step',))}
+    assert steps == {'teams': 3, 'acl': 2, 'other': 1}
+    assert set(json.loads(syn.to_json())) == {'steps', 'endpoints', 'calls'}
+    assert "restGET /entity/{id}/acl" in syn.report()
+
+
+def test_endpoint():
+    assert endpoint("restPOST", "/teamMembers/3345/1234") == "restPOST /teamMembers/{id}/{id}" # pylint: disable=line-too-long
+    assert endpoint("get", "syn123") == "get"
@@ -0,0 +1,82 @@
+"""Tests for batch provisioning from a manifest.
+
+"""
+
+import json
+
+import pytest
+
+pytest.importorskip("synapseclient")
+
+# pylint: disable=wrong-import-position
+from kirallymanager import manager, provision
+
+
+def test_load_csv_manifest(tmp_path):
+    path = tmp_path / "manifest.csv"
+    path.write_text("kind,rally_number,sprint_letter,title\n"
+                    "rally,1,,\n"
+                    " Sprint ,1,a,Kickoff\n"
+                    "sprint,1,b,\n")
+
+    assert provision.load_manifest(str(path)) == dict(
+        rallies=[dict(rally_number=1, sprint_letter=None, title=None)],
+        sprints=[dict(rally_number=1, sprint_letter="a", title="Kickoff"),
+                 dict(rally_number=1, sprint_letter="b", title=None)])
+
+
+def test_load_json_manifest(tmp_path):
+    path = tmp_path / "manifest.JSON"
+    path.write_text(json.dumps(dict(
+        rallies=[dict(rally_number="2", title="Growth")],
+        sprints=[dict(rally_number=2, sprint_letter="a")])))
+
+    assert provision.load_manifest(str(path)) == dict(
+        rallies=[dict(rally_number=2, sprint_letter=None, title="Growth")],
+        sprints=[dict(rally_number=2, sprint_letter="a", title=None)])
+
+
+def test_sprint_without_letter(tmp_path):
+    path = tmp_path / "manifest.csv"
+    path.write_text("kind,rally_number,sprint_letter,title\n"
+                    "sprint,3,,\n")
+
+    with pytest.raises(ValueError, match="rally 3 has no sprint letter"):
+        provision.load_manifest(str(path))
+
+
+def test_unknown_kind(tmp_path):
+    path = tmp_path / "manifest.csv"
+    path.write_text("kind,rally_number,sprint_letter,title\n"
+                    "task,1,a,\n")
+
+    with pytest.raises(ValueError, match="Unknown manifest item kind: 'task'"):
+        provision.load_manifest(str(path))
+
+
+def test_failed_rally_fails_its_sprints(world, monkeypatch):
+    _, config = world
+    create_rally = manager.create_rally
+
+    def failing_create_rally(**kwargs):
+        if kwargs['rally_number'] == 2:
+            raise RuntimeError("Synapse is down")
+        return create_rally(**kwargs)
+
+    monkeypatch.setattr(manager, "create_rally", failing_create_rally)
+    manifest = dict(
+        rallies=[dict(rally_number=number, sprint_letter=None, title=None)
+                 for number in (1, 2)],
+        sprints=[dict(rally_number=number, sprint_letter="a", title=None)
+                 for number in (1, 2)])
+
+    results = provision.provision(manifest, config=config)
+
+    assert [(result['kind'], result['rally_number'], result['status'])
+            for result in results] == [('rally', 1, 'ok'),
+                                       ('rally', 2, 'failed'),
+                                       ('sprint', 1, 'ok'),
+                                       ('sprint', 2, 'failed')]
+    assert results[1]['error'] == "Synapse is down"
+    assert "No rally 2" in results[3]['error']
+    assert list(manager.get_sprints(config['root_project_id']).sprintNumber) == ["1a"] # pylint: disable=line-too-long
@@ -2,6 +2,253 @@
 
 """
 
+import json
+
+import pytest
+
 
 def test_stub():
     pass
+
+
+def test_build_query():
+    pytest.importorskip("synapseclient")
+    from kirallymanager import manager # pylint: disable=import-outside-toplevel
+
+    assert manager.build_query("syn1") == "select * from syn1"
+    assert manager.build_query(
+        "syn1", columns=["id", "rally"],
+        where=["rally = 1", "consortium = 'a' or consortium = 'b'"]) == (
+            "select id, rally from syn1 where (rally = 1) and "
+            "(consortium = 'a' or consortium = 'b')")
+
+
+def test_compact_dtypes():
+    pytest.importorskip("synapseclient")
+    pandas = pytest.importorskip("pandas")
+    from kirallymanager import manager # pylint: disable=import-outside-toplevel
+
+    data_frame = manager.compact_dtypes(pandas.DataFrame(
+        dict(id=["syn1", "syn2", "syn3", "syn4"],
+             consortium=["Gates"] * 4, rally=[1, 1, 2, 2])))
+
+    assert str(data_frame.consortium.dtype) == "category"
+    assert str(data_frame.id.dtype) != "category"
+    assert data_frame.rally.dtype == "int64"
+
+
+def test_get_sprints_filters_on_the_server(world):
+    from kirallymanager import manager # pylint: disable=import-outside-toplevel
+
+    syn, config = world
+    for rally_number in (1, 2):
+        manager.create_rally(rally_number, config=config)
+        manager.create_sprint(rally_number, "a", config=config)
+    syn.reset_calls()
+
+    sprints = manager.get_sprints(config['root_project_id'], rally_number=2,
+                                  columns=["id", "sprintNumber", "consortium"])
+
+    assert list(sprints.columns) == ["id", "sprintNumber", "consortium"]
+    assert list(sprints.sprintNumber) == ["2a"]
+    assert syn.calls['tableQuery'] == 1
+
+
+def create_sprints(config, sprints):
+    from kirallymanager import manager # pylint: disable=import-outside-toplevel
+
+    projects = {}
+    for rally_number, letter in sprints:
+        if manager.get_rally(config['root_project_id'], rally_number) is None:
+            manager.create_rally(rally_number, config=config)
+        projects[f"{rally_number}{letter}"] = manager.create_sprint(
+            rally_number, letter, config=config)
+    return projects
+
+
+def test_broadcast_post(world):
+    from kirallymanager import manager # pylint: disable=import-outside-toplevel
+
+    syn, config = world
+    projects = create_sprints(config, [(1, "a"), (1, "b"), (2, "a")])
+    threads = {sprint_number: len(syn.threads[syn.forums[project.id]['id']])
+               for sprint_number, project in projects.items()}
+
+    results = manager.broadcast_post(config['root_project_id'], 1, "Demo",
+                                     "Demo on Friday.")
+
+    assert sorted((result['sprintNumber'], result['status'])
+                  for result in results) == [("1a", "ok"), ("1b", "ok")]
+    for sprint_number, project in projects.items():
+        forum_threads = syn.threads[syn.forums[project.id]['id']]
+        if sprint_number.startswith("1"):
+            assert len(forum_threads) == threads[sprint_number] + 1
+            assert forum_threads[-1]['title'] == "Demo"
+            assert f"`@ki Sprint {sprint_number}`" in forum_threads[-1]['messageMarkdown'] # pylint: disable=line-too-long
+        else:
+            assert len(forum_threads) == threads[sprint_number]
+
+
+def test_broadcast_post_failure(world, monkeypatch):
+    from kirallymanager import manager # pylint: disable=import-outside-toplevel
+
+    from fake_synapse import http_error # pylint: disable=import-outside-toplevel
+
+    syn, config = world
+    projects = create_sprints(config, [(1, "a"), (1, "b")])
+    failing_forum = f"/project/{projects['1a'].id}/forum"
+    rest_get = syn.restGET
+
+    def restGET(uri, **kwargs): # pylint: disable=invalid-name
+        if uri == failing_forum:
+            raise http_error(503, "Forum unavailable")
+        return rest_get(uri, **kwargs)
+
+    monkeypatch.setattr(syn, "restGET", restGET)
+
+    results = {result['sprintNumber']: result for result in
+               manager.broadcast_post(config['root_project_id'], 1, "Demo",
+                                      "Demo on Friday.")}
+
+    assert results['1a']['status'] == 'failed'
+    assert "Forum unavailable" in results['1a']['error']
+    assert results['1b']['status'] == 'ok'
+    forum_threads = syn.threads[syn.forums[projects['1b'].id]['id']]
+    assert forum_threads[-1]['id'] == results['1b']['threadId']
+
+
+def test_broadcast_command(world, cli, capsys, tmp_path, monkeypatch):
+    syn, config = world
+    projects = create_sprints(config, [(1, "a")])
+    message_file = tmp_path / "message.md"
+    message_file.write_text("Demo on Friday.")
+    args = cli['build_parser']().parse_args(
+        ["--root_project_id", config['root_project_id'], "broadcast", "1",
+         "--title", "Demo", "--message_file", str(message_file)])
+
+    args.func(args)
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "id,sprintNumber,forumId,threadId,status,error"
+    assert len(lines) == 2 and lines[1].startswith(f"{projects['1a'].id},1a,")
+    assert syn.threads[syn.forums[projects['1a'].id]['id']][-1]['messageMarkdown'].startswith("Demo on Friday.") # pylint: disable=line-too-long
+
+    def restPOST(uri, **kwargs): # pylint: disable=invalid-name,unused-argument
+        raise ValueError("Forum unavailable")
+
+    monkeypatch.setattr(syn, "restPOST", restPOST)
+    with pytest.raises(SystemExit) as exit_info:
+        args.func(args)
+    assert exit_info.value.code == 1
+
+
+def test_team_invites(world):
+    import synapseclient # pylint: disable=import-outside-toplevel
+    from kirallymanager import manager # pylint: disable=import-outside-toplevel
+
+    syn, _ = world
+    team = syn.store(synapseclient.Team(name="ki Sprint 1a"))
+    syn.team_members[team.id].append(101)
+    syn.invitations[team.id].append(dict(teamId=team.id, inviteeId="102"))
+
+    plan = manager.plan_team_invites(team.id, [101, 102, 103, "103", 104])
+
+    assert plan['invite'] == [103, 104]
+    assert plan['promote'] == [] and plan['acl'] is None
+
+    syn.reset_calls()
+    invites = manager.apply_team_invites(plan)
+
+    assert sorted(invite['inviteeId'] for invite in invites) == [103, 104]
+    assert syn.calls['restPOST /membershipInvitation'] == 2
+    assert syn.calls['restPUT /team/acl'] == 0
+
+
+def test_team_manager_promotions(world):
+    import synapseclient # pylint: disable=import-outside-toplevel
+    from kirallymanager import manager # pylint: disable=import-outside-toplevel
+
+    syn, _ = world
+    team = syn.store(synapseclient.Team(name="ki Sprint 1a"))
+    acl = syn.team_acls[team.id]
+    acl['resourceAccess'] += [
+        dict(principalId=102, accessType=manager.MANAGER_PERMISSIONS),
+        dict(principalId=103, accessType=['READ'])]
+    syn.invitations[team.id] += [dict(teamId=team.id, inviteeId=str(user))
+                                 for user in (102, 103)]
+
+    syn.reset_calls()
+    manager.bulk_invite_to_team(team.id, [102], manager=True)
+
+    # An invited manager needs neither an invitation nor a promotion.
+    assert syn.calls['restPOST /membershipInvitation'] == 0
+    assert syn.calls['restPUT /team/acl'] == 0
+
+    syn.reset_calls()
+    manager.bulk_invite_to_team(team.id, [102, 103, 104, 105, 104],
+                                manager=True)
+
+    assert syn.calls['restPOST /membershipInvitation'] == 2
+    assert syn.calls['restPUT /team/acl'] == 1
+    access = {int(entry['principalId']): set(entry['accessType'])
+              for entry in syn.team_acls[team.id]['resourceAccess']}
+    for user in (102, 104, 105):
+        assert access[user] == set(manager.MANAGER_PERMISSIONS)
+    assert access[103] == {'READ'} | set(manager.MANAGER_PERMISSIONS)
+
+
+def create_files(syn, projects, sizes):
+    """Create files of the given sizes in sprints, a minute apart."""
+    import synapseclient # pylint: disable=import-outside-toplevel
+
+    for sprint_number, file_sizes in sizes.items():
+        for index, size in enumerate(file_sizes):
+            syn.create(synapseclient.File(
+                name=f"data{index}.csv", parent=projects[sprint_number],
+                dataFileSizeBytes=size,
+                modifiedOn=1546300800000 + index * 60000))
+
+
+def test_get_usage(world):
+    from kirallymanager import manager # pylint: disable=import-outside-toplevel
+
+    syn, config = world
+    projects = create_sprints(config, [(1, "a"), (1, "b"), (1, "c"),
+                                       (2, "a")])
+    create_files(syn, projects, {"1a": [10, 20], "1c": [5], "2a": [7]})
+
+    usage = manager.get_usage(config['root_project_id'],
+                              config['allFilesSchemaId'], rally_number=1)
+
+    assert list(usage.sprintNumber) == ["1a", "1b", "1c"]
+    assert list(usage.fileCount) == [2, 0, 1]
+    assert list(usage.totalBytes) == [30, 0, 5]
+    assert str(usage.lastModifiedOn[0]) == "2019-01-01 00:01:00+00:00"
+
+    rallies = manager.get_usage(config['root_project_id'],
+                                config['allFilesSchemaId'], by='rally')
+
+    assert rallies[['rally', 'sprintCount', 'fileCount', 'totalBytes']].to_dict('records') == [ # pylint: disable=line-too-long
+        dict(rally=1, sprintCount=3, fileCount=3, totalBytes=35),
+        dict(rally=2, sprintCount=1, fileCount=1, totalBytes=7)]
+
+
+def test_report_command(world, cli, capsys, tmp_path):
+    syn, config = world
+    projects = create_sprints(config, [(1, "a"), (2, "a")])
+    create_files(syn, projects, {"1a": [10, 20], "2a": [7]})
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps(config))
+    args = cli['build_parser']().parse_args(
+        ["--config", str(config_file), "report", "--by", "rally",
+         "--format", "json"])
+
+    args.func(args)
+
+    rallies = json.loads(capsys.readouterr().out)
+    assert [{key: rally[key] for key in ['rally', 'sprintCount', 'fileCount',
+                                         'totalBytes']}
+            for rally in rallies] == [
+                dict(rally=1, sprintCount=1, fileCount=2, totalBytes=30),
+                dict(rally=2, sprintCount=1, fileCount=1, totalBytes=7)]
+    assert rallies[0]['lastModifiedOn'].startswith("2019-01-01T00:01:00")
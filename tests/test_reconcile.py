@@ -0,0 +1,162 @@
+"""Tests for planning and reconciling sprints against a fake Synapse.
+
+"""
+
+import copy
+
+import pytest
+
+from kirallymanager import configuration, manager, reconcile
+from kirallymanager.cache import ROOT_METADATA
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def sprint(world):
+    """A rally with one freshly created sprint."""
+    syn, config = world
+    manager.create_rally(1, config=config)
+    project = manager.create_sprint(1, "a", config=config)
+    ROOT_METADATA.invalidate()
+    return syn, config, project
+
+
+def state(syn):
+    """Everything a reconcile could write in the fake Synapse."""
+    return copy.deepcopy((syn.entities, syn.acls, syn.teams,
+                          dict(syn.team_members), dict(syn.invitations),
+                          syn.team_acls, syn.wikis, dict(syn.threads)))
+
+
+def team_id(syn, name):
+    return next(team_id for team_id, team in syn.teams.items()
+                if team['name'] == name)
+
+
+def child_id(syn, parent_id, name):
+    return next(entity_id for entity_id, record in syn.entities.items()
+                if record['properties'].get('parentId') == parent_id and
+                record['properties']['name'] == name)
+
+
+def check_reconcile(syn, config, steps):
+    """Check the planned steps, that a dry run writes nothing, and that
+    applying them leaves nothing to do."""
+    before = state(syn)
+    operations = reconcile.reconcile_sprint(1, "a", config=config,
+                                            dry_run=True)
+
+    assert [operation.step for operation in operations] == steps
+    assert state(syn) == before
+
+    reconcile.reconcile_sprint(1, "a", config=config)
+
+    assert reconcile.plan_sprint(1, "a", config=config) == []
+    return operations
+
+
+def test_up_to_date_sprint_has_no_operations(sprint):
+    syn, config, _ = sprint
+    before = state(syn)
+
+    assert reconcile.reconcile_sprint(1, "a", config=config) == []
+    assert state(syn) == before
+
+
+def test_missing_sprint_is_created(world):
+    syn, config = world
+    manager.create_rally(1, config=config)
+
+    check_reconcile(syn, config, ['project'])
+
+
+def test_missing_team(sprint):
+    syn, config, _ = sprint
+    del syn.teams[team_id(syn, "ki Sprint 1a Data Users")]
+    manager.TEAMS.clear()
+
+    check_reconcile(syn, config, ['teams', 'acl', 'derived data'])
+
+    assert any(team['name'] == "ki Sprint 1a Data Users"
+               for team in syn.teams.values())
+
+
+def test_removed_project_acl_entry(sprint):
+    syn, config, project = sprint
+    admin_team_id = int(config['rally_admin_team_id'])
+    acl = syn.acls[project.id]
+    acl['resourceAccess'] = [entry for entry in acl['resourceAccess']
+                             if int(entry['principalId']) != admin_team_id]
+
+    check_reconcile(syn, config, ['acl'])
+
+    assert any(int(entry['principalId']) == admin_team_id
+               for entry in syn.acls[project.id]['resourceAccess'])
+
+
+def test_deleted_sprint_folder(sprint):
+    syn, config, project = sprint
+    del syn.entities[child_id(syn, project.id, "Timeline")]
+
+    check_reconcile(syn, config, ['folders'])
+
+    assert child_id(syn, project.id, "Timeline")
+
+
+def test_missing_derived_data_grants(sprint):
+    syn, config, project = sprint
+    data_team_id = int(team_id(syn, "ki Sprint 1a Data Users"))
+    for entity_id, acl in syn.acls.items():
+        if entity_id != project.id:
+            acl['resourceAccess'] = [
+                entry for entry in acl['resourceAccess']
+                if int(entry['principalId']) != data_team_id]
+
+    entities = set(syn.entities)
+
+    operations = check_reconcile(syn, config, ['derived data'])
+
+    # The folders exist, so they are only granted on, not created.
+    assert operations[0].description.startswith("Grant")
+    assert set(syn.entities) == entities
+
+
+def test_missing_forum_post(sprint):
+    syn, config, project = sprint
+    forum_id = syn.forums[project.id]['id']
+    syn.threads[forum_id] = []
+
+    check_reconcile(syn, config, ['posts'])
+
+    assert [thread['title'] for thread in syn.threads[forum_id]] == [
+        post['title'] for post in config['posts']]
+
+
+def test_missing_view_scope(sprint):
+    syn, config, project = sprint
+    # The sprint view is where sprints are found, so the all files view
+    # is the one left incomplete.
+    view = syn.entities[config['allFilesSchemaId']]['properties']
+    view['scopeIds'] = [scope_id for scope_id in view['scopeIds']
+                        if f"syn{scope_id}" != project.id]
+
+    check_reconcile(syn, config, ['views'])
+
+    view = syn.entities[config['allFilesSchemaId']]['properties']
+    assert project.id.replace("syn", "") in view['scopeIds']
+
+
+def test_config_without_derived_data_project(world, monkeypatch):
+    syn, config = world
+    manager.create_rally(1, config=config)
+    # Configurations from before the derived data project was configurable.
+    old_config = dict(config)
+    derived_data_project_id = old_config.pop('derivedDataProjectId')
+    monkeypatch.setitem(configuration.DEFAULT_CONFIG, 'derivedDataProjectId',
+                        derived_data_project_id)
+
+    manager.create_sprint(1, "a", config=old_config)
+
+    assert child_id(syn, derived_data_project_id, "Rally-01")
+    assert reconcile.plan_sprint(1, "a", config=old_config) == []
@@ -0,0 +1,40 @@
+"""Tests for the REST helpers.
+
+"""
+
+from kirallymanager.rest import NOT_FOUND, get_paginated, http_status
+
+
+class FakeSynapse:
+    def __init__(self, total):
+        self.total = total
+        self.uris = []
+
+    def restGET(self, uri):
+        self.uris.append(uri)
+        offset = int(uri.split("offset=")[1])
+        limit = int(uri.split("limit=")[1].split("&")[0])
+        return {'results': list(range(offset, min(offset + limit, self.total))),
+                'totalNumberOfResults': self.total}
+
+
+def test_get_paginated_reads_every_page():
+    syn = FakeSynapse(total=5)
+
+    assert list(get_paginated(syn, "/teamMembers/1", limit=2)) == [0, 1, 2, 3, 4]
+    assert syn.uris == ["/teamMembers/1?limit=2&offset=0",
+                        "/teamMembers/1?limit=2&offset=2",
+                        "/teamMembers/1?limit=2&offset=4"]
+
+
+class Response:
+    status_code = NOT_FOUND
+
+
+class HTTPError(Exception):
+    response = Response()
+
+
+def test_http_status():
+    assert http_status(HTTPError()) == NOT_FOUND
+    assert http_status(ValueError()) is None
@@ -0,0 +1,134 @@
+"""Tests for the pacing and retrying of Synapse requests.
+
+"""
+
+import pytest
+
+from kirallymanager.scheduler import Scheduler, TokenBucket
+
+
+class FakeClock:
+    """A clock that only moves when something sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"{status_code} error")
+        self.response = Response(status_code, headers)
+
+
+def flaky(*errors):
+    """A request that raises the given errors, then succeeds."""
+    errors = list(errors)
+
+    def request():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    return request
+
+
+def scheduler(clock, **kwargs):
+    return Scheduler(rate=None, clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_token_bucket_paces_requests():
+    clock = FakeClock()
+    bucket = TokenBucket(2, burst=2, clock=clock, sleep=clock.sleep)
+
+    for _ in range(6):
+        bucket.acquire()
+
+    # Two requests in the burst, then one every half second.
+    assert clock.now == pytest.approx(2.0)
+
+
+def test_throttled_request_is_retried_after_retry_after():
+    clock = FakeClock()
+    requests = scheduler(clock, max_concurrency=8)
+
+    assert requests.run(flaky(HTTPError(429, {'Retry-After': "3"}))) == "ok"
+
+    assert clock.sleeps == [3.0]
+    counters = requests.counters()
+    assert counters['requests'] == 2
+    assert counters['throttled'] == 1
+    assert counters['retries'] == 1
+    assert counters['limit'] == 4
+
+
+def test_backoff_is_jittered_and_bounded():
+    clock = FakeClock()
+    requests = scheduler(clock, base_delay=1.0, max_delay=3.0)
+
+    requests.run(flaky(*[HTTPError(503) for _ in range(4)]))
+
+    assert len(clock.sleeps) == 4
+    assert all(0 <= delay <= bound for delay, bound
+               in zip(clock.sleeps, [2.0, 3.0, 3.0, 3.0]))
+
+
+def test_limit_is_halved_once_per_cooldown_and_recovers():
+    clock = FakeClock()
+    requests = scheduler(clock, max_concurrency=8, cooldown=10.0)
+
+    requests.run(flaky(HTTPError(429, {'Retry-After': "1"}),
+                       HTTPError(429, {'Retry-After': "1"})))
+    assert requests.limit == 4
+
+    for _ in range(30):
+        requests.run(lambda: None)
+    assert requests.limit == 8
+
+
+def test_other_errors_are_not_retried():
+    clock = FakeClock()
+    requests = scheduler(clock)
+
+    with pytest.raises(HTTPError):
+        requests.run(flaky(HTTPError(404)))
+
+    assert requests.counters()['retries'] == 0
+    assert requests.limit == requests.max_concurrency
+
+
+def test_retry_budget_is_shared():
+    clock = FakeClock()
+    requests = scheduler(clock, retry_budget=3, budget_refill=0)
+
+    assert requests.run(flaky(HTTPError(429), HTTPError(429))) == "ok"
+    with pytest.raises(HTTPError):
+        requests.run(flaky(HTTPError(429), HTTPError(429)))
+
+    counters = requests.counters()
+    assert counters['retries'] == 3
+    assert counters['exhausted'] == 1
+    assert counters['budget'] == 0
+
+
+def test_retry_policy_leaves_throttling_to_the_scheduler():
+    pytest.importorskip("synapseclient")
+    policy = Scheduler().retry_policy({'retries': 2})
+
+    assert policy['retries'] == 2
+    assert 429 not in policy['retry_status_codes']
+    assert 503 not in policy['retry_status_codes']
+    assert 502 in policy['retry_status_codes']
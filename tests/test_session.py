@@ -0,0 +1,119 @@
+"""Tests for the Synapse session cache.
+
+"""
+
+import os
+import stat
+import time
+
+import pytest
+
+from kirallymanager.session import SessionCache
+
+
+def test_sessions_are_private_and_expire(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache" / "session.json")
+    sessions = SessionCache(path, ttl=60)
+
+    sessions.save("/home/a/.synapseConfig", "user", "authToken", "token")
+
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    session = SessionCache(path).load("/home/a/.synapseConfig")
+    assert (session['username'], session['kind'], session['secret']) == (
+        "user", "authToken", "token")
+    assert sessions.load("/home/b/.synapseConfig") is None
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert sessions.load("/home/a/.synapseConfig") is None
+
+
+def test_readable_cache_and_disabled_cache_are_ignored(tmp_path):
+    path = str(tmp_path / "session.json")
+    sessions = SessionCache(path, ttl=60)
+    sessions.save("key", "user", "apiKey", "c2VjcmV0")
+
+    os.chmod(path, 0o644)
+    assert sessions.load("key") is None
+
+    os.chmod(path, 0o600)
+    sessions.clear("key")
+    assert sessions.load("key") is None
+
+    sessions.ttl = 0
+    sessions.save("key", "user", "apiKey", "c2VjcmV0")
+    assert SessionCache(path, ttl=60).load("key") is None
+
+
+def test_rejected_session_logs_in_again(tmp_path, monkeypatch):
+    synapseclient = pytest.importorskip("synapseclient")
+    from synapseclient.core.credentials.cred_data import SynapseAuthTokenCredentials # pylint: disable=import-outside-toplevel
+    from kirallymanager import synapse # pylint: disable=import-outside-toplevel
+    from fake_synapse import http_error # pylint: disable=import-outside-toplevel
+
+    sessions = SessionCache(str(tmp_path / "session.json"))
+    config_path = str(tmp_path / ".synapseConfig")
+    sessions.save(config_path, "user", "authToken", "old")
+    monkeypatch.setattr(synapse, "SESSIONS", sessions)
+    monkeypatch.setattr(synapse.Synapse, "_synapse_client", None)
+
+    logins = []
+
+    def login(self, *args, **kwargs):
+        logins.append(args)
+        self.credentials = SynapseAuthTokenCredentials("new", "user")
+
+    def rest_call(self, method, uri, *args, **kwargs):
+        if self.credentials.secret == "old":
+            raise http_error(401, "expired")
+        return uri
+
+    monkeypatch.setattr(synapseclient.Synapse, "login", login)
+    monkeypatch.setattr(synapseclient.Synapse, "_rest_call", rest_call)
+
+    client = synapse.Synapse.client(configPath=config_path, skip_checks=True)
+    assert logins == []
+    assert client.credentials.secret == "old"
+
+    assert client._rest_call("get", "/entity/syn1", None, None, None, None, None) == "/entity/syn1" # pylint: disable=protected-access,line-too-long
+    assert len(logins) == 1
+    assert sessions.load(config_path)['secret'] == "new"
+
+
+def test_rejected_login_is_not_retried(tmp_path, monkeypatch):
+    synapseclient = pytest.importorskip("synapseclient")
+    from synapseclient.core.exceptions import SynapseHTTPError # pylint: disable=import-outside-toplevel
+    from kirallymanager import synapse # pylint: disable=import-outside-toplevel
+    from fake_synapse import http_error # pylint: disable=import-outside-toplevel
+
+    sessions = SessionCache(str(tmp_path / "session.json"))
+    config_path = str(tmp_path / ".synapseConfig")
+    sessions.save(config_path, "user", "authToken", "old")
+    monkeypatch.setattr(synapse, "SESSIONS", sessions)
+    monkeypatch.setattr(synapse.Synapse, "_synapse_client", None)
+    monkeypatch.setenv("SYNAPSE_USERNAME", "user")
+    monkeypatch.setenv("SYNAPSE_PASSWORD", "wrong")
+
+    logins = []
+    rest_calls = []
+
+    def login(self, *args, **kwargs):
+        logins.append(args)
+        # Like synapseclient, check the credentials with a REST call.
+        self._rest_call("get", "/userProfile", None, None, None, None, None) # pylint: disable=protected-access
+
+    def rest_call(self, method, uri, *args, **kwargs):
+        rest_calls.append(uri)
+        raise http_error(401, "invalid credentials")
+
+    monkeypatch.setattr(synapseclient.Synapse, "login", login)
+    monkeypatch.setattr(synapseclient.Synapse, "_rest_call", rest_call)
+
+    client = synapse.Synapse.client(configPath=config_path, skip_checks=True)
+    with pytest.raises(SynapseHTTPError):
+        client._rest_call("get", "/entity/syn1", None, None, None, None, None) # pylint: disable=protected-access,line-too-long
+
+    # The login from the configuration and the one with the password.
+    assert len(logins) == 2
+    assert rest_calls == ["/entity/syn1", "/userProfile", "/userProfile"]
+    assert sessions.load(config_path) is None
@@ -0,0 +1,46 @@
+"""Startup cost of the command line interface.
+
+Each subcommand's help is run in a fresh interpreter, which must not import
+the Synapse client or other heavy dependencies. Run with `pytest -s` to see
+the startup time of each subcommand.
+
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['boto3', 'pandas', 'synapseclient', 'kirallymanager.manager']
+
+SCRIPT = """
+import contextlib, io, json, runpy, sys, time
+start = time.perf_counter()
+sys.argv = ['rallymanager'] + sys.argv[1:]
+with contextlib.redirect_stdout(io.StringIO()):
+    try:
+        runpy.run_path('bin/rallymanager', run_name='__main__')
+    except SystemExit:
+        pass
+print(json.dumps(dict(seconds=time.perf_counter() - start,
+                      modules=sorted(name for name in %r
+                                     if name in sys.modules))))
+""" % (HEAVY_MODULES,)
+
+
+@pytest.mark.parametrize("subcommand", [
+    [], ['create-rally'], ['create-sprint'], ['provision'], ['broadcast'],
+    ['get-rallies'], ['get-sprints']])
+def test_help_does_not_import_heavy_modules(subcommand):
+    result = subprocess.run([sys.executable, "-c", SCRIPT] + subcommand + ["-h"],
+                            cwd=ROOT, check=True, stdout=subprocess.PIPE,
+                            env=dict(os.environ, PYTHONPATH=ROOT),
+                            universal_newlines=True)
+    startup = json.loads(result.stdout.strip().splitlines()[-1])
+
+    print(f"\n{' '.join(subcommand) or 'rallymanager'} -h: {startup['seconds']:.3f}s") # pylint: disable=line-too-long
+    assert startup['modules'] == []
@@ -0,0 +1,61 @@
+"""Tests for the team name index.
+
+"""
+
+import time
+
+from kirallymanager.teams import TeamIndex
+
+
+class FakeSynapse:
+    username = "service-account"
+
+    def __init__(self, teams):
+        self.teams = teams
+        self.uris = []
+
+    def restGET(self, uri):
+        self.uris.append(uri.split("?")[0])
+        if uri == "/userProfile":
+            return dict(ownerId="1000")
+        offset = int(uri.split("offset=")[1])
+        return dict(results=self.teams[offset:offset + 2],
+                    totalNumberOfResults=len(self.teams))
+
+
+TEAMS = [dict(id="1", name="ki Sprint 1a"), dict(id="2", name="ki Sprint 1b"),
+         dict(id="3", name="ki Sprint 1b Power Users")]
+
+
+def test_teams_are_listed_once(tmp_path):
+    syn = FakeSynapse(TEAMS)
+    index = TeamIndex(str(tmp_path / "teams.json"))
+
+    assert index.team_id(syn, "ki Sprint 1b Power Users") == "3"
+    assert index.team_id(syn, "ki Sprint 1b Data") is None
+    assert syn.uris == ["/userProfile", "/user/1000/team", "/user/1000/team"]
+
+
+def test_index_is_kept_on_disk(tmp_path):
+    path = str(tmp_path / "teams.json")
+    TeamIndex(path).team_id(FakeSynapse(TEAMS), "ki Sprint 1a")
+    TeamIndex(path).add(FakeSynapse(TEAMS), dict(id=4, name="ki Sprint 1c"))
+    syn = FakeSynapse([])
+
+    assert TeamIndex(path).team_id(syn, "ki Sprint 1a") == "1"
+    assert TeamIndex(path).team_id(syn, "ki Sprint 1c") == "4"
+    assert syn.uris == []
+
+
+def test_stale_index_is_listed_again(tmp_path):
+    path = str(tmp_path / "teams.json")
+    TeamIndex(path).team_id(FakeSynapse(TEAMS), "ki Sprint 1a")
+    syn = FakeSynapse(TEAMS[1:])
+
+    index = TeamIndex(path, ttl=0)
+    time.sleep(0.01)
+
+    assert index.team_id(syn, "ki Sprint 1a") is None
+    # The user ID is kept with the index.
+    assert syn.uris == ["/user/1000/team"]
+    assert index.team_id(syn, "ki Sprint 1b") == "2"
@@ -0,0 +1,159 @@
+"""Tests for view scope updates.
+
+"""
+
+import threading
+
+import pytest
+
+from kirallymanager.views import ViewRefresher, ViewScopeAccumulator
+
+
+class Properties:
+    def __init__(self, scope_ids):
+        self.scopeIds = scope_ids
+
+
+class FakeView:
+    def __init__(self, view_id, scope_ids, etag):
+        self.id = view_id
+        self.etag = etag
+        self.properties = Properties(list(scope_ids))
+
+
+class PreconditionFailed(Exception):
+    class response:  # pylint: disable=invalid-name
+        status_code = 412
+
+
+class FakeSynapse:
+    def __init__(self):
+        self.scopes = {'syn1': ['10'], 'syn2': ['10']}
+        self.etags = {'syn1': 0, 'syn2': 0}
+        self.stores = []
+        self.concurrent_edits = 0
+
+    def get(self, view_id):
+        return FakeView(view_id, self.scopes[view_id], self.etags[view_id])
+
+    def store(self, view):
+        if self.concurrent_edits:
+            self.concurrent_edits -= 1
+            self.scopes[view.id] = self.scopes[view.id] + ['99']
+            self.etags[view.id] += 1
+        if view.etag != self.etags[view.id]:
+            raise PreconditionFailed()
+        self.stores.append(view.id)
+        self.scopes[view.id] = view.properties.scopeIds
+        self.etags[view.id] += 1
+        return view
+
+
+def test_one_store_per_view():
+    syn = FakeSynapse()
+    views = ViewScopeAccumulator(syn)
+
+    views.add('syn1', ['syn11'])
+    views.add('syn1', ['syn12', 'syn11'])
+    views.add('syn2', ['syn10'])
+
+    assert views.apply() == {'syn1': ['syn11', 'syn12'], 'syn2': ['syn10']}
+    assert syn.stores == ['syn1']
+    assert sorted(syn.scopes['syn1']) == ['10', '11', '12']
+
+
+def test_etag_conflict_is_merged():
+    syn = FakeSynapse()
+    syn.concurrent_edits = 1
+    views = ViewScopeAccumulator(syn)
+
+    views.add('syn1', ['syn11'])
+    views.apply()
+
+    assert sorted(syn.scopes['syn1']) == ['10', '11', '99']
+
+
+def test_gives_up_after_max_attempts():
+    syn = FakeSynapse()
+    syn.concurrent_edits = 2
+    views = ViewScopeAccumulator(syn, max_attempts=2)
+
+    views.add('syn1', ['syn11'])
+    with pytest.raises(PreconditionFailed):
+        views.apply()
+
+
+class LaggingView:
+    def __init__(self, polls_until_visible):
+        self.polls = 0
+        self.polls_until_visible = polls_until_visible
+
+    def tableQuery(self, query, resultsAs):
+        self.polls += 1
+        if self.polls < self.polls_until_visible:
+            return []
+        return [{'values': ["syn11"]}]
+
+
+def test_refresher_polls_until_consistent():
+    syn = LaggingView(polls_until_visible=3)
+    refresher = ViewRefresher(syn, initial_delay=0.01)
+
+    refresher.watch('syn1', ['syn11'])
+
+    assert refresher.wait(timeout=5)
+    assert syn.polls == 3
+    assert refresher.consistency_seconds['syn1'] is not None
+
+
+def test_refresher_times_out():
+    syn = LaggingView(polls_until_visible=100)
+    refresher = ViewRefresher(syn, timeout=0.05, initial_delay=0.01)
+
+    refresher.watch('syn1', ['syn11'])
+
+    assert not refresher.wait()
+    assert refresher.consistency_seconds['syn1'] is None
+
+
+class BlockedView(LaggingView):
+    def __init__(self):
+        super().__init__(polls_until_visible=1)
+        self.release = threading.Event()
+
+    def tableQuery(self, query, resultsAs):
+        assert self.release.wait(timeout=5)
+        return super().tableQuery(query, resultsAs)
+
+
+def test_watch_and_refresh_do_not_block():
+    syn = BlockedView()
+    refresher = ViewRefresher(syn, initial_delay=0.01)
+
+    refresher.watch('syn1', ['syn11'])
+    refresher.refresh('syn2')
+
+    assert syn.polls == 0
+    assert not refresher.wait(timeout=0.05)
+    syn.release.set()
+    assert refresher.wait(timeout=5)
+    assert syn.polls == 2
+
+
+def test_create_sprint_views_become_consistent(world, monkeypatch):
+    from kirallymanager import manager  # pylint: disable=import-outside-toplevel
+
+    syn, config = world
+    manager.create_rally(1, config=config)
+    queries = []
+    table_query = syn.tableQuery
+    monkeypatch.setattr(syn, "tableQuery", lambda query, **kwargs: (
+        queries.append(query) or table_query(query, **kwargs)))
+    refresher = ViewRefresher(syn, timeout=5, initial_delay=0.01)
+
+    manager.create_sprint(1, "a", config=config, refresher=refresher)
+
+    assert refresher.wait()
+    assert config['allFilesSchemaId'] not in refresher.consistency_seconds
+    # The all files view is still prompted to update.
+    assert any(config['allFilesSchemaId'] in query for query in queries)
@@ -0,0 +1,55 @@
+"""Tests for wiki templates.
+
+"""
+
+from kirallymanager.wiki import TemplateCache, render_template
+
+
+def test_render_template_single_pass():
+    markdown = "Rally RALLY_ID: [team](#!Team:id=123) teamId=123 id=456 teamId=456"
+
+    rendered = render_template(markdown, {'RALLY_ID': "7",
+                                          'id=123': "id=1", 'teamId=123': "teamId=1",
+                                          'id=456': "id=2", 'teamId=456': "teamId=2"})
+
+    assert rendered == "Rally 7: [team](#!Team:id=1) teamId=1 id=2 teamId=2"
+
+
+def test_replacements_are_not_substituted_again():
+    assert render_template("A B", {'A': "B", 'B': "C"}) == "B C"
+
+
+class FakeTemplate:
+    def __init__(self, path, etag):
+        self.path = path
+        self.etag = etag
+
+
+class FakeSynapse:
+    def __init__(self, path):
+        self.path = path
+        self.etag = "1"
+        self.downloads = 0
+
+    def restGET(self, uri):
+        return {'etag': self.etag, 'versionNumber': 1}
+
+    def get(self, entity_id):
+        self.downloads += 1
+        return FakeTemplate(self.path, self.etag)
+
+
+def test_template_cache_revalidates_by_etag(tmp_path):
+    template_path = tmp_path / "template.md"
+    template_path.write_text("v1")
+    syn = FakeSynapse(str(template_path))
+    cache = TemplateCache(cache_dir=str(tmp_path / "cache"))
+
+    assert cache.markdown(syn, "syn1") == "v1"
+    assert cache.markdown(syn, "syn1") == "v1"
+    assert syn.downloads == 1
+
+    template_path.write_text("v2")
+    syn.etag = "2"
+    assert cache.markdown(syn, "syn1") == "v2"
+    assert syn.downloads == 2